@@ -1,7 +1,10 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from PIL import Image
+from typing import Optional
 import io
 import uvicorn
+from blobs import BlobNotFoundError, read_blob
 from model_utils import generate_raw_caption, load_model
 from gemini_utils import rewrite_caption_french_cloud
 
@@ -26,12 +29,23 @@ def health_check():
 
 
 @app.post("/caption")
-async def caption_image(file: UploadFile = File(...)):
-    if not file.content_type.startswith("image/"):
+async def caption_image(file: Optional[UploadFile] = File(None), blob_id: Optional[str] = Form(None)):
+    """Caption an uploaded image, or one stored in the shared blob store (`blob_id`)"""
+    if blob_id:
+        try:
+            content = await run_in_threadpool(read_blob, blob_id)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except BlobNotFoundError as e:
+            raise HTTPException(status_code=410, detail=str(e))
+    elif file is None:
+        raise HTTPException(status_code=400, detail="Provide the image 'file' or a 'blob_id'")
+    elif not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="File must be an image")
-    
-    try:
+    else:
         content = await file.read()
+
+    try:
         image = Image.open(io.BytesIO(content)).convert("RGB")
         
         # 1. Generate Raw Caption (English)
@@ -41,7 +55,7 @@ async def caption_image(file: UploadFile = File(...)):
         final_caption = rewrite_caption_french_cloud(raw_caption)
         
         return {
-            "filename": file.filename,
+            "filename": file.filename if file is not None else None,
             "raw_caption": raw_caption,
             "final_caption": final_caption
         }
@@ -0,0 +1,29 @@
+import os
+import re
+import tempfile
+
+# Image store shared with the chatbot (see vision_agent/backend/services/blob_store.py):
+# uploads are written once, keyed by SHA-256, and passed here by reference.
+# Services are deployed as separate directories, so each one ships this reader. The
+# canonical copy is ocr/backend/blobs.py; masking/backend and captionning/backend keep
+# identical copies (update all three together).
+BLOB_STORE_DIR = os.getenv("BLOB_STORE_DIR", os.path.join(tempfile.gettempdir(), "vision_blobs"))
+
+_BLOB_ID = re.compile(r"^[0-9a-f]{64}$")
+
+
+class BlobNotFoundError(Exception):
+    """Raised when a blob is not in the store (evicted, or the store is not shared)"""
+
+
+def read_blob(blob_id):
+    """Bytes of a stored blob; ValueError for a malformed id"""
+    if not _BLOB_ID.match(blob_id or ""):
+        raise ValueError("'blob_id' must be a SHA-256 hex digest")
+    if not BLOB_STORE_DIR:
+        raise BlobNotFoundError("The blob store is disabled")
+    try:
+        with open(os.path.join(BLOB_STORE_DIR, blob_id[:2], blob_id), "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        raise BlobNotFoundError(f"Blob {blob_id[:12]} not found")
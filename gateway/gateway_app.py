@@ -1,7 +1,9 @@
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 import httpx
+import os
 import uvicorn
 
 app = FastAPI(title="Vision AI API Gateway")
@@ -23,6 +25,21 @@ SERVICES = {
     "ocr": "http://localhost:8004",
 }
 
+# Longest wait (s) for a service's response, or between two chunks of a streamed one
+GATEWAY_TIMEOUT = float(os.getenv("GATEWAY_TIMEOUT", "30"))
+# Same for endpoints that stream results over minutes (NDJSON, zip archives)
+GATEWAY_STREAM_TIMEOUT = float(os.getenv("GATEWAY_STREAM_TIMEOUT", "300"))
+STREAMING_ENDPOINTS = {
+    "masking": ("batch", "video"),
+    "ocr": ("ocr/document",),
+}
+
+# Connection-level headers that must not be forwarded by a proxy
+HOP_BY_HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailer", "transfer-encoding", "upgrade", "content-length",
+}
+
 @app.get("/")
 async def root():
     return {
@@ -67,47 +84,56 @@ async def health_check():
     
     return health_status
 
-async def proxy_request(service_url: str, request: Request, path: str):
-    """Generic proxy function to forward requests to microservices"""
+async def proxy_request(service_url: str, request: Request, path: str, timeout: float = GATEWAY_TIMEOUT):
+    """
+    Generic proxy function to forward requests to microservices.
+    Request and response bodies are streamed through, so large uploads, images, NDJSON
+    streams and zip archives are never buffered by the gateway.
+    """
     # Build target URL
     target_url = f"{service_url}/{path}"
-    
-    # Get request body and headers
-    body = await request.body()
+
     headers = dict(request.headers)
     # Remove host header to avoid conflicts
     headers.pop("host", None)
-    
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        try:
-            response = await client.request(
-                method=request.method,
-                url=target_url,
-                content=body,
-                headers=headers,
-                params=request.query_params
-            )
-            
-            # Handle streaming responses (for images)
-            if response.headers.get("content-type", "").startswith("image/"):
-                return StreamingResponse(
-                    response.iter_bytes(),
-                    media_type=response.headers.get("content-type"),
-                    status_code=response.status_code
-                )
-            
-            # Handle JSON responses
-            return JSONResponse(
-                content=response.json() if response.text else {},
-                status_code=response.status_code
-            )
-            
-        except httpx.TimeoutException:
-            raise HTTPException(status_code=504, detail=f"Service timeout: {service_url}")
-        except httpx.RequestError as e:
-            raise HTTPException(status_code=503, detail=f"Service unavailable: {str(e)}")
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Proxy error: {str(e)}")
+
+    client = httpx.AsyncClient(timeout=httpx.Timeout(timeout, connect=5.0))
+    try:
+        upstream_request = client.build_request(
+            method=request.method,
+            url=target_url,
+            content=request.stream(),
+            headers=headers,
+            params=request.query_params
+        )
+        response = await client.send(upstream_request, stream=True)
+    except httpx.TimeoutException:
+        await client.aclose()
+        raise HTTPException(status_code=504, detail=f"Service timeout: {service_url}")
+    except httpx.RequestError as e:
+        await client.aclose()
+        raise HTTPException(status_code=503, detail=f"Service unavailable: {str(e)}")
+    except Exception as e:
+        await client.aclose()
+        raise HTTPException(status_code=500, detail=f"Proxy error: {str(e)}")
+
+    async def close():
+        await response.aclose()
+        await client.aclose()
+
+    # Body passed through as received (still compressed if the service compressed it)
+    return StreamingResponse(
+        response.aiter_raw(),
+        status_code=response.status_code,
+        headers={k: v for k, v in response.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS},
+        background=BackgroundTask(close)
+    )
+
+
+def service_timeout(service: str, path: str) -> float:
+    """Chunk timeout for a service endpoint: long for the streaming endpoints"""
+    streaming = STREAMING_ENDPOINTS.get(service, ())
+    return GATEWAY_STREAM_TIMEOUT if path.strip("/") in streaming else GATEWAY_TIMEOUT
 
 # Route: Chatbot Service
 @app.api_route("/api/chat/{path:path}", methods=["GET", "POST", "PUT", "DELETE"])
@@ -130,12 +156,12 @@ async def caption_proxy(path: str, request: Request):
 # Route: OCR Service
 @app.api_route("/api/ocr/{path:path}", methods=["GET", "POST"])
 async def ocr_proxy(path: str, request: Request):
-    return await proxy_request(SERVICES["ocr"], request, path)
+    return await proxy_request(SERVICES["ocr"], request, path, service_timeout("ocr", path))
 
 # Route: Masking Service
 @app.api_route("/api/masking/{path:path}", methods=["GET", "POST"])
 async def masking_proxy(path: str, request: Request):
-    return await proxy_request(SERVICES["masking"], request, path)
+    return await proxy_request(SERVICES["masking"], request, path, service_timeout("masking", path))
 
 if __name__ == "__main__":
     print("Starting API Gateway on port 8000...")
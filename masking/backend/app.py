@@ -1,101 +1,313 @@
 import io
 import os
+import json
+import base64
+import asyncio
+import zipfile
+import time
+import functools
 import torch
 import numpy as np
 from PIL import Image
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
-from fastapi.responses import StreamingResponse
-from transformers import Sam3Processor, Sam3Model
+from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import FastAPI, Request, UploadFile, File, Form, HTTPException
+from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.concurrency import run_in_threadpool
 import matplotlib.colors as mcolors
-from dotenv import load_dotenv
 
-# Load environment variables
-load_dotenv()
+from model_utils import (
+    DEVICE, load_models, runtime_info, segment_batch, inference_side, resize_for_inference, upsample_mask,
+    compute_image_embeddings, decode_prompts, segment_vocabulary, encode_text, segment_images,
+    start_video_session, track_frame, count_batch, prompt_cache
+)
+from inference import InferenceExecutor, QueueFullError, ClientDisconnectedError
+from encoding import (
+    negotiate_mask_format, negotiate_image_format, encode_masks, encode_image, mask_to_png, mask_bbox, mask_to_rle,
+    check_encode_options, ZipStreamWriter
+)
+from refinement import RefinementCache, image_id_for
+from blobs import BlobNotFoundError, read_blob
+from inventory import (
+    InventoryStore, SAM3_INVENTORY_VOCABULARY, SAM3_INVENTORY_CHUNK, normalize_label, pack_results, unpack_results
+)
+from compositor import composite_layers
+from tiling import (
+    TiledInstances, TileBudgetExceeded, SAM3_TILE_SIZE, should_tile, tile_grid, plan_tiling, tiled_union_mask,
+    encode_tiled_masks
+)
+from video import (
+    SAM3_VIDEO_MAX_FRAMES, SAM3_VIDEO_MAX_OBJECTS, FrameReader, save_clip, clip_frames, clip_fps, sequence_frames
+)
 
 app = FastAPI(title="Masking Backend - SAM 3")
 
-# Model configuration
-# Note: In a production environment, you might want to load this once at startup
-MODEL_ID = "./models/sam3"
-MY_TOKEN = os.getenv("HF_TOKEN")
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+# SAM 3 runs on dedicated worker threads behind a bounded queue (see inference.py)
+sam3_executor = InferenceExecutor()
+# Cached tracker embeddings and last selections for /refine (see refinement.py)
+refine_cache = RefinementCache()
+# Background object inventories per uploaded image (see inventory.py)
+inventory = InventoryStore()
+inventory_tasks = set()
 
-print(f"Using device: {DEVICE}")
-
-# Global model and processor
-processor = None
-model = None
-
-def load_models():
-    global processor, model
-    if processor is None or model is None:
-        print("Loading SAM 3 models...")
-        processor = Sam3Processor.from_pretrained(MODEL_ID, token=MY_TOKEN)
-        model = Sam3Model.from_pretrained(MODEL_ID, token=MY_TOKEN).to(DEVICE)
-        print("Models loaded and ready.")
+# Batch processing (/batch): item limits and the thread pool for decoding/encoding
+SAM3_BATCH_MAX_ITEMS = int(os.getenv("SAM3_BATCH_MAX_ITEMS", "5000"))
+SAM3_BATCH_MAX_ITEM_MB = int(os.getenv("SAM3_BATCH_MAX_ITEM_MB", "64"))
+SAM3_BATCH_IO_WORKERS = int(os.getenv("SAM3_BATCH_IO_WORKERS", str(min(8, os.cpu_count() or 1))))
+# Times a batch chunk waits for room in a full inference queue before its items fail
+BATCH_QUEUE_RETRIES = 30
+ARCHIVE_IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff")
+OUTPUT_EXTENSIONS = {"image/png": ".png", "image/jpeg": ".jpg", "image/webp": ".webp", "application/json": ".json"}
+batch_pool = ThreadPoolExecutor(max_workers=max(1, SAM3_BATCH_IO_WORKERS), thread_name_prefix="batch-io")
 
 @app.get("/")
 async def root():
     return {
         "message": "Masking Backend - SAM 3",
         "version": "1.0.0",
-        "endpoints": ["/health", "/recolor"]
+        "endpoints": ["/health", "/metrics", "/recolor", "/mask", "/refine", "/count", "/batch", "/video", "/inventory"]
     }
 
 @app.on_event("startup")
 async def startup_event():
-    load_models()
+    load_models(warmup_batch_sizes=range(1, sam3_executor.max_batch + 1))
+    await sam3_executor.start()
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    for task in inventory_tasks:
+        task.cancel()
+    await sam3_executor.stop()
+    batch_pool.shutdown(wait=False, cancel_futures=True)
 
-def change_object_color_by_name(image, mask, color_name="red", alpha=0.6):
+
+def load_image(contents, max_side=None):
     """
-    Translates a text string like 'red' into RGB and applies it to the mask area on the image.
-    Adapted from mask_generation.ipynb
+    Decode uploaded bytes to an RGB PIL image.
+    With `max_side`, JPEGs are decoded directly at a reduced scale (at least `max_side`).
     """
+    image = Image.open(io.BytesIO(contents))
+    if max_side:
+        image.draft("RGB", (max_side, max_side))
+    return image.convert("RGB")
+
+
+def image_size(contents):
+    """(W, H) of encoded image bytes, read from the header without decoding the pixels"""
+    with Image.open(io.BytesIO(contents)) as image:
+        return image.size
+
+
+async def read_upload(file, blob_id):
+    """Image bytes from the `file` upload or, by reference, from the shared blob store"""
+    if blob_id:
+        try:
+            return await run_in_threadpool(read_blob, blob_id)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except BlobNotFoundError as e:
+            raise HTTPException(status_code=410, detail=str(e))
+    if file is None:
+        raise HTTPException(status_code=400, detail="Provide the image 'file' or a 'blob_id'")
+    return await file.read()
+
+
+async def await_inference(job):
+    """Await an inference executor job, mapping queue errors to HTTP errors"""
+    try:
+        return await job
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except ClientDisconnectedError as e:
+        raise HTTPException(status_code=499, detail=str(e))
+
+
+async def run_segment(request, image, target_obj, threshold=0.15, max_side=None):
+    """
+    Segment one image; concurrent requests are batched into a single SAM 3 forward pass.
+    The image is first capped to the inference resolution, so the returned masks are at
+    that resolution. Returns (results, inference_size) with inference_size as (W, H).
+    """
+    inference_image = await run_in_threadpool(resize_for_inference, image, inference_side(max_side))
+    results = await await_inference(sam3_executor.submit_batched(
+        functools.partial(segment_batch, threshold=threshold),
+        (inference_image, target_obj),
+        batch_key=("segment", threshold),
+        request=request
+    ))
+    return results, inference_image.size
+
+
+async def run_count(request, image, target_obj, threshold=0.15, max_side=None):
+    """
+    Fast count on one image from boxes and low-res masks (see count_batch); concurrent
+    requests are batched. Returns (result, inference_size) with inference_size as (W, H).
+    """
+    inference_image = await run_in_threadpool(resize_for_inference, image, inference_side(max_side))
+    result = await await_inference(sam3_executor.submit_batched(
+        functools.partial(count_batch, threshold=threshold),
+        (inference_image, target_obj),
+        batch_key=("count", threshold),
+        request=request
+    ))
+    return result, inference_image.size
+
+
+async def lookup_or_segment(request, image, image_id, target_obj, max_side=None):
+    """
+    Results for `target_obj` from the image's inventory when it was indexed (only at the
+    default inference cap), otherwise a fresh SAM 3 run. Same return value as run_segment.
+    """
+    if max_side is None:
+        indexed = await inventory.lookup(image_id, target_obj)
+        if indexed is not None:
+            data, inference_size = indexed
+            print(f"Answered '{target_obj}' from the inventory of image {image_id[:12]}")
+            return await run_in_threadpool(unpack_results, data, inference_size), inference_size
+    return await run_segment(request, image, target_obj, threshold=0.15, max_side=max_side)
+
+
+async def run_tiled(request, image, target_obj):
+    """
+    Segment a large image tile by tile at native resolution (see tiling.py).
+    The prompt is encoded once; the next pass's tiles are cut, and the previous pass's
+    instances merged, while a pass runs. Returns the TiledInstances of the image.
+    """
+    loop = asyncio.get_running_loop()
+    tiles_per_pass, instance_mb = plan_tiling(image.size, sam3_executor.max_batch)
+    tiles = tile_grid(image.size)
+    passes = [tiles[i:i + tiles_per_pass] for i in range(0, len(tiles), tiles_per_pass)]
+    found = TiledInstances(image.size, instance_mb)
+    print(f"Tiled segmentation of '{target_obj}': {len(tiles)} tiles, {tiles_per_pass} per pass")
+
+    def cut(boxes):
+        return [image.crop(box) for box in boxes]
+
+    def merge(boxes, results):
+        for box, result in zip(boxes, results):
+            found.add_tile(box, result)
+
+    text_features = await await_inference(sam3_executor.submit(encode_text, target_obj, request=request))
+    next_crops = loop.run_in_executor(batch_pool, cut, passes[0])
+    previous = None
+    job = None
+    try:
+        for idx, boxes in enumerate(passes):
+            crops = await next_crops
+            if idx + 1 < len(passes):
+                next_crops = loop.run_in_executor(batch_pool, cut, passes[idx + 1])
+            job = asyncio.ensure_future(
+                await_inference(submit_waiting(request, segment_images, crops, text_features))
+            )
+            if previous is not None:
+                await run_in_threadpool(merge, *previous)
+            previous = (boxes, await job)
+        await run_in_threadpool(merge, *previous)
+    finally:
+        if job is not None and not job.done():
+            job.cancel()
+    return found
+
+
+def size_header(size):
+    return f"{size[0]}x{size[1]}"
+
+
+def parse_color(color_name):
+    """Translate a text string like 'red' into an RGB triple, defaulting to red"""
     try:
         rgb_float = mcolors.to_rgb(color_name)
-        target_rgb = [int(c * 255) for c in rgb_float]
+        return [int(c * 255) for c in rgb_float]
     except ValueError:
         print(f"Color '{color_name}' not found. Defaulting to Red.")
-        target_rgb = [255, 0, 0]
-
-    img_np = np.array(image).copy()
-    if torch.is_tensor(mask):
-        mask = mask.cpu().numpy()
-    mask = mask.astype(bool)
-
-    # Broadcast mask to 3 channels if necessary
-    for c in range(3):
-        img_np[:, :, c] = np.where(
-            mask,
-            (img_np[:, :, c] * (1 - alpha) + target_rgb[c] * alpha).astype(np.uint8),
-            img_np[:, :, c]
-        )
+        return [255, 0, 0]
+
+
+def change_object_color_by_name(image, mask, color_name="red", alpha=0.6):
+    """
+    Translates a text string like 'red' into RGB and applies it to the mask area on the image.
+    `mask` may also be a list of masks, all painted with the same color.
+    Adapted from mask_generation.ipynb
+    """
+    target_rgb = parse_color(color_name)
+    masks = mask if isinstance(mask, (list, tuple)) else [mask]
 
+    layers = []
+    for m in masks:
+        if torch.is_tensor(m):
+            m = m.cpu().numpy()
+        layers.append((m, target_rgb, alpha))
+
+    img_np = np.array(image)
+    composite_layers(img_np, layers)
     return Image.fromarray(img_np)
 
+def select_recolor_mask(masks, scores, verbose=True):
+    """
+    Index of the mask to recolor: the largest of the masks scoring above 0.15,
+    or the first one if none does.
+    """
+    # 1. Filter by score (remove very low confidence noise)
+    valid_indices = [i for i, s in enumerate(scores) if s > 0.15]
+
+    if not valid_indices:
+        if verbose:
+            print("No masks above threshold 0.15. Falling back to highest score.")
+        return 0
+
+    # 2. From valid masks, pick the one with the LARGEST AREA
+    # This heuristic assumes the user is asking for the main object, not a speck of dust
+    max_area = -1
+    best_idx = -1
+
+    for idx in valid_indices:
+        mask_area = masks[idx].sum()
+        if verbose:
+            print(f"Mask {idx}: Score={scores[idx]:.3f}, Area={mask_area}")
+
+        if mask_area > max_area:
+            max_area = mask_area
+            best_idx = idx
+
+    return best_idx
+
 @app.post("/recolor")
 async def recolor_image(
-    file: UploadFile = File(...),
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    blob_id: Optional[str] = Form(None),
     target_obj: str = Form(...),
-    new_color: str = Form(...)
+    new_color: str = Form(...),
+    output_format: Optional[str] = Form(None),
+    quality: Optional[int] = Form(None),
+    compress_level: Optional[int] = Form(None),
+    preview_max_side: Optional[int] = Form(None),
+    max_side: Optional[int] = Form(None)
 ):
+    """
+    Recolor an object and return the image.
+    `output_format` (or the Accept header) selects png, jpeg or webp; `quality` applies to
+    jpeg/webp and `compress_level` (0-9) to png. `preview_max_side` downscales the result
+    for clients that only display it. `max_side` overrides the inference resolution cap.
+    """
+    try:
+        fmt = negotiate_image_format(output_format, request.headers.get("accept"))
+        check_encode_options(quality, compress_level, preview_max_side)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     try:
         # 1. Read and open image
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents)).convert("RGB")
+        contents = await read_upload(file, blob_id)
+        image = await run_in_threadpool(load_image, contents)
+        # A blob id already is the SHA-256 of the image
+        image_id = blob_id or await run_in_threadpool(image_id_for, contents)
         print(f"Processing recolor request for object: '{target_obj}' with color: '{new_color}'")
 
         # 2. Run SAM 3 to get the mask
-        inputs_sam = processor(images=image, text=target_obj, return_tensors="pt").to(DEVICE)
-        with torch.no_grad():
-            outputs_sam = model(**inputs_sam)
-
         # 3. Extract Mask
         # Using threshold 0.15 as requested
-        results = processor.post_process_instance_segmentation(
-            outputs_sam, threshold=0.15, target_sizes=[image.size[::-1]]
-        )[0]
+        results, inference_size = await lookup_or_segment(request, image, image_id, target_obj, max_side=max_side)
 
         print(f"SAM 3 results: found {len(results.get('masks', []))} masks at threshold 0.15")
         if 'scores' in results:
@@ -108,48 +320,36 @@ async def recolor_image(
         # Smarter Mask Selection
         masks = results['masks']
         scores = results['scores']
-        
-        best_mask = None
-        best_score = -1
-        
-        # 1. Filter by score (remove very low confidence noise)
-        valid_indices = [i for i, s in enumerate(scores) if s > 0.15]
-        
-        if not valid_indices:
-            print("No masks above threshold 0.15. Falling back to highest score.")
-            best_mask = masks[0]
-            best_score = scores[0].item()
-        else:
-            # 2. From valid masks, pick the one with the LARGEST AREA
-            # This heuristic assumes the user is asking for the main object, not a speck of dust
-            max_area = -1
-            best_idx = -1
-            
-            for idx in valid_indices:
-                mask_area = masks[idx].sum()
-                print(f"Mask {idx}: Score={scores[idx]:.3f}, Area={mask_area}")
-                
-                if mask_area > max_area:
-                    max_area = mask_area
-                    best_idx = idx
-            
-            best_mask = masks[best_idx]
-            best_score = scores[best_idx].item()
-
-        mask = best_mask
-        print(f"Selected mask with score: {best_score:.3f}")
+        best_idx = select_recolor_mask(masks, scores)
+        best_mask = masks[best_idx]
+        print(f"Selected mask with score: {scores[best_idx].item():.3f}")
+
+        # Map the selected mask back to the original resolution
+        mask = await run_in_threadpool(upsample_mask, best_mask, image.size)
+        refine_cache.remember_selection(image_id, mask_bbox(mask))
 
         # 4. Apply recoloring
-        result_img = change_object_color_by_name(image, mask, color_name=new_color)
+        result_img = await run_in_threadpool(change_object_color_by_name, image, mask, color_name=new_color)
+
+        # 5. Encode off the event loop and return the resulting image
+        img_io, media_type = await run_in_threadpool(
+            encode_image, result_img, fmt,
+            quality=quality, compress_level=compress_level, max_side=preview_max_side
+        )
 
-        # 5. Return the resulting image
-        img_io = io.BytesIO()
-        result_img.save(img_io, 'PNG')
-        img_io.seek(0)
-        
-        print("Successfully recolored image.")
-        return StreamingResponse(img_io, media_type="image/png")
+        print(f"Successfully recolored image ({fmt}).")
+        return StreamingResponse(
+            img_io,
+            media_type=media_type,
+            headers={
+                "X-Original-Size": size_header(image.size),
+                "X-Inference-Size": size_header(inference_size),
+                "X-Image-Id": image_id
+            }
+        )
 
+    except HTTPException as he:
+        raise he
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -157,42 +357,249 @@ async def recolor_image(
 
 @app.post("/mask")
 async def generate_mask(
-    file: UploadFile = File(...),
-    target_obj: str = Form(...)
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    blob_id: Optional[str] = Form(None),
+    target_obj: str = Form(...),
+    mask_format: Optional[str] = Form(None),
+    all_instances: bool = Form(False),
+    max_side: Optional[int] = Form(None),
+    tiled: Optional[bool] = Form(None)
 ):
+    """
+    Segment an object and return its mask.
+    `mask_format` (or the Accept header) selects png, rle (COCO), bitpack or labelmap.
+    Compact formats are JSON with per-instance metadata; `all_instances` returns every instance.
+    `max_side` overrides the inference resolution cap; masks are always returned at full size.
+    Very large images (or `tiled=true`) are segmented in overlapping native-resolution tiles.
+    """
+    try:
+        fmt = negotiate_mask_format(mask_format, request.headers.get("accept"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     try:
         # 1. Read and open image
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents)).convert("RGB")
-        print(f"Processing mask generation for: '{target_obj}'")
+        contents = await read_upload(file, blob_id)
+        image = await run_in_threadpool(load_image, contents)
+        # A blob id already is the SHA-256 of the image
+        image_id = blob_id or await run_in_threadpool(image_id_for, contents)
+        print(f"Processing mask generation for: '{target_obj}' (format: {fmt})")
 
-        # 2. Run SAM 3
-        inputs_sam = processor(images=image, text=target_obj, return_tensors="pt").to(DEVICE)
-        with torch.no_grad():
-            outputs_sam = model(**inputs_sam)
+        if should_tile(image.size, tiled):
+            return await tiled_mask(request, image, image_id, target_obj, fmt, all_instances)
 
+        # 2. Run SAM 3
         # 3. Extract Mask
-        results = processor.post_process_instance_segmentation(
-            outputs_sam, threshold=0.15, target_sizes=[image.size[::-1]]
-        )[0]
+        results, inference_size = await lookup_or_segment(request, image, image_id, target_obj, max_side=max_side)
 
         if len(results['masks']) == 0:
             raise HTTPException(status_code=404, detail=f"Object '{target_obj}' not found.")
 
-        # Take first mask and convert to black/white image
-        mask = results['masks'][0]  # [H, W] bool array
-        if torch.is_tensor(mask):
-            mask = mask.cpu().numpy()
-        mask = mask.astype(np.uint8) * 255
-        
-        mask_img = Image.fromarray(mask, mode='L')
-
-        # Return image
-        img_io = io.BytesIO()
-        mask_img.save(img_io, 'PNG')
-        img_io.seek(0)
-        
-        return StreamingResponse(img_io, media_type="image/png")
+        masks = results['masks']
+        scores = results['scores']
+        if torch.is_tensor(masks):
+            masks = masks.cpu().numpy()
+        if torch.is_tensor(scores):
+            scores = scores.float().cpu().numpy()
+
+        # Without all_instances keep the historical behaviour: first instance only
+        if not all_instances:
+            masks = masks[:1]
+            scores = scores[:1]
+
+        # Map the returned masks back to the original resolution
+        masks = await run_in_threadpool(
+            lambda: np.stack([upsample_mask(m, image.size) for m in masks])
+        )
+        refine_cache.remember_selection(image_id, mask_bbox(masks[0]))
+
+        if fmt == "png":
+            if all_instances and len(masks) > 1:
+                # Union of all instances as a single black/white image
+                img_io = await run_in_threadpool(mask_to_png, masks.any(axis=0))
+            else:
+                img_io = await run_in_threadpool(mask_to_png, masks[0])
+            return StreamingResponse(
+                img_io,
+                media_type="image/png",
+                headers={"X-Inference-Size": size_header(inference_size), "X-Image-Id": image_id}
+            )
+
+        payload = await run_in_threadpool(encode_masks, masks, scores, fmt)
+        payload["inference_size"] = list(inference_size)
+        payload["image_id"] = image_id
+        return payload
+
+    except HTTPException as he:
+        raise he
+    except TileBudgetExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def tiled_mask(request, image, image_id, target_obj, fmt, all_instances):
+    """/mask for a tiled image: instance masks are stitched from their tile crops"""
+    found = await run_tiled(request, image, target_obj)
+    instances = found.ranked()
+    if not instances:
+        raise HTTPException(status_code=404, detail=f"Object '{target_obj}' not found.")
+    if not all_instances:
+        instances = instances[:1]
+    refine_cache.remember_selection(image_id, list(instances[0]["box"]))
+
+    if fmt == "png":
+        union = await run_in_threadpool(tiled_union_mask, instances, image.size)
+        img_io = await run_in_threadpool(mask_to_png, union)
+        return StreamingResponse(
+            img_io,
+            media_type="image/png",
+            headers={"X-Tiles": str(found.tiles), "X-Image-Id": image_id}
+        )
+
+    payload = await run_in_threadpool(encode_tiled_masks, instances, image.size, fmt)
+    payload["tiles"] = found.tiles
+    payload["tile_size"] = SAM3_TILE_SIZE
+    payload["image_id"] = image_id
+    return payload
+
+def parse_prompts(points, labels, box):
+    """Validate the JSON click/box prompts of /refine. Returns (points, labels, box)."""
+    try:
+        points = json.loads(points) if points else None
+        labels = json.loads(labels) if labels else None
+        box = json.loads(box) if box else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="'points', 'labels' and 'box' must be JSON")
+
+    if points is not None:
+        if not isinstance(points, list) or not all(isinstance(p, list) and len(p) == 2 for p in points):
+            raise HTTPException(status_code=400, detail="'points' must be a list of [x, y] pairs")
+        labels = [1] * len(points) if labels is None else labels
+        if not isinstance(labels, list) or len(labels) != len(points) or any(l not in (0, 1) for l in labels):
+            raise HTTPException(status_code=400, detail="'labels' must hold one 1 (positive) or 0 (negative) per point")
+        points = [[float(x), float(y)] for x, y in points] or None
+        labels = [int(l) for l in labels] if points else None
+    if box is not None and (not isinstance(box, list) or len(box) != 4):
+        raise HTTPException(status_code=400, detail="'box' must be [x0, y0, x1, y1]")
+    return points, labels, [float(v) for v in box] if box else None
+
+
+def scale_prompts(points, box, original_size, size):
+    """Map prompts from original image pixels to the resolution the embeddings were computed at"""
+    sx, sy = size[0] / original_size[0], size[1] / original_size[1]
+    points = [[x * sx, y * sy] for x, y in points] if points else None
+    box = [box[0] * sx, box[1] * sy, box[2] * sx, box[3] * sy] if box else None
+    return points, box
+
+
+@app.post("/refine")
+async def refine_mask(
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    blob_id: Optional[str] = Form(None),
+    image_id: Optional[str] = Form(None),
+    points: Optional[str] = Form(None),
+    labels: Optional[str] = Form(None),
+    box: Optional[str] = Form(None),
+    use_previous: bool = Form(True),
+    mask_format: Optional[str] = Form(None),
+    new_color: Optional[str] = Form(None),
+    output_format: Optional[str] = Form(None),
+    max_side: Optional[int] = Form(None)
+):
+    """
+    Refine a segmentation with clicks or a box.
+    The image is given as `file`, as a shared-store `blob_id` (read only when the embedding
+    is not cached) or as the `image_id` returned by /mask, /recolor or an earlier /refine.
+    Its embedding is computed once and cached, so each click only runs
+    the prompt encoder and mask decoder.
+    `points` is JSON [[x, y], ...] in original pixels with `labels` (1 = positive,
+    0 = negative, default all positive); `box` is JSON [x0, y0, x1, y1]. Without a box,
+    the box of the last returned mask is used (`use_previous`). Without any prompt the
+    embedding is only computed, so the first click is interactive too.
+    Returns the mask like /mask, or the recolored image when `new_color` is given
+    (which needs the `file` or `blob_id`).
+    """
+    try:
+        if new_color:
+            fmt = negotiate_image_format(output_format, request.headers.get("accept"))
+        else:
+            fmt = negotiate_mask_format(mask_format, request.headers.get("accept"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    points, labels, box = parse_prompts(points, labels, box)
+
+    has_image = file is not None or bool(blob_id)
+    if not has_image and not image_id:
+        raise HTTPException(status_code=400, detail="Provide the image 'file', a 'blob_id' or an 'image_id'")
+    if new_color and not has_image:
+        raise HTTPException(status_code=400, detail="'new_color' needs the image 'file' or 'blob_id'")
+
+    try:
+        image = None
+        contents = None
+        if blob_id:
+            # A blob id already is the SHA-256 of the image
+            image_id = blob_id
+        elif file is not None:
+            contents = await file.read()
+            image_id = await run_in_threadpool(image_id_for, contents)
+
+        entry = refine_cache.lookup(image_id)
+        if entry is None:
+            if not has_image:
+                raise HTTPException(status_code=404, detail=f"Image '{image_id}' expired, re-upload the file")
+            if contents is None:
+                contents = await read_upload(file, blob_id)
+            # The only full vision pass; every later click for this image reuses it
+            image = await run_in_threadpool(load_image, contents)
+            inference_image = await run_in_threadpool(resize_for_inference, image, inference_side(max_side))
+            embeddings = await await_inference(
+                sam3_executor.submit(compute_image_embeddings, inference_image, request=request)
+            )
+            entry = refine_cache.put_embeddings(image_id, embeddings, inference_image.size, image.size)
+        embeddings, inference_size, original_size = entry["embeddings"], entry["size"], entry["original_size"]
+
+        if points is None and box is None:
+            return {"image_id": image_id, "ready": True, "inference_size": list(inference_size)}
+
+        if box is not None:
+            refine_cache.remember_selection(image_id, box)
+        elif use_previous and entry["box"] is not None:
+            box = entry["box"]
+
+        start = time.perf_counter()
+        scaled_points, scaled_box = scale_prompts(points, box, original_size, inference_size)
+        mask, score = await await_inference(sam3_executor.submit(
+            decode_prompts, embeddings, inference_size, scaled_points, labels, scaled_box, request=request
+        ))
+        decode_ms = (time.perf_counter() - start) * 1000
+        print(f"Refined mask for {image_id[:12]} ({len(points or [])} points, box={box is not None}) "
+              f"in {decode_ms:.0f} ms, IoU score {score:.3f}")
+
+        mask = await run_in_threadpool(upsample_mask, mask, original_size)
+        headers = {"X-Image-Id": image_id, "X-Decode-Ms": f"{decode_ms:.1f}"}
+
+        if new_color:
+            if image is None:
+                if contents is None:
+                    contents = await read_upload(file, blob_id)
+                image = await run_in_threadpool(load_image, contents)
+            result_img = await run_in_threadpool(change_object_color_by_name, image, mask, color_name=new_color)
+            img_io, media_type = await run_in_threadpool(encode_image, result_img, fmt)
+            return StreamingResponse(img_io, media_type=media_type, headers=headers)
+
+        if fmt == "png":
+            img_io = await run_in_threadpool(mask_to_png, mask)
+            return StreamingResponse(img_io, media_type="image/png", headers=headers)
+
+        payload = await run_in_threadpool(encode_masks, mask[None], np.array([score]), fmt)
+        payload["image_id"] = image_id
+        payload["decode_ms"] = round(decode_ms, 1)
+        return payload
 
     except HTTPException as he:
         raise he
@@ -201,79 +608,642 @@ async def generate_mask(
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+def filter_count_instances(masks, scores, image_area):
+    """Filter raw SAM 3 instances by score, area and overlap (NMS-like) before counting"""
+    valid_masks = []
+
+    # Sort by score descending
+    sorted_indices = torch.argsort(scores, descending=True)
+
+    for idx in sorted_indices:
+        mask = masks[idx]
+        score = scores[idx].item()
+
+        # Filter 1: Minimum Score
+        if score < 0.15:
+            continue
+
+        # Filter 2: Minimum Area (0.5% of image) -> Avoids noise
+        mask_area = mask.sum().item()
+        if mask_area < (image_area * 0.005):
+            continue
+
+        # Filter 3: Intersection over Union (IoU) with already selected masks
+        is_duplicate = False
+        for valid_mask in valid_masks:
+            intersection = (mask & valid_mask).sum().item()
+            union = (mask | valid_mask).sum().item()
+            iou = intersection / union if union > 0 else 0
+
+            # If high overlap, it's likely the same object detected twice
+            if iou > 0.3:
+                is_duplicate = True
+                break
+
+        if not is_duplicate:
+            valid_masks.append(mask)
+
+    return valid_masks
+
 @app.post("/count")
 async def count_objects(
-    file: UploadFile = File(...),
-    target_obj: str = Form(...)
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    blob_id: Optional[str] = Form(None),
+    target_obj: str = Form(...),
+    max_side: Optional[int] = Form(None),
+    tiled: Optional[bool] = Form(None),
+    mode: str = Form("fast"),
+    return_boxes: bool = Form(False)
 ):
-    """Count number of instances of an object"""
+    """
+    Count number of instances of an object (entirely at the capped inference resolution).
+    The default "fast" mode filters and de-duplicates instances on the predicted boxes and
+    low-resolution masks only; `mode=masks` runs the full-resolution mask filtering.
+    `return_boxes` adds the counted instances' boxes (image pixels) and scores.
+    Very large images (or `tiled=true`) are counted over overlapping native-resolution tiles,
+    which keeps small objects that a downscaled pass would miss.
+    """
+    if mode not in ("fast", "masks"):
+        raise HTTPException(status_code=400, detail="'mode' must be 'fast' or 'masks'")
     try:
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents)).convert("RGB")
-        print(f"Counting objects for: '{target_obj}'")
+        contents = await read_upload(file, blob_id)
+        print(f"Counting objects for: '{target_obj}' ({mode})")
+
+        size = await run_in_threadpool(image_size, contents)
+        if should_tile(size, tiled):
+            image = await run_in_threadpool(load_image, contents)
+            found = await run_tiled(request, image, target_obj)
+            count = await run_in_threadpool(found.count)
+            print(f"Found {count} instances of {target_obj} over {found.tiles} tiles (raw: {len(found.instances)})")
+            return {"count": count, "object": target_obj, "tiles": found.tiles, "tile_size": SAM3_TILE_SIZE}
+
+        # Counts of indexed labels (both modes) are precomputed by the upload's inventory
+        if max_side is None and not return_boxes:
+            image_id = blob_id or await run_in_threadpool(image_id_for, contents)
+            indexed = await inventory.lookup(image_id, target_obj)
+            count = None if indexed is None else indexed[0]["count" if mode == "masks" else "fast_count"]
+            if count is not None:
+                print(f"Answered {mode} count of '{target_obj}' from the inventory: {count}")
+                return {"count": count, "object": target_obj, "inference_size": list(indexed[1])}
+
+        # Counting never needs full resolution, so let the JPEG decoder downscale
+        image = await run_in_threadpool(load_image, contents, inference_side(max_side))
 
-        inputs_sam = processor(images=image, text=target_obj, return_tensors="pt").to(DEVICE)
-        with torch.no_grad():
-            outputs_sam = model(**inputs_sam)
+        if mode == "fast":
+            result, inference_size = await run_count(request, image, target_obj, threshold=0.15, max_side=max_side)
+            print(f"Found {result['count']} instances of {target_obj} (fast count)")
+            response = {"count": result["count"], "object": target_obj, "inference_size": list(inference_size)}
+            if return_boxes:
+                scale = torch.tensor([size[0], size[1], size[0], size[1]], dtype=torch.float32)
+                response["boxes"] = [[round(v, 1) for v in box] for box in (result["boxes"] * scale).tolist()]
+                response["scores"] = [round(float(score), 4) for score in result["scores"]]
+            return response
 
         # 3. Extract Masks with higher threshold
-        results = processor.post_process_instance_segmentation(
-            outputs_sam, threshold=0.15, target_sizes=[image.size[::-1]]
-        )[0]
+        results, inference_size = await run_segment(request, image, target_obj, threshold=0.15, max_side=max_side)
 
         masks = results['masks']
         scores = results['scores']
-        
+
         # 4. Filter by Area and Overlap (NMS-like)
-        valid_masks = []
-        image_area = image.size[0] * image.size[1]
-        
-        # Sort by score descending
-        sorted_indices = torch.argsort(scores, descending=True)
-        
-        for idx in sorted_indices:
-            mask = masks[idx]
-            score = scores[idx].item()
-            
-            # Filter 1: Minimum Score
-            if score < 0.15: 
-                continue
-                
-            # Filter 2: Minimum Area (0.5% of image) -> Avoids noise
-            mask_area = mask.sum().item()
-            if mask_area < (image_area * 0.005):
-                continue
-            
-            # Filter 3: Intersection over Union (IoU) with already selected masks
-            is_duplicate = False
-            for valid_mask in valid_masks:
-                intersection = (mask & valid_mask).sum().item()
-                union = (mask | valid_mask).sum().item()
-                iou = intersection / union if union > 0 else 0
-                
-                # If high overlap, it's likely the same object detected twice
-                if iou > 0.3:
-                    is_duplicate = True
-                    break
-            
-            if not is_duplicate:
-                valid_masks.append(mask)
+        image_area = inference_size[0] * inference_size[1]
+        valid_masks = await run_in_threadpool(filter_count_instances, masks, scores, image_area)
 
         count = len(valid_masks)
         print(f"Found {count} instances of {target_obj} after filtering (raw: {len(masks)})")
-        
-        return {"count": count, "object": target_obj}
 
+        response = {"count": count, "object": target_obj, "inference_size": list(inference_size)}
+        if return_boxes:
+            sx, sy = size[0] / inference_size[0], size[1] / inference_size[1]
+            boxes = [mask_bbox(mask.cpu().numpy() if torch.is_tensor(mask) else mask) for mask in valid_masks]
+            response["boxes"] = [[round(b[0] * sx, 1), round(b[1] * sy, 1), round(b[2] * sx, 1), round(b[3] * sy, 1)]
+                                 for b in boxes]
+        return response
+
+    except HTTPException as he:
+        raise he
+    except TileBudgetExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+def archive_items(archive_file):
+    """Open a zip archive and list its images as (name, size, read) items"""
+    archive = zipfile.ZipFile(archive_file)
+    items = []
+    for info in archive.infolist():
+        name = info.filename
+        if info.is_dir() or name.startswith("__MACOSX/") or not name.lower().endswith(ARCHIVE_IMAGE_EXTENSIONS):
+            continue
+        items.append((name, info.file_size, functools.partial(archive.read, info)))
+    return archive, items
+
+
+def prepare_batch_item(read, size, max_side):
+    """Read and decode one batch image. Returns (image, inference_image)."""
+    if size is not None and size > SAM3_BATCH_MAX_ITEM_MB * 1024 * 1024:
+        raise ValueError(f"Image is larger than {SAM3_BATCH_MAX_ITEM_MB} MB")
+    image = load_image(read())
+    return image, resize_for_inference(image, max_side)
+
+
+def finish_batch_item(image, result, spec):
+    """
+    Turn one SAM 3 result into the item's output, like /recolor or /mask would.
+    Returns (data, media_type, metadata), or None if the object was not found.
+    """
+    masks, scores = result["masks"], result["scores"]
+    if len(masks) == 0:
+        return None
+
+    if spec["operation"] == "recolor":
+        best_idx = select_recolor_mask(masks, scores, verbose=False)
+        mask = upsample_mask(masks[best_idx], image.size)
+        result_img = change_object_color_by_name(image, mask, color_name=spec["new_color"])
+        img_io, media_type = encode_image(
+            result_img, spec["image_format"], quality=spec["quality"], max_side=spec["preview_max_side"]
+        )
+        return img_io.getvalue(), media_type, {"score": round(float(scores[best_idx]), 4), "bbox": mask_bbox(mask)}
+
+    masks = masks.cpu().numpy() if torch.is_tensor(masks) else masks
+    scores = scores.float().cpu().numpy() if torch.is_tensor(scores) else scores
+    if not spec["all_instances"]:
+        masks, scores = masks[:1], scores[:1]
+    masks = np.stack([upsample_mask(m, image.size) for m in masks])
+    if spec["mask_format"] == "png":
+        return mask_to_png(masks.any(axis=0)).getvalue(), "image/png", {"instances": len(masks)}
+    return encode_masks(masks, scores, spec["mask_format"]), "application/json", {"instances": len(masks)}
+
+
+async def submit_waiting(request, fn, *args):
+    """Queue `fn(*args)` for a long-running stream, waiting for room when the inference queue is full"""
+    for _ in range(BATCH_QUEUE_RETRIES):
+        try:
+            return await sam3_executor.submit(fn, *args, request=request)
+        except QueueFullError:
+            await asyncio.sleep(1)
+    raise QueueFullError("Inference queue stayed full")
+
+
+async def submit_batch_chunk(request, images, text_features):
+    """Queue one chunk of batch images, waiting for room when the inference queue is full"""
+    return await submit_waiting(request, segment_images, images, text_features)
+
+
+async def run_batch(request, items, target_obj, spec, max_side=None):
+    """
+    Process batch items in chunks of the executor's batch size, yielding (record, data, media_type)
+    per item in input order. The prompt is encoded once; decoding of the next chunk and
+    encoding of the previous one run on the I/O pool while a chunk is on the model.
+    """
+    loop = asyncio.get_running_loop()
+    side = inference_side(max_side)
+    text_features = await await_inference(sam3_executor.submit(encode_text, target_obj, request=request))
+    chunk_size = sam3_executor.max_batch
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+    async def prepare(item):
+        _, size, read = item
+        try:
+            return await loop.run_in_executor(batch_pool, prepare_batch_item, read, size, side)
+        except Exception as e:
+            return e
+
+    async def finish(record, image, result):
+        try:
+            output = await loop.run_in_executor(batch_pool, finish_batch_item, image, result, spec)
+        except Exception as e:
+            return {**record, "status": "error", "error": str(e)}, None, None
+        if output is None:
+            return {**record, "status": "not_found"}, None, None
+        data, media_type, metadata = output
+        return {**record, "status": "ok", **metadata}, data, media_type
+
+    async def failed(record, error):
+        return {**record, "status": "error", "error": str(error)}, None, None
+
+    next_prepared = asyncio.gather(*(prepare(item) for item in chunks[0])) if chunks else None
+    previous = []
+    for chunk_idx, chunk in enumerate(chunks):
+        prepared = await next_prepared
+        if chunk_idx + 1 < len(chunks):
+            next_prepared = asyncio.gather(*(prepare(item) for item in chunks[chunk_idx + 1]))
+
+        decoded = [p for p in prepared if not isinstance(p, Exception)]
+        inference_error = None
+        results = []
+        if decoded:
+            try:
+                results = await submit_batch_chunk(request, [p[1] for p in decoded], text_features)
+            except ClientDisconnectedError:
+                return
+            except Exception as e:
+                inference_error = e
+        results = iter(results)
+
+        current = []
+        for offset, ((name, _, _), p) in enumerate(zip(chunk, prepared)):
+            record = {"index": chunk_idx * chunk_size + offset, "name": name}
+            if isinstance(p, Exception):
+                current.append(asyncio.ensure_future(failed(record, p)))
+            elif inference_error is not None:
+                current.append(asyncio.ensure_future(failed(record, inference_error)))
+            else:
+                record["inference_size"] = list(p[1].size)
+                current.append(asyncio.ensure_future(finish(record, p[0], next(results))))
+
+        for task in previous:
+            yield await task
+        previous = current
+
+    for task in previous:
+        yield await task
+
+
+def batch_entry_name(record, media_type):
+    stem = os.path.splitext(os.path.basename(record["name"]))[0] or "image"
+    return f"{record['index']:05d}_{stem}{OUTPUT_EXTENSIONS[media_type]}"
+
+
+def ndjson_line(record, data, media_type):
+    """One NDJSON result line; binary outputs are base64 encoded"""
+    if isinstance(data, dict):
+        record = {**record, "mask": data}
+    elif data is not None:
+        record = {**record, "media_type": media_type, "data": base64.b64encode(data).decode("ascii")}
+    return (json.dumps(record) + "\n").encode("utf-8")
+
+
+@app.post("/batch")
+async def batch_process(
+    request: Request,
+    target_obj: str = Form(...),
+    operation: str = Form("recolor"),
+    new_color: Optional[str] = Form(None),
+    files: Optional[List[UploadFile]] = File(None),
+    archive: Optional[UploadFile] = File(None),
+    output: Optional[str] = Form(None),
+    output_format: Optional[str] = Form(None),
+    quality: Optional[int] = Form(None),
+    preview_max_side: Optional[int] = Form(None),
+    mask_format: Optional[str] = Form(None),
+    all_instances: bool = Form(False),
+    max_side: Optional[int] = Form(None)
+):
+    """
+    Recolor or mask the same object in many images: `files` and/or a zip `archive`,
+    together at most SAM3_BATCH_MAX_ITEMS images (default 5000).
+    The prompt is encoded once and images go through SAM 3 in batches. Results stream back
+    as they are ready, in input order: a zip (default; images plus a manifest.ndjson with
+    per-item status) or NDJSON (`output=ndjson` or Accept: application/x-ndjson), one line
+    per item with its status and base64 data.
+    `operation` is "recolor" (needs `new_color`; `output_format`, `quality`, `preview_max_side`
+    as in /recolor) or "mask" (`mask_format`, `all_instances` as in /mask).
+    """
+    if operation not in ("recolor", "mask"):
+        raise HTTPException(status_code=400, detail="'operation' must be 'recolor' or 'mask'")
+    if operation == "recolor" and not new_color:
+        raise HTTPException(status_code=400, detail="'new_color' is required for recolor")
+    accept = request.headers.get("accept") or ""
+    output = (output or ("ndjson" if "application/x-ndjson" in accept else "zip")).strip().lower()
+    if output not in ("zip", "ndjson"):
+        raise HTTPException(status_code=400, detail="'output' must be 'zip' or 'ndjson'")
+    try:
+        check_encode_options(quality, max_side=preview_max_side)
+        spec = {
+            "operation": operation,
+            "new_color": new_color,
+            "image_format": negotiate_image_format(output_format),
+            "quality": quality,
+            "preview_max_side": preview_max_side,
+            "mask_format": negotiate_mask_format(mask_format),
+            "all_instances": all_instances,
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    items = [(f.filename or f"image_{i}", f.size, f.file.read) for i, f in enumerate(files or [])]
+    opened_archive = None
+    if archive is not None:
+        try:
+            opened_archive, archive_entries = await run_in_threadpool(archive_items, archive.file)
+        except zipfile.BadZipFile:
+            raise HTTPException(status_code=400, detail="'archive' is not a valid zip file")
+        items.extend(archive_entries)
+    if not items:
+        raise HTTPException(status_code=400, detail="No images given: send 'files' or an 'archive'")
+    if len(items) > SAM3_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Too many images ({len(items)} > {SAM3_BATCH_MAX_ITEMS})")
+
+    print(f"Batch {operation} of '{target_obj}' on {len(items)} images ({output})")
+
+    async def stream_zip():
+        writer = ZipStreamWriter()
+        manifest = []
+        try:
+            async for record, data, media_type in run_batch(request, items, target_obj, spec, max_side):
+                if data is not None:
+                    record["file"] = batch_entry_name(record, media_type)
+                    if isinstance(data, dict):
+                        data = json.dumps(data)
+                    yield await run_in_threadpool(writer.add, record["file"], data)
+                manifest.append(record)
+            yield writer.add("manifest.ndjson", "".join(json.dumps(r) + "\n" for r in manifest))
+            yield writer.close()
+        finally:
+            if opened_archive is not None:
+                opened_archive.close()
+
+    async def stream_ndjson():
+        try:
+            async for record, data, media_type in run_batch(request, items, target_obj, spec, max_side):
+                yield await run_in_threadpool(ndjson_line, record, data, media_type)
+        finally:
+            if opened_archive is not None:
+                opened_archive.close()
+
+    if output == "zip":
+        return StreamingResponse(
+            stream_zip(),
+            media_type="application/zip",
+            headers={"Content-Disposition": 'attachment; filename="batch.zip"'}
+        )
+    return StreamingResponse(stream_ndjson(), media_type="application/x-ndjson")
+
+def select_video_objects(masks, scores, all_instances):
+    """Indices of the first-frame detections to track: the /recolor choice, or every confident instance"""
+    if not all_instances:
+        return [select_recolor_mask(masks, scores, verbose=False)]
+    order = sorted(range(len(scores)), key=lambda i: -float(scores[i]))
+    confident = [i for i in order if scores[i] > 0.15]
+    return (confident or order[:1])[:SAM3_VIDEO_MAX_OBJECTS]
+
+
+def video_frame_line(index, stride, frame, masks, scores, spec):
+    """
+    One NDJSON line for a tracked frame: per-object score and box, plus either the
+    recolored frame (base64) or each object's RLE mask at the frame's resolution.
+    """
+    objects = []
+    visible = []
+    for obj_id, (mask, score) in enumerate(zip(masks, scores), start=1):
+        mask = upsample_mask(mask, frame.size)
+        obj = {"id": obj_id, "score": round(float(score), 4), "bbox": mask_bbox(mask)}
+        if spec["new_color"]:
+            if obj["bbox"] is not None:
+                visible.append(mask)
+        else:
+            obj["rle"] = mask_to_rle(mask)
+        objects.append(obj)
+
+    record = {"type": "frame", "frame": index, "source_frame": index * stride, "objects": objects}
+    if spec["new_color"]:
+        result_img = change_object_color_by_name(frame, np.any(visible, axis=0), color_name=spec["new_color"]) \
+            if visible else frame
+        img_io, media_type = encode_image(
+            result_img, spec["image_format"], quality=spec["quality"], max_side=spec["preview_max_side"]
+        )
+        record["media_type"] = media_type
+        record["data"] = base64.b64encode(img_io.getvalue()).decode("ascii")
+    return (json.dumps(record) + "\n").encode("utf-8")
+
+
+@app.post("/video")
+async def track_video(
+    request: Request,
+    target_obj: str = Form(...),
+    file: Optional[UploadFile] = File(None),
+    frames: Optional[List[UploadFile]] = File(None),
+    archive: Optional[UploadFile] = File(None),
+    new_color: Optional[str] = Form(None),
+    all_instances: bool = Form(False),
+    frame_stride: int = Form(1),
+    max_frames: Optional[int] = Form(None),
+    output_format: Optional[str] = Form(None),
+    quality: Optional[int] = Form(None),
+    preview_max_side: Optional[int] = Form(None),
+    max_side: Optional[int] = Form(None)
+):
+    """
+    Track an object through a short clip (`file`), a frame sequence (`frames`, in upload order)
+    or a zip `archive` of frames (sorted by name). The text prompt is only run on the first
+    frame; later frames are segmented by the SAM 3 tracker from its memory of previous frames.
+    Results stream back as NDJSON while frames are processed: a "start" line, one "frame"
+    line per frame (recolored image with `new_color`, otherwise RLE masks) and an "end" line.
+    """
+    sources = [s for s in (file, frames, archive) if s]
+    if len(sources) != 1:
+        raise HTTPException(status_code=400, detail="Send exactly one of 'file', 'frames' or 'archive'")
+    if frame_stride < 1:
+        raise HTTPException(status_code=400, detail="'frame_stride' must be at least 1")
+    max_frames = min(max_frames or SAM3_VIDEO_MAX_FRAMES, SAM3_VIDEO_MAX_FRAMES)
+    try:
+        check_encode_options(quality, max_side=preview_max_side)
+        spec = {
+            "new_color": new_color,
+            "image_format": negotiate_image_format(output_format),
+            "quality": quality,
+            "preview_max_side": preview_max_side,
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    loop = asyncio.get_running_loop()
+    clip_path = None
+    opened_archive = None
+    fps = None
+    if file is not None:
+        clip_path = await run_in_threadpool(save_clip, file.file, file.filename)
+        fps = await run_in_threadpool(clip_fps, clip_path)
+        source = clip_frames(clip_path)
+    elif frames:
+        source = sequence_frames([f.file.read for f in frames], load_image)
+    else:
+        try:
+            opened_archive, entries = await run_in_threadpool(archive_items, archive.file)
+        except zipfile.BadZipFile:
+            raise HTTPException(status_code=400, detail="'archive' is not a valid zip file")
+        source = sequence_frames([read for _, _, read in sorted(entries, key=lambda e: e[0])], load_image)
+    reader = FrameReader(source, resize_for_inference, inference_side(max_side), frame_stride, max_frames)
+
+    def cleanup():
+        reader.close()
+        if opened_archive is not None:
+            opened_archive.close()
+        if clip_path is not None and os.path.exists(clip_path):
+            os.remove(clip_path)
+
+    try:
+        try:
+            first = await loop.run_in_executor(batch_pool, reader.read)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Could not read frames: {e}")
+        if first is None:
+            raise HTTPException(status_code=400, detail="No frames to process")
+
+        # Text prompt on the first frame only; its masks seed the tracker
+        results, inference_size = await run_segment(request, first[1], target_obj, threshold=0.15, max_side=max_side)
+        masks, scores = results["masks"], results["scores"]
+        if len(masks) == 0:
+            raise HTTPException(status_code=404, detail=f"Object '{target_obj}' not found in the first frame")
+        masks = masks.cpu().numpy() if torch.is_tensor(masks) else masks
+        scores = scores.float().cpu().numpy() if torch.is_tensor(scores) else scores
+        selected = select_video_objects(masks, scores, all_instances)
+        session = await await_inference(
+            sam3_executor.submit(start_video_session, [masks[i] for i in selected], request=request)
+        )
+    except HTTPException:
+        await run_in_threadpool(cleanup)
+        raise
+    except Exception as e:
+        await run_in_threadpool(cleanup)
+        print(f"Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    print(f"Tracking {len(selected)} '{target_obj}' object(s) in a video, up to {max_frames} frames")
+
+    async def stream():
+        start = time.perf_counter()
+        index = 0
+        pending_read = None
+        previous = None
+        try:
+            yield (json.dumps({
+                "type": "start",
+                "object": target_obj,
+                "objects": [{"id": n, "score": round(float(scores[i]), 4)} for n, i in enumerate(selected, start=1)],
+                "frame_size": list(reader.size),
+                "inference_size": list(inference_size),
+                "fps": round(fps / frame_stride, 3) if fps else None,
+            }) + "\n").encode("utf-8")
+
+            item = first
+            while item is not None:
+                frame, inference_frame = item
+                pending_read = loop.run_in_executor(batch_pool, reader.read)
+                masks, scores_now = await submit_waiting(request, track_frame, session, inference_frame)
+                current = loop.run_in_executor(
+                    batch_pool, video_frame_line, index, frame_stride, frame, masks, scores_now, spec
+                )
+                if previous is not None:
+                    yield await previous
+                previous = current
+                index += 1
+                item = await pending_read
+                pending_read = None
+            if previous is not None:
+                yield await previous
+                previous = None
+
+            elapsed = time.perf_counter() - start
+            yield (json.dumps({
+                "type": "end",
+                "frames": index,
+                "elapsed_ms": round(elapsed * 1000, 1),
+                "frames_per_second": round(index / elapsed, 2) if elapsed > 0 else None,
+            }) + "\n").encode("utf-8")
+        except ClientDisconnectedError:
+            return
+        except Exception as e:
+            print(f"Error: video tracking stopped at frame {index}: {e}")
+            yield (json.dumps({"type": "error", "frame": index, "detail": str(e)}) + "\n").encode("utf-8")
+        finally:
+            # The frame source may only be closed once no read is in flight
+            for task in (pending_read, previous):
+                if task is not None:
+                    try:
+                        await task
+                    except Exception:
+                        pass
+            await run_in_threadpool(cleanup)
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+async def build_inventory(image_id, contents, labels):
+    """Background job: segment every label on one image in a single batched pass and index the results"""
+    try:
+        image = await run_in_threadpool(load_image, contents)
+        inference_image = await run_in_threadpool(resize_for_inference, image, inference_side())
+        results = await sam3_executor.submit(
+            segment_vocabulary, inference_image, labels, threshold=0.15, chunk_size=SAM3_INVENTORY_CHUNK,
+            with_fast_counts=True
+        )
+
+        image_area = inference_image.size[0] * inference_image.size[1]
+        def pack_all():
+            return {
+                label: pack_results(
+                    result, len(filter_count_instances(result["masks"], result["scores"], image_area)),
+                    inference_image.size, image.size
+                )
+                for label, result in results.items()
+            }
+        packed = await run_in_threadpool(pack_all)
+
+        inventory.complete(image_id, packed, inference_image.size, image.size)
+        counts = {label: data["count"] for label, data in packed.items() if data["count"]}
+        print(f"Inventory ready for image {image_id[:12]}: {counts}")
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        inventory.fail(image_id, e)
+
+@app.post("/inventory")
+async def create_inventory(
+    file: Optional[UploadFile] = File(None),
+    blob_id: Optional[str] = Form(None),
+    labels: Optional[str] = Form(None)
+):
+    """
+    Start a background inventory of an image and return immediately (202).
+    `labels` is a comma-separated list (default: SAM3_INVENTORY_VOCABULARY). Once ready,
+    /count, /mask and /recolor requests for the same image and an indexed label are
+    answered from the inventory; requests arriving while it runs wait for it.
+    """
+    contents = await read_upload(file, blob_id)
+    image_id = blob_id or await run_in_threadpool(image_id_for, contents)
+    if labels:
+        vocabulary = list(dict.fromkeys(normalize_label(l) for l in labels.split(",") if l.strip()))
+    else:
+        vocabulary = SAM3_INVENTORY_VOCABULARY
+    if not vocabulary:
+        raise HTTPException(status_code=400, detail="No labels to index")
+
+    if inventory.start(image_id, vocabulary):
+        print(f"Starting inventory of image {image_id[:12]} for {len(vocabulary)} labels")
+        task = asyncio.create_task(build_inventory(image_id, contents, vocabulary))
+        inventory_tasks.add(task)
+        task.add_done_callback(inventory_tasks.discard)
+
+    summary = inventory.summary(image_id)
+    return JSONResponse(summary, status_code=200 if summary["status"] == "ready" else 202)
+
+@app.get("/inventory/{image_id}")
+async def get_inventory(image_id: str):
+    """Status of an inventory, with per-label counts, scores and boxes once ready"""
+    summary = inventory.summary(image_id)
+    if summary is None:
+        raise HTTPException(status_code=404, detail=f"No inventory for image '{image_id}'")
+    return summary
+
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "device": DEVICE}
+    return {"status": "healthy", "device": DEVICE, "queue_depth": sam3_executor.metrics()["queue_depth"]}
+
+@app.get("/metrics")
+async def metrics():
+    """Inference queue depth, utilization and counters"""
+    return {
+        "sam3_executor": sam3_executor.metrics(),
+        "refine_cache": refine_cache.metrics(),
+        "inventory": inventory.metrics(),
+        "prompt_cache": prompt_cache.metrics(),
+        "runtime": runtime_info()
+    }
 
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8002)
-
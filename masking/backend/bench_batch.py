@@ -0,0 +1,115 @@
+"""
+Throughput of /batch against one /recolor request per image, on a running masking service.
+The image set is repeated to reach --count images; per-image requests are sent with
+--concurrency parallel clients (the service batches concurrent requests on its own).
+
+    python bench_batch.py --images ./bench_images --prompt bottle --color navy --count 64
+"""
+import argparse
+import glob
+import io
+import json
+import os
+import sys
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+IMAGE_PATTERNS = ("*.jpg", "*.jpeg", "*.png", "*.webp")
+
+
+def load_images(directory, count):
+    paths = sorted(p for pattern in IMAGE_PATTERNS for p in glob.glob(os.path.join(directory, pattern)))
+    if not paths:
+        sys.exit(f"No images found in {directory}")
+    images = []
+    for i in range(count):
+        path = paths[i % len(paths)]
+        with open(path, "rb") as f:
+            images.append((f"{i:05d}_{os.path.basename(path)}", f.read()))
+    return images
+
+
+def run_single(client, url, images, args):
+    """One /recolor request per image, `args.concurrency` at a time. Returns per-request latencies."""
+    def recolor(item):
+        name, data = item
+        start = time.perf_counter()
+        response = client.post(
+            f"{url}/recolor",
+            files={"file": (name, data, "application/octet-stream")},
+            data={"target_obj": args.prompt, "new_color": args.color, "output_format": args.format}
+        )
+        return response.status_code, time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        return list(pool.map(recolor, images))
+
+
+def run_batch(client, url, images, args):
+    """One /batch request (zip archive upload, NDJSON output). Returns (statuses, time to first item)."""
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w", compression=zipfile.ZIP_STORED) as zf:
+        for name, data in images:
+            zf.writestr(name, data)
+
+    start = time.perf_counter()
+    first_item = None
+    statuses = []
+    with client.stream(
+        "POST", f"{url}/batch",
+        files={"archive": ("images.zip", archive.getvalue(), "application/zip")},
+        data={"target_obj": args.prompt, "new_color": args.color, "output_format": args.format, "output": "ndjson"}
+    ) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if not line:
+                continue
+            if first_item is None:
+                first_item = time.perf_counter() - start
+            statuses.append(json.loads(line)["status"])
+    return statuses, first_item
+
+
+def summarize(name, total_seconds, count, extra=""):
+    print(f"{name:<12}{count:>8}{total_seconds:>10.2f}{count / total_seconds:>12.2f}  {extra}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8002")
+    parser.add_argument("--images", required=True, help="Directory with benchmark images")
+    parser.add_argument("--prompt", default="bottle")
+    parser.add_argument("--color", default="navy")
+    parser.add_argument("--format", default="jpeg", help="Output image format")
+    parser.add_argument("--count", type=int, default=32, help="Number of images per run")
+    parser.add_argument("--concurrency", type=int, default=4, help="Parallel /recolor requests")
+    args = parser.parse_args()
+
+    images = load_images(args.images, args.count)
+    with httpx.Client(timeout=None) as client:
+        print(f"{len(images)} images, prompt '{args.prompt}'")
+        print(f"{'mode':<12}{'images':>8}{'seconds':>10}{'images/s':>12}")
+
+        start = time.perf_counter()
+        results = run_single(client, args.url, images, args)
+        elapsed = time.perf_counter() - start
+        latencies = sorted(latency for _, latency in results)
+        failures = sum(1 for status, _ in results if status != 200)
+        summarize("recolor", elapsed, len(images),
+                  f"p50 {latencies[len(latencies) // 2] * 1000:.0f} ms, non-200: {failures}")
+
+        start = time.perf_counter()
+        statuses, first_item = run_batch(client, args.url, images, args)
+        elapsed = time.perf_counter() - start
+        counts = {s: statuses.count(s) for s in sorted(set(statuses))}
+        summarize("batch", elapsed, len(statuses), f"first item {first_item * 1000:.0f} ms, {counts}")
+
+        executor = client.get(f"{args.url}/metrics").json()["sam3_executor"]
+        print(f"\nExecutor: {executor['batches']} batches, avg batch size {executor['avg_batch_size']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Micro-benchmark: legacy per-channel np.where recolor vs the LUT compositor.
+Runs on synthetic 4K and 12 MP frames, no model required.
+
+    python bench_compositor.py --repeats 10
+"""
+import argparse
+import time
+
+import numpy as np
+
+from compositor import composite_layers
+
+SIZES = {
+    "4K (3840x2160)": (2160, 3840),
+    "12MP (4000x3000)": (3000, 4000),
+}
+
+
+def legacy_recolor(img_np, mask, target_rgb, alpha=0.6):
+    """The original change_object_color_by_name body, kept for comparison"""
+    img_np = img_np.copy()
+    for c in range(3):
+        img_np[:, :, c] = np.where(
+            mask,
+            (img_np[:, :, c] * (1 - alpha) + target_rgb[c] * alpha).astype(np.uint8),
+            img_np[:, :, c]
+        )
+    return img_np
+
+
+def make_masks(height, width, count, rng):
+    """Elliptical object masks covering roughly 5-20% of the frame each"""
+    yy, xx = np.ogrid[:height, :width]
+    masks = []
+    for _ in range(count):
+        cy, cx = rng.integers(0, height), rng.integers(0, width)
+        ry = rng.integers(height // 10, height // 4)
+        rx = rng.integers(width // 10, width // 4)
+        masks.append(((yy - cy) / ry) ** 2 + ((xx - cx) / rx) ** 2 <= 1.0)
+    return masks
+
+
+def timeit(fn, repeats):
+    fn()  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--layers", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    colors = [[255, 0, 0], [0, 0, 255], [0, 128, 0], [255, 165, 0]]
+
+    for label, (height, width) in SIZES.items():
+        img = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+        masks = make_masks(height, width, args.layers, rng)
+        layers = [(m, colors[i % len(colors)], 0.6) for i, m in enumerate(masks)]
+
+        # Sanity check: both paths produce identical pixels for a single layer
+        expected = legacy_recolor(img, masks[0], colors[0])
+        got = composite_layers(img.copy(), layers[:1])
+        assert np.array_equal(expected, got), "compositor output differs from legacy recolor"
+
+        def run_legacy():
+            out = img
+            for m, rgb, alpha in layers:
+                out = legacy_recolor(out, m, rgb, alpha)
+
+        def run_compositor():
+            composite_layers(img.copy(), layers)
+
+        legacy_ms = timeit(run_legacy, args.repeats)
+        new_ms = timeit(run_compositor, args.repeats)
+        print(f"{label}, {args.layers} layers: legacy {legacy_ms:8.1f} ms | "
+              f"compositor {new_ms:8.1f} ms | speedup x{legacy_ms / new_ms:.1f}")
+
+
+if __name__ == "__main__":
+    main()
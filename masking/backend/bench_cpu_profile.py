@@ -0,0 +1,129 @@
+"""
+Compare SAM 3 CPU performance settings against the float32 eager baseline.
+Each configuration runs in its own process on a fixed image set and reports
+latency, peak memory and mask IoU against the baseline.
+
+    python bench_cpu_profile.py --images ./bench_images --prompt bottle --repeats 3
+"""
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Environment for each configuration (see model_utils.py)
+CONFIGS = {
+    "baseline": {"SAM3_BF16": "0", "SAM3_CHANNELS_LAST": "0", "SAM3_COMPILE": "0"},
+    "bf16": {"SAM3_BF16": "1", "SAM3_CHANNELS_LAST": "0", "SAM3_COMPILE": "0"},
+    "channels_last": {"SAM3_BF16": "0", "SAM3_CHANNELS_LAST": "1", "SAM3_COMPILE": "0"},
+    "compile": {"SAM3_BF16": "0", "SAM3_CHANNELS_LAST": "0", "SAM3_COMPILE": "1"},
+    "profile": {"SAM3_BF16": "1", "SAM3_CHANNELS_LAST": "1", "SAM3_COMPILE": "1"},
+}
+IMAGE_PATTERNS = ("*.jpg", "*.jpeg", "*.png", "*.webp")
+
+
+def peak_memory_mb():
+    """Peak resident memory of this process, if the platform exposes it"""
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / (1024 * 1024)
+    except ImportError:
+        return None
+
+
+def run_worker(args):
+    """Benchmark one configuration (environment already set by the parent)"""
+    from PIL import Image
+    import model_utils
+
+    model_utils.load_models()
+    results = {"latency_ms": {}, "masks": {}}
+    masks_out = {}
+
+    for path in args.image_paths:
+        image = model_utils.resize_for_inference(Image.open(path).convert("RGB"), args.max_side)
+        model_utils.segment(image, args.prompt)  # warm-up for this input size
+        timings = []
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            result = model_utils.segment(image, args.prompt)
+            timings.append((time.perf_counter() - start) * 1000)
+        results["latency_ms"][path] = timings
+
+        # Union of all instances is stable against instance ordering between configs
+        masks = result["masks"]
+        union = masks.any(dim=0).cpu().numpy() if len(masks) else np.zeros(image.size[::-1], dtype=bool)
+        masks_out[os.path.basename(path)] = union
+
+    results["peak_memory_mb"] = peak_memory_mb()
+    np.savez_compressed(os.path.join(args.out_dir, f"{args.worker}.npz"), **masks_out)
+    with open(os.path.join(args.out_dir, f"{args.worker}.json"), "w") as f:
+        json.dump(results, f)
+
+
+def mask_iou(a, b):
+    union = np.logical_or(a, b).sum()
+    return 1.0 if union == 0 else float(np.logical_and(a, b).sum() / union)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", required=True, help="Directory with benchmark images")
+    parser.add_argument("--prompt", default="object")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--max-side", type=int, default=1536)
+    parser.add_argument("--configs", default="baseline,bf16,channels_last,compile,profile")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--out-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    args.image_paths = sorted(p for pattern in IMAGE_PATTERNS for p in glob.glob(os.path.join(args.images, pattern)))
+    if not args.image_paths:
+        sys.exit(f"No images found in {args.images}")
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    configs = [c.strip() for c in args.configs.split(",") if c.strip()]
+    if "baseline" not in configs:
+        configs.insert(0, "baseline")
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        for name in configs:
+            print(f"Running '{name}'...")
+            env = {**os.environ, **CONFIGS[name]}
+            subprocess.run(
+                [sys.executable, __file__, "--worker", name, "--out-dir", out_dir,
+                 "--images", args.images, "--prompt", args.prompt,
+                 "--repeats", str(args.repeats), "--max-side", str(args.max_side)],
+                env=env, check=True
+            )
+
+        baseline_masks = np.load(os.path.join(out_dir, "baseline.npz"))
+        print(f"\n{len(args.image_paths)} images, prompt '{args.prompt}', {args.repeats} repeats")
+        print(f"{'config':<15}{'mean ms':>10}{'p50 ms':>10}{'peak MB':>10}{'mIoU':>8}")
+        for name in configs:
+            with open(os.path.join(out_dir, f"{name}.json")) as f:
+                results = json.load(f)
+            masks = np.load(os.path.join(out_dir, f"{name}.npz"))
+            timings = [t for per_image in results["latency_ms"].values() for t in per_image]
+            ious = [mask_iou(baseline_masks[k], masks[k]) for k in baseline_masks.files]
+            peak = results["peak_memory_mb"]
+            print(f"{name:<15}{np.mean(timings):>10.1f}{np.median(timings):>10.1f}"
+                  f"{(f'{peak:.0f}' if peak else 'n/a'):>10}{np.mean(ious):>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+import numpy as np
+
+from encoding import mask_bbox
+
+_CHANNELS = np.arange(3)[None, :]
+_LEVELS = np.arange(256, dtype=np.float64)
+
+
+def blend_lut(rgb, alpha):
+    """
+    Precompute a [3, 256] uint8 table mapping every source level to its blended value.
+    Matches the historical `(v * (1 - alpha) + c * alpha).astype(np.uint8)` truncation.
+    """
+    alpha = float(np.clip(alpha, 0.0, 1.0))
+    target = np.asarray(rgb, dtype=np.float64)[:, None]
+    return (_LEVELS[None, :] * (1 - alpha) + target * alpha).astype(np.uint8)
+
+
+def composite_layers(img_np, layers):
+    """
+    Blend any number of (mask, rgb, alpha) layers into an HxWx3 uint8 image, in place.
+    Layers are applied in order, each only inside its mask bounding box, using a
+    lookup table so no full-frame float temporaries are created.
+    """
+    if img_np.dtype != np.uint8 or img_np.ndim != 3 or img_np.shape[2] < 3:
+        raise ValueError("composite_layers expects an HxWx3 uint8 image")
+
+    for mask, rgb, alpha in layers:
+        mask = np.asarray(mask, dtype=bool)
+        bbox = mask_bbox(mask)
+        if bbox is None:
+            continue
+        x_min, y_min, x_max, y_max = bbox
+
+        region = img_np[y_min:y_max, x_min:x_max, :3]
+        region_mask = mask[y_min:y_max, x_min:x_max]
+        lut = blend_lut(rgb, alpha)
+
+        # [N, 3] pixels -> lut[channel, value] in one broadcast gather
+        region[region_mask] = lut[_CHANNELS, region[region_mask]]
+
+    return img_np
@@ -0,0 +1,326 @@
+import base64
+import io
+import os
+import zipfile
+import zlib
+
+import numpy as np
+from PIL import Image
+
+# Output formats understood by /mask
+MASK_FORMATS = ("png", "rle", "bitpack", "labelmap")
+
+# Accept header media types mapped to /mask output formats
+ACCEPT_MASK_FORMATS = {
+    "application/vnd.coco-rle+json": "rle",
+    "application/vnd.bitpacked-mask+json": "bitpack",
+    "application/vnd.labelmap+json": "labelmap",
+    "image/png": "png",
+}
+
+# Output formats understood by /recolor, with their media types
+IMAGE_FORMATS = {
+    "png": "image/png",
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+}
+IMAGE_FORMAT_ALIASES = {"jpg": "jpeg"}
+
+# Encoder defaults, overridable per request
+PNG_COMPRESS_LEVEL = int(os.getenv("PNG_COMPRESS_LEVEL", "3"))
+JPEG_QUALITY = int(os.getenv("JPEG_QUALITY", "85"))
+WEBP_QUALITY = int(os.getenv("WEBP_QUALITY", "80"))
+WEBP_METHOD = int(os.getenv("WEBP_METHOD", "2"))  # 0 (fast) .. 6 (small)
+
+
+def negotiate_mask_format(requested=None, accept_header=None):
+    """
+    Pick the /mask output format from an explicit parameter or the Accept header.
+    The explicit parameter wins; PNG stays the default for older clients.
+    """
+    if requested:
+        fmt = requested.strip().lower()
+        if fmt not in MASK_FORMATS:
+            raise ValueError(f"Unknown mask format '{requested}'. Expected one of {list(MASK_FORMATS)}")
+        return fmt
+
+    if accept_header:
+        for part in accept_header.split(","):
+            media_type = part.split(";")[0].strip().lower()
+            if media_type in ACCEPT_MASK_FORMATS:
+                return ACCEPT_MASK_FORMATS[media_type]
+
+    return "png"
+
+
+def negotiate_image_format(requested=None, accept_header=None):
+    """
+    Pick the /recolor output format from an explicit parameter or the Accept header.
+    The first supported image type in the Accept header wins; PNG is the default.
+    """
+    if requested:
+        fmt = requested.strip().lower()
+        fmt = IMAGE_FORMAT_ALIASES.get(fmt, fmt)
+        if fmt not in IMAGE_FORMATS:
+            raise ValueError(f"Unknown image format '{requested}'. Expected one of {list(IMAGE_FORMATS)}")
+        return fmt
+
+    if accept_header:
+        media_types = {v: k for k, v in IMAGE_FORMATS.items()}
+        for part in accept_header.split(","):
+            media_type = part.split(";")[0].strip().lower()
+            if media_type in media_types:
+                return media_types[media_type]
+
+    return "png"
+
+
+def check_encode_options(quality=None, compress_level=None, max_side=None):
+    """Raise ValueError for encoder options out of range (None means the default)"""
+    if quality is not None and not 1 <= quality <= 100:
+        raise ValueError("'quality' must be between 1 and 100")
+    if compress_level is not None and not 0 <= compress_level <= 9:
+        raise ValueError("'compress_level' must be between 0 and 9")
+    if max_side is not None and max_side <= 0:
+        raise ValueError("'preview_max_side' must be positive")
+
+
+def encode_image(image, fmt="png", quality=None, compress_level=None, max_side=None):
+    """
+    Encode a PIL image for an HTTP response, optionally downscaled so its longest side is `max_side`.
+    Blocking and CPU-bound: call it from a worker thread, not the event loop.
+    Returns (BytesIO, media_type). See check_encode_options for the accepted ranges.
+    """
+    if max_side is not None and max(image.size) > max_side:
+        image = image.copy()
+        image.thumbnail((max_side, max_side), Image.Resampling.BILINEAR, reducing_gap=2.0)
+
+    img_io = io.BytesIO()
+    if fmt == "jpeg":
+        image.convert("RGB").save(img_io, 'JPEG', quality=JPEG_QUALITY if quality is None else quality)
+    elif fmt == "webp":
+        image.save(img_io, 'WEBP', quality=WEBP_QUALITY if quality is None else quality, method=WEBP_METHOD)
+    else:
+        level = PNG_COMPRESS_LEVEL if compress_level is None else compress_level
+        image.save(img_io, 'PNG', compress_level=level)
+    img_io.seek(0)
+    return img_io, IMAGE_FORMATS[fmt]
+
+
+def mask_bbox(mask):
+    """Tight [x_min, y_min, x_max, y_max] box (exclusive max) of a boolean mask, or None if empty"""
+    rows = np.flatnonzero(mask.any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero(mask.any(axis=0))
+    return [int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1]
+
+
+def _rle_counts_to_string(counts):
+    """LEB128-like compression used by pycocotools (rleToString)"""
+    chars = []
+    for i, x in enumerate(counts):
+        x = int(x)
+        if i > 2:
+            x -= int(counts[i - 2])
+        more = True
+        while more:
+            c = x & 0x1f
+            x >>= 5
+            more = (x != -1) if (c & 0x10) else (x != 0)
+            if more:
+                c |= 0x20
+            chars.append(chr(c + 48))
+    return "".join(chars)
+
+
+def mask_to_rle(mask):
+    """
+    Encode a boolean [H, W] mask as COCO compressed RLE.
+    Runs are column-major and start with background, exactly like pycocotools.
+    """
+    height, width = mask.shape
+    flat = np.asarray(mask, dtype=bool).T.ravel()
+    if flat.size == 0:
+        return {"size": [height, width], "counts": ""}
+
+    changes = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    boundaries = np.concatenate(([0], changes, [flat.size]))
+    counts = np.diff(boundaries)
+    if flat[0]:
+        counts = np.concatenate(([0], counts))
+
+    return {"size": [height, width], "counts": _rle_counts_to_string(counts.tolist())}
+
+
+def crop_to_rle(crop, box, size):
+    """
+    COCO compressed RLE of a mask given only as its bbox crop, for an image of `size` (W, H).
+    Same result as mask_to_rle on the full mask, without allocating it.
+    """
+    width, height = size
+    x_min, y_min = box[0], box[1]
+    columns = np.asarray(crop, dtype=bool).T
+    crop_w, crop_h = columns.shape
+    padded = np.zeros((crop_w, crop_h + 2), dtype=bool)
+    padded[:, 1:-1] = columns
+    # Starts and ends of foreground runs, as positions in the column-major full mask
+    changes = np.flatnonzero(padded[:, 1:] != padded[:, :-1])
+    positions = (x_min + changes // (crop_h + 1)) * height + y_min + changes % (crop_h + 1)
+    # A run reaching the bottom of a column and one starting at the top of the next are one run
+    positions, counts = np.unique(positions, return_counts=True)
+    positions = positions[(counts == 1) & (positions < width * height)]
+    boundaries = np.concatenate(([0], positions, [width * height]))
+    return {"size": [height, width], "counts": _rle_counts_to_string(np.diff(boundaries).tolist())}
+
+
+def _rle_string_to_counts(s):
+    """Inverse of _rle_counts_to_string (pycocotools rleFrString)"""
+    counts = []
+    pos = 0
+    while pos < len(s):
+        x, shift, more = 0, 0, True
+        while more:
+            c = ord(s[pos]) - 48
+            x |= (c & 0x1f) << shift
+            more = bool(c & 0x20)
+            pos += 1
+            shift += 5
+            if not more and (c & 0x10):
+                x |= -1 << shift
+        if len(counts) > 2:
+            x += counts[-2]
+        counts.append(x)
+    return counts
+
+
+def rle_to_mask(rle):
+    """Decode COCO compressed RLE (as produced by mask_to_rle) to a boolean [H, W] mask"""
+    height, width = rle["size"]
+    counts = _rle_string_to_counts(rle["counts"])
+    values = np.arange(len(counts)) % 2 == 1
+    flat = np.repeat(values, counts)
+    return flat.reshape(width, height).T
+
+
+def mask_to_bitpack(mask, bbox):
+    """Bit-pack (np.packbits, big bit order) the bbox crop of a boolean mask, base64 encoded"""
+    x_min, y_min, x_max, y_max = bbox
+    crop = np.ascontiguousarray(mask[y_min:y_max, x_min:x_max], dtype=bool)
+    packed = np.packbits(crop, axis=None)
+    return {
+        "shape": [y_max - y_min, x_max - x_min],
+        "data": base64.b64encode(packed.tobytes()).decode("ascii"),
+    }
+
+
+def masks_to_labelmap(masks, scores):
+    """
+    Paint instances into one label map (0 = background, i + 1 = instance i).
+    Higher-scoring instances are painted last so they win on overlaps.
+    """
+    count = len(masks)
+    height, width = masks.shape[1:] if count else (0, 0)
+    dtype = np.uint8 if count < 256 else np.uint16
+    labelmap = np.zeros((height, width), dtype=dtype)
+    for idx in np.argsort(scores, kind="stable"):
+        labelmap[masks[idx]] = idx + 1
+    return labelmap
+
+
+def instance_metadata(masks, scores):
+    """Per-instance id, score, bbox and pixel area"""
+    instances = []
+    for idx, mask in enumerate(masks):
+        instances.append({
+            "id": idx + 1,
+            "score": round(float(scores[idx]), 4),
+            "bbox": mask_bbox(mask),
+            "area": int(np.count_nonzero(mask)),
+        })
+    return instances
+
+
+def encode_masks(masks, scores, fmt):
+    """
+    Build the JSON payload for the compact /mask formats.
+    `masks` is a boolean [N, H, W] array and `scores` a float [N] array.
+    """
+    masks = np.asarray(masks, dtype=bool)
+    scores = np.asarray(scores, dtype=np.float32)
+    height, width = masks.shape[1:]
+    instances = instance_metadata(masks, scores)
+
+    payload = {"format": fmt, "height": int(height), "width": int(width)}
+
+    if fmt == "rle":
+        for inst, mask in zip(instances, masks):
+            inst["rle"] = mask_to_rle(mask)
+
+    elif fmt == "bitpack":
+        payload["bitorder"] = "big"
+        for inst, mask in zip(instances, masks):
+            inst["mask"] = mask_to_bitpack(mask, inst["bbox"]) if inst["bbox"] else None
+
+    elif fmt == "labelmap":
+        labelmap = masks_to_labelmap(masks, scores)
+        payload["dtype"] = labelmap.dtype.name
+        payload["encoding"] = "zlib+base64"
+        payload["data"] = base64.b64encode(zlib.compress(labelmap.tobytes(), 1)).decode("ascii")
+
+    else:
+        raise ValueError(f"'{fmt}' is not a compact mask format")
+
+    payload["instances"] = instances
+    return payload
+
+
+def mask_to_png(mask, compress_level=None):
+    """Legacy /mask output: a single black/white PNG"""
+    mask_img = Image.fromarray(np.asarray(mask, dtype=np.uint8) * 255, mode='L')
+    img_io, _ = encode_image(mask_img, "png", compress_level=compress_level)
+    return img_io
+
+
+class _ZipBuffer:
+    """Write-only, non-seekable sink for zipfile; written bytes are collected until drained"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ZipStreamWriter:
+    """
+    Build a zip archive incrementally for a streaming response: after each `add`,
+    `drain` returns the bytes produced so far. Entries are stored uncompressed since
+    they are already compressed images or small JSON documents.
+    """
+
+    def __init__(self):
+        self._buffer = _ZipBuffer()
+        self._zip = zipfile.ZipFile(self._buffer, mode="w", compression=zipfile.ZIP_STORED)
+
+    def add(self, name, data):
+        self._zip.writestr(name, data)
+        return self._buffer.drain()
+
+    def close(self):
+        self._zip.close()
+        return self._buffer.drain()
@@ -0,0 +1,224 @@
+import asyncio
+import collections
+import functools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+
+# Executor configuration
+SAM3_WORKERS = int(os.getenv("SAM3_WORKERS", "1"))
+SAM3_QUEUE_SIZE = int(os.getenv("SAM3_QUEUE_SIZE", "16"))
+
+# Dynamic batching: how long a worker waits to fill a batch, and its maximum size
+SAM3_BATCH_WINDOW_MS = float(os.getenv("SAM3_BATCH_WINDOW_MS", "10"))
+SAM3_MAX_BATCH = int(os.getenv("SAM3_MAX_BATCH", "4"))
+
+# How often a waiting request checks whether its client went away
+DISCONNECT_POLL_SECONDS = 0.25
+
+
+class QueueFullError(Exception):
+    """Raised when the inference queue is at capacity"""
+
+
+class ClientDisconnectedError(Exception):
+    """Raised when the caller disconnected while its job was waiting"""
+
+
+class _Job:
+    __slots__ = ("fn", "item", "batch_key", "future", "enqueued_at")
+
+    def __init__(self, fn, future, item=None, batch_key=None):
+        self.fn = fn
+        self.item = item
+        self.batch_key = batch_key
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class InferenceExecutor:
+    """
+    Runs blocking SAM 3 calls on dedicated worker threads behind a bounded FIFO queue.
+    The event loop only awaits results, so /health and other requests stay responsive.
+    Jobs whose client disconnects before they start are dropped.
+
+    Batchable jobs (submit_batched) that share a batch key are grouped: a worker holding
+    one waits up to `batch_window_ms` for more and runs them as a single call.
+    """
+
+    def __init__(self, workers=SAM3_WORKERS, queue_size=SAM3_QUEUE_SIZE,
+                 batch_window_ms=SAM3_BATCH_WINDOW_MS, max_batch=SAM3_MAX_BATCH):
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+        self.batch_window = max(0.0, batch_window_ms) / 1000
+        self.max_batch = max(1, max_batch)
+        self._queue = None
+        # Jobs pulled while filling a batch that belong to another batch key
+        self._deferred = collections.deque()
+        # Jobs set aside by a batch that is still being collected (still count as queued)
+        self._skipped = 0
+        self._pool = None
+        self._tasks = []
+        self._in_flight = 0
+        self._stats = {"completed": 0, "failed": 0, "cancelled": 0, "rejected": 0, "batches": 0}
+        self._wait_total = 0.0
+        self._run_total = 0.0
+        self._batched_jobs = 0
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="sam3")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        print(f"SAM 3 executor started: {self.workers} worker(s), queue size {self.queue_size}, "
+              f"torch threads {torch.get_num_threads()}")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    async def submit(self, fn, *args, request=None, **kwargs):
+        """
+        Queue `fn(*args, **kwargs)` and wait for its result.
+        If `request` is given, the job is cancelled when the client disconnects.
+        """
+        return await self._enqueue(_Job(functools.partial(fn, *args, **kwargs), self._new_future()), request)
+
+    async def submit_batched(self, batch_fn, item, batch_key, request=None):
+        """
+        Queue one item for `batch_fn(list_of_items) -> list_of_results` and wait for its result.
+        Concurrent items with an equal `batch_key` may be run together in one call.
+        """
+        return await self._enqueue(_Job(batch_fn, self._new_future(), item=item, batch_key=batch_key), request)
+
+    def _new_future(self):
+        return asyncio.get_running_loop().create_future()
+
+    def _depth(self):
+        return (self._queue.qsize() if self._queue is not None else 0) + len(self._deferred) + self._skipped
+
+    async def _enqueue(self, job, request):
+        if self._queue is None:
+            raise RuntimeError("Inference executor not started")
+        if self._depth() >= self.queue_size:
+            self._stats["rejected"] += 1
+            raise QueueFullError(f"Inference queue is full ({self.queue_size} pending)")
+
+        self._queue.put_nowait(job)
+        return await self._wait(job.future, request)
+
+    async def _wait(self, future, request):
+        try:
+            if request is None:
+                return await future
+            while True:
+                done, _ = await asyncio.wait({future}, timeout=DISCONNECT_POLL_SECONDS)
+                if done:
+                    return future.result()
+                if await request.is_disconnected():
+                    # Queued jobs are skipped; a running forward pass finishes and is discarded
+                    future.cancel()
+                    self._stats["cancelled"] += 1
+                    raise ClientDisconnectedError("Client disconnected before inference finished")
+        except asyncio.CancelledError:
+            # The awaiting task was cancelled (e.g. a request timeout): drop the job too
+            future.cancel()
+            if future.cancelled():
+                self._stats["cancelled"] += 1
+            raise
+
+    async def _next_job(self, timeout=None):
+        """Next live job (deferred first), or None if `timeout` expires"""
+        while True:
+            if self._deferred:
+                job = self._deferred.popleft()
+            elif timeout is None:
+                job = await self._queue.get()
+            elif timeout <= 0:
+                if self._queue.empty():
+                    return None
+                job = self._queue.get_nowait()
+            else:
+                try:
+                    job = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    return None
+            if not job.future.cancelled():
+                return job
+
+    async def _collect_batch(self, first):
+        """
+        Gather jobs sharing `first.batch_key` until the window closes or the batch is full.
+        Jobs with other keys are skipped over, then put back ahead of the queue in their order.
+        """
+        batch = [first]
+        skipped = []
+        deadline = time.monotonic() + self.batch_window
+        try:
+            while len(batch) < self.max_batch:
+                job = await self._next_job(timeout=deadline - time.monotonic())
+                if job is None:
+                    break
+                if job.batch_key != first.batch_key:
+                    skipped.append(job)
+                    self._skipped += 1
+                    continue
+                batch.append(job)
+        finally:
+            # Skipped jobs are older than anything left in the queue
+            self._deferred.extendleft(reversed(skipped))
+            self._skipped -= len(skipped)
+        return batch
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._next_job()
+            batch = await self._collect_batch(job) if job.batch_key is not None else [job]
+
+            started = time.monotonic()
+            self._wait_total += sum(started - j.enqueued_at for j in batch)
+            self._in_flight += len(batch)
+            try:
+                if job.batch_key is None:
+                    results = [await loop.run_in_executor(self._pool, job.fn)]
+                else:
+                    items = [j.item for j in batch]
+                    results = await loop.run_in_executor(self._pool, job.fn, items)
+                    self._stats["batches"] += 1
+                    self._batched_jobs += len(batch)
+            except Exception as e:
+                self._stats["failed"] += len(batch)
+                for j in batch:
+                    if not j.future.done():
+                        j.future.set_exception(e)
+            else:
+                self._stats["completed"] += len(batch)
+                for j, result in zip(batch, results):
+                    if not j.future.done():
+                        j.future.set_result(result)
+            finally:
+                self._in_flight -= len(batch)
+                self._run_total += (time.monotonic() - started) * len(batch)
+
+    def metrics(self):
+        """Queue depth, utilization and counters for /metrics"""
+        finished = self._stats["completed"] + self._stats["failed"]
+        return {
+            "workers": self.workers,
+            "queue_depth": self._depth(),
+            "queue_capacity": self.queue_size,
+            "in_flight": self._in_flight,
+            **self._stats,
+            "avg_batch_size": round(self._batched_jobs / self._stats["batches"], 2) if self._stats["batches"] else 0.0,
+            "batch_window_ms": self.batch_window * 1000,
+            "max_batch": self.max_batch,
+            "avg_wait_ms": round(self._wait_total / finished * 1000, 1) if finished else 0.0,
+            "avg_run_ms": round(self._run_total / finished * 1000, 1) if finished else 0.0,
+            "torch_threads": torch.get_num_threads(),
+        }
@@ -0,0 +1,177 @@
+import asyncio
+import collections
+import os
+import time
+
+import numpy as np
+import torch
+
+from encoding import mask_to_rle, rle_to_mask
+from prompt_cache import normalize_prompt
+
+# Labels are matched like cached prompts: "Bottles" finds the "bottle" inventory entry
+normalize_label = normalize_prompt
+
+
+# Objects segmented in the background right after an upload (comma-separated)
+DEFAULT_VOCABULARY = "person,car,bottle,cup,chair,table,dog,cat,bag,phone,book,shirt"
+SAM3_INVENTORY_VOCABULARY = [
+    normalize_label(label) for label in os.getenv("SAM3_INVENTORY_VOCABULARY", DEFAULT_VOCABULARY).split(",")
+    if label.strip()
+]
+# Number of images whose inventory is kept (LRU)
+SAM3_INVENTORY_SIZE = int(os.getenv("SAM3_INVENTORY_SIZE", "64"))
+# Prompts per detector pass while building an inventory
+SAM3_INVENTORY_CHUNK = int(os.getenv("SAM3_INVENTORY_CHUNK", "8"))
+# Longest a request waits (s) for a running inventory job before running SAM 3 itself
+SAM3_INVENTORY_WAIT = float(os.getenv("SAM3_INVENTORY_WAIT", "20"))
+
+
+def pack_results(result, count, inference_size, original_size):
+    """
+    Compact form of one label's SAM 3 result: RLE masks at inference resolution,
+    scores, boxes in original pixels, the filtered instance count (/count mode=masks)
+    and the result's "fast_count" (mode=fast), if any.
+    """
+    masks = result["masks"].cpu().numpy() if torch.is_tensor(result["masks"]) else result["masks"]
+    scores = result["scores"].float().cpu().numpy() if torch.is_tensor(result["scores"]) else result["scores"]
+    boxes = result["boxes"].float().cpu().numpy() if torch.is_tensor(result["boxes"]) else result["boxes"]
+    sx, sy = original_size[0] / inference_size[0], original_size[1] / inference_size[1]
+
+    instances = []
+    for mask, score, box in zip(masks, scores, boxes):
+        instances.append({
+            "score": round(float(score), 4),
+            "box": [round(float(box[0]) * sx, 1), round(float(box[1]) * sy, 1),
+                    round(float(box[2]) * sx, 1), round(float(box[3]) * sy, 1)],
+            "rle": mask_to_rle(mask),
+        })
+    return {"count": count, "fast_count": result.get("fast_count"), "instances": instances}
+
+
+def unpack_results(data, inference_size):
+    """Rebuild the masks and scores of a post-processed SAM 3 result from pack_results output"""
+    width, height = inference_size
+    instances = data["instances"]
+    if not instances:
+        return {
+            "masks": torch.zeros((0, height, width), dtype=torch.bool),
+            "scores": torch.zeros(0),
+        }
+    return {
+        "masks": torch.from_numpy(np.stack([rle_to_mask(inst["rle"]) for inst in instances])),
+        "scores": torch.tensor([inst["score"] for inst in instances]),
+    }
+
+
+class InventoryStore:
+    """
+    Per-image object inventories keyed by image id, kept in an LRU.
+    An entry is "pending" while its background job runs, then "ready" (or "failed").
+    Lookups for a label that is still being computed wait for the job instead of
+    starting a second cold SAM 3 call. Only used from the event loop.
+    """
+
+    def __init__(self, max_entries=SAM3_INVENTORY_SIZE, max_wait=SAM3_INVENTORY_WAIT):
+        self.max_entries = max(1, max_entries)
+        self.max_wait = max_wait
+        self._entries = collections.OrderedDict()
+        self._stats = {"jobs": 0, "failed": 0, "hits": 0, "misses": 0, "evictions": 0, "wait_timeouts": 0}
+
+    def start(self, image_id, labels):
+        """Register a job for `image_id`. Returns False if one already exists (and did not fail)."""
+        entry = self._entries.get(image_id)
+        if entry is not None and entry["status"] != "failed":
+            self._entries.move_to_end(image_id)
+            return False
+
+        self._entries[image_id] = {
+            "status": "pending",
+            "labels": list(labels),
+            "results": {},
+            "inference_size": None,
+            "original_size": None,
+            "error": None,
+            "started_at": time.time(),
+            "elapsed_ms": None,
+            "done": asyncio.Event(),
+        }
+        self._entries.move_to_end(image_id)
+        self._stats["jobs"] += 1
+        while len(self._entries) > self.max_entries:
+            _, evicted = self._entries.popitem(last=False)
+            evicted["done"].set()
+            self._stats["evictions"] += 1
+        return True
+
+    def complete(self, image_id, results, inference_size, original_size):
+        entry = self._entries.get(image_id)
+        if entry is None:
+            return
+        entry.update(
+            status="ready", results=results, inference_size=inference_size, original_size=original_size,
+            elapsed_ms=round((time.time() - entry["started_at"]) * 1000, 1)
+        )
+        entry["done"].set()
+
+    def fail(self, image_id, error):
+        entry = self._entries.get(image_id)
+        if entry is None:
+            return
+        entry.update(status="failed", error=str(error))
+        entry["done"].set()
+        self._stats["failed"] += 1
+
+    async def lookup(self, image_id, label):
+        """
+        (label result, inference_size) from the inventory, or None if the label is not indexed.
+        Waits when the label is part of a job that is still running, for at most `max_wait`
+        seconds (a miss after that, so the caller runs SAM 3 itself).
+        """
+        label = normalize_label(label)
+        entry = self._entries.get(image_id)
+        if entry is None or label not in entry["labels"]:
+            self._stats["misses"] += 1
+            return None
+        self._entries.move_to_end(image_id)
+        if entry["status"] == "pending":
+            try:
+                await asyncio.wait_for(entry["done"].wait(), timeout=self.max_wait)
+            except asyncio.TimeoutError:
+                self._stats["misses"] += 1
+                self._stats["wait_timeouts"] += 1
+                return None
+        if entry["status"] != "ready" or label not in entry["results"]:
+            self._stats["misses"] += 1
+            return None
+        self._stats["hits"] += 1
+        return entry["results"][label], entry["inference_size"]
+
+    def summary(self, image_id):
+        """Public view of an inventory (counts and boxes, no masks), or None"""
+        entry = self._entries.get(image_id)
+        if entry is None:
+            return None
+        summary = {
+            "image_id": image_id,
+            "status": entry["status"],
+            "labels": entry["labels"],
+            "elapsed_ms": entry["elapsed_ms"],
+        }
+        if entry["status"] == "ready":
+            summary["original_size"] = list(entry["original_size"])
+            summary["inference_size"] = list(entry["inference_size"])
+            summary["objects"] = {
+                label: {
+                    "count": data["count"],
+                    "instances": [{"score": inst["score"], "box": inst["box"]} for inst in data["instances"]],
+                }
+                for label, data in entry["results"].items()
+            }
+        elif entry["status"] == "failed":
+            summary["error"] = entry["error"]
+        return summary
+
+    def metrics(self):
+        statuses = collections.Counter(e["status"] for e in self._entries.values())
+        return {"entries": len(self._entries), "capacity": self.max_entries, **dict(statuses), **self._stats}
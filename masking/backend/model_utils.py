@@ -0,0 +1,474 @@
+import os
+import contextlib
+import numpy as np
+import torch
+import torch.nn.functional as F
+from PIL import Image
+from transformers import (
+    Sam3Processor, Sam3Model, Sam3TrackerProcessor, Sam3TrackerModel, Sam3TrackerVideoProcessor, Sam3TrackerVideoModel
+)
+from transformers.modeling_outputs import BaseModelOutputWithPooling
+from dotenv import load_dotenv
+
+from encoding import mask_bbox
+from prompt_cache import PromptCache, SAM3_PROMPT_VOCABULARY
+
+# Load environment variables
+load_dotenv()
+
+# Model configuration
+MODEL_ID = "./models/sam3"
+MY_TOKEN = os.getenv("HF_TOKEN")
+DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+
+# Longest image side handed to SAM 3 (0 disables the cap). SAM 3 works at a fixed
+# 1008 px input anyway, so larger uploads only cost memory in pre/post-processing.
+SAM3_MAX_INFERENCE_SIDE = int(os.getenv("SAM3_MAX_INFERENCE_SIDE", "1536"))
+# Upper bound for per-request overrides
+SAM3_MAX_INFERENCE_SIDE_LIMIT = int(os.getenv("SAM3_MAX_INFERENCE_SIDE_LIMIT", "4096"))
+
+# Thread settings (0 = torch default). Intra-op threads parallelize a single op,
+# inter-op threads run independent ops concurrently.
+SAM3_TORCH_THREADS = int(os.getenv("SAM3_TORCH_THREADS", "0"))
+SAM3_INTEROP_THREADS = int(os.getenv("SAM3_INTEROP_THREADS", "0"))
+
+
+def _env_flag(name, default):
+    return os.getenv(name, "1" if default else "0").strip().lower() in ("1", "true", "yes")
+
+
+# Opt-in CPU performance profile: SAM3_CPU_PROFILE=1 turns on all three options,
+# each of which can also be toggled on its own.
+SAM3_CPU_PROFILE = _env_flag("SAM3_CPU_PROFILE", False)
+SAM3_BF16 = _env_flag("SAM3_BF16", SAM3_CPU_PROFILE)
+SAM3_CHANNELS_LAST = _env_flag("SAM3_CHANNELS_LAST", SAM3_CPU_PROFILE)
+SAM3_COMPILE = _env_flag("SAM3_COMPILE", SAM3_CPU_PROFILE)
+
+print(f"Using device: {DEVICE}")
+
+# Global model and processor
+processor = None
+model = None
+# Module used for forward passes: `model` itself, or its torch.compile wrapper
+forward_model = None
+# Text encoder outputs per normalized prompt, shared by every SAM 3 entry point
+prompt_cache = PromptCache()
+# Point/box prompt model for /refine, loaded on first use
+tracker_processor = None
+tracker_model = None
+# Memory-based video tracker for /video, loaded on first use
+video_processor = None
+video_model = None
+
+
+def configure_threads():
+    """Apply the configured torch thread counts (inter-op must be set before any parallel work)"""
+    if SAM3_INTEROP_THREADS > 0:
+        try:
+            torch.set_interop_threads(SAM3_INTEROP_THREADS)
+        except RuntimeError as e:
+            print(f"Could not set inter-op threads: {e}")
+    if SAM3_TORCH_THREADS > 0:
+        torch.set_num_threads(SAM3_TORCH_THREADS)
+
+
+def runtime_info():
+    """Effective runtime settings, reported by /metrics"""
+    return {
+        "device": DEVICE,
+        "bf16_autocast": SAM3_BF16 and DEVICE == "cpu",
+        "channels_last": SAM3_CHANNELS_LAST,
+        "compiled": forward_model is not None and forward_model is not model,
+        "intra_op_threads": torch.get_num_threads(),
+        "inter_op_threads": torch.get_num_interop_threads(),
+    }
+
+
+def load_models(warmup_batch_sizes=(1,)):
+    global processor, model, forward_model
+    if processor is None or model is None:
+        configure_threads()
+        print("Loading SAM 3 models...")
+        processor = Sam3Processor.from_pretrained(MODEL_ID, token=MY_TOKEN)
+        model = Sam3Model.from_pretrained(MODEL_ID, token=MY_TOKEN).to(DEVICE).eval()
+
+        if SAM3_CHANNELS_LAST:
+            model = model.to(memory_format=torch.channels_last)
+        forward_model = model
+        if SAM3_COMPILE:
+            print("Compiling SAM 3 with torch.compile...")
+            # Batch size (dynamic batching, inventory prompt chunks) varies per call: one
+            # shape-generic graph instead of a recompilation for every new size
+            forward_model = torch.compile(model, dynamic=True)
+        print("Models loaded and ready.")
+
+        if SAM3_COMPILE or SAM3_BF16:
+            warm_up(warmup_batch_sizes)
+        warm_prompts()
+
+
+def warm_prompts(vocabulary=SAM3_PROMPT_VOCABULARY):
+    """Encode the common object vocabulary into the prompt cache"""
+    print(f"Encoding {len(vocabulary)} common prompts...")
+    prompt_cache.warm(vocabulary, _encode_prompt)
+
+
+def warm_up(batch_sizes=(1,)):
+    """Run dummy forward passes so compilation and allocator warm-up happen at startup"""
+    print(f"Warming up SAM 3 (batch sizes {list(batch_sizes)})...")
+    blank = Image.new("RGB", (640, 480), (127, 127, 127))
+    for batch_size in batch_sizes:
+        segment_batch([(blank, "object")] * batch_size)
+    print("Warm-up done.")
+
+
+def _autocast():
+    """bf16 autocast on CPU when enabled; a no-op otherwise"""
+    if SAM3_BF16 and DEVICE == "cpu":
+        return torch.autocast(device_type="cpu", dtype=torch.bfloat16)
+    return contextlib.nullcontext()
+
+
+def run_model(inputs):
+    """
+    Forward pass with the configured runtime profile.
+    Floating outputs are cast back to float32 so post-processing is unaffected by autocast.
+    """
+    if SAM3_CHANNELS_LAST and "pixel_values" in inputs:
+        inputs["pixel_values"] = inputs["pixel_values"].contiguous(memory_format=torch.channels_last)
+
+    with torch.inference_mode(), _autocast():
+        outputs = forward_model(**inputs)
+
+    for key, value in list(outputs.items()):
+        if torch.is_tensor(value) and value.is_floating_point() and value.dtype != torch.float32:
+            outputs[key] = value.float()
+    return outputs
+
+
+def segment_batch(items, threshold=0.15):
+    """
+    Run SAM 3 on a list of (image, text_prompt) pairs in one forward pass.
+    The processor resizes every image to the model's fixed input size; prompts come from
+    the prompt cache, so images of different sizes and prompts batch together.
+    Blocking: meant to run on the inference executor, never on the event loop.
+    Returns one post-processed result (masks, scores, boxes) per item at full resolution.
+    """
+    images = [image for image, _ in items]
+    texts = [text for _, text in items]
+
+    pixel_values = processor(images=images, return_tensors="pt")["pixel_values"].to(DEVICE)
+    outputs_sam = run_model({"pixel_values": pixel_values, **prompt_inputs(texts)})
+
+    return processor.post_process_instance_segmentation(
+        outputs_sam, threshold=threshold, target_sizes=[image.size[::-1] for image in images]
+    )
+
+
+def count_batch(items, threshold=0.15, min_area_fraction=0.005, max_iou=0.3):
+    """
+    Count instances for a list of (image, text_prompt) pairs in one forward pass, using only
+    the predicted boxes and the low-resolution mask logits (no full-size masks).
+    Same filters as the full /count path: score, area as a fraction of the image (from the
+    low-res masks) and greedy de-duplication by low-res mask IoU.
+    Returns one {"count", "scores", "boxes"} per item, boxes as normalized xyxy.
+    """
+    images = [image for image, _ in items]
+    texts = [text for _, text in items]
+    pixel_values = processor(images=images, return_tensors="pt")["pixel_values"].to(DEVICE)
+    outputs = run_model({"pixel_values": pixel_values, **prompt_inputs(texts)})
+    return fast_counts(outputs, threshold, min_area_fraction, max_iou)
+
+
+def fast_counts(outputs, threshold=0.15, min_area_fraction=0.005, max_iou=0.3):
+    """count_batch's filters applied to raw model outputs: one {"count", "scores", "boxes"} per item"""
+    scores = outputs.pred_logits.sigmoid()
+    if outputs.presence_logits is not None:
+        scores = scores * outputs.presence_logits.sigmoid()
+
+    results = []
+    for image_scores, boxes, mask_logits in zip(scores, outputs.pred_boxes, outputs.pred_masks):
+        keep = image_scores > threshold
+        image_scores, boxes = image_scores[keep], boxes[keep]
+        masks = (mask_logits[keep] > 0).flatten(1).float()
+        # The model input is the whole image resized, so mask pixel fractions are image fractions
+        areas = masks.sum(dim=1)
+        large = areas >= min_area_fraction * masks.shape[1]
+        image_scores, boxes, masks, areas = image_scores[large], boxes[large], masks[large], areas[large]
+
+        order = torch.argsort(image_scores, descending=True)
+        intersections = masks @ masks.T
+        ious = intersections / (areas[:, None] + areas[None, :] - intersections).clamp(min=1)
+        selected = []
+        for idx in order.tolist():
+            if all(ious[idx, other] <= max_iou for other in selected):
+                selected.append(idx)
+
+        results.append({
+            "count": len(selected),
+            "scores": image_scores[selected].cpu(),
+            "boxes": boxes[selected].clamp(0, 1).cpu(),
+        })
+    return results
+
+
+def segment(image, target_obj, threshold=0.15):
+    """Run SAM 3 on one image with a text prompt (see segment_batch)"""
+    return segment_batch([(image, target_obj)], threshold)[0]
+
+
+def _encode_prompt(text):
+    """Run the text encoder on one prompt. Returns (pooler_output, attention_mask)."""
+    text_inputs = processor(text=[text], return_tensors="pt").to(DEVICE)
+    with torch.inference_mode(), _autocast():
+        text_embeds = model.get_text_features(**text_inputs)
+    return text_embeds.pooler_output.float(), text_inputs["attention_mask"]
+
+
+def encode_text(text):
+    """
+    Text encoder output for a prompt, from the prompt cache ("Bottles" shares the entry of
+    "bottle"). Pass it to segment_images for any number of images.
+    """
+    return prompt_cache.get(text, _encode_prompt)
+
+
+def prompt_inputs(texts):
+    """Model text inputs (text_embeds + attention_mask) for a batch of prompts, from the cache"""
+    features = [encode_text(text) for text in texts]
+    if all(f is features[0] for f in features):
+        pooler_output, attention_mask = features[0]
+        pooler_output = pooler_output.expand(len(texts), *pooler_output.shape[1:])
+        attention_mask = attention_mask.expand(len(texts), -1)
+    else:
+        pooler_output = torch.cat([f[0] for f in features])
+        attention_mask = torch.cat([f[1] for f in features])
+    return {
+        "text_embeds": BaseModelOutputWithPooling(pooler_output=pooler_output),
+        "attention_mask": attention_mask,
+    }
+
+
+def segment_images(images, text_features, threshold=0.15):
+    """
+    Run SAM 3 on a list of images against one pre-encoded prompt (see encode_text).
+    The text features are shared (expanded, not copied) across the batch.
+    Blocking: meant to run on the inference executor.
+    Returns one post-processed result per image at its resolution.
+    """
+    pooler_output, attention_mask = text_features
+    count = len(images)
+    pixel_values = processor(images=images, return_tensors="pt")["pixel_values"].to(DEVICE)
+    text_embeds = BaseModelOutputWithPooling(pooler_output=pooler_output.expand(count, *pooler_output.shape[1:]))
+    outputs = run_model({
+        "pixel_values": pixel_values,
+        "text_embeds": text_embeds,
+        "attention_mask": attention_mask.expand(count, -1),
+    })
+    return processor.post_process_instance_segmentation(
+        outputs, threshold=threshold, target_sizes=[image.size[::-1] for image in images]
+    )
+
+
+def segment_vocabulary(image, labels, threshold=0.15, chunk_size=8, with_fast_counts=False):
+    """
+    Segment many text prompts on one image with a single vision backbone pass.
+    The image features are computed once and shared (expanded, not copied) by every
+    prompt; prompts go through the detector in chunks of `chunk_size` to bound memory.
+    Blocking: meant to run on the inference executor.
+    Returns {label: post-processed result} at the image's resolution; `with_fast_counts`
+    adds each label's count_batch count as "fast_count", from the same forward pass.
+    """
+    pixel_values = processor(images=image, return_tensors="pt")["pixel_values"].to(DEVICE)
+    if SAM3_CHANNELS_LAST:
+        pixel_values = pixel_values.contiguous(memory_format=torch.channels_last)
+    with torch.inference_mode(), _autocast():
+        vision_embeds = model.get_vision_features(pixel_values=pixel_values)
+
+    results = {}
+    for start in range(0, len(labels), max(1, chunk_size)):
+        chunk = labels[start:start + chunk_size]
+        shared = vision_embeds.__class__(
+            fpn_hidden_states=tuple(t.expand(len(chunk), *t.shape[1:]) for t in vision_embeds.fpn_hidden_states),
+            fpn_position_encoding=tuple(t.expand(len(chunk), *t.shape[1:]) for t in vision_embeds.fpn_position_encoding),
+        )
+        outputs = run_model({"vision_embeds": shared, **prompt_inputs(chunk)})
+        chunk_results = processor.post_process_instance_segmentation(
+            outputs, threshold=threshold, target_sizes=[image.size[::-1]] * len(chunk)
+        )
+        if with_fast_counts:
+            for result, counted in zip(chunk_results, fast_counts(outputs, threshold)):
+                result["fast_count"] = counted["count"]
+        results.update(zip(chunk, chunk_results))
+    return results
+
+
+def inference_side(requested=None):
+    """Effective inference cap: the per-request override (bounded by the limit) or the default"""
+    if requested is None:
+        return SAM3_MAX_INFERENCE_SIDE
+    if requested <= 0:
+        return SAM3_MAX_INFERENCE_SIDE_LIMIT
+    return min(requested, SAM3_MAX_INFERENCE_SIDE_LIMIT)
+
+
+def resize_for_inference(image, max_side):
+    """Downscale `image` so its longest side is at most `max_side` (no-op when already small)"""
+    if not max_side or max(image.size) <= max_side:
+        return image
+    scale = max_side / max(image.size)
+    size = (max(1, round(image.size[0] * scale)), max(1, round(image.size[1] * scale)))
+    return image.resize(size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+
+
+def upsample_mask(mask, size):
+    """
+    Map a boolean mask predicted at inference resolution back to `size` (W, H).
+    Only the mask's bounding box is interpolated (bilinear, re-thresholded at 0.5),
+    which gives smooth edges without a full-frame float buffer.
+    """
+    if torch.is_tensor(mask):
+        mask = mask.cpu().numpy()
+    mask = np.asarray(mask, dtype=bool)
+    height, width = mask.shape
+    out_width, out_height = size
+    if (width, height) == (out_width, out_height):
+        return mask
+
+    out = np.zeros((out_height, out_width), dtype=bool)
+    bbox = mask_bbox(mask)
+    if bbox is None:
+        return out
+
+    # One pixel of background margin so edges interpolate against the surroundings
+    x_min, y_min = max(bbox[0] - 1, 0), max(bbox[1] - 1, 0)
+    x_max, y_max = min(bbox[2] + 1, width), min(bbox[3] + 1, height)
+    sx, sy = out_width / width, out_height / height
+    out_x_min, out_y_min = round(x_min * sx), round(y_min * sy)
+    out_x_max, out_y_max = min(round(x_max * sx), out_width), min(round(y_max * sy), out_height)
+
+    crop = torch.from_numpy(mask[y_min:y_max, x_min:x_max].astype(np.float32))[None, None]
+    upsampled = F.interpolate(
+        crop, size=(out_y_max - out_y_min, out_x_max - out_x_min), mode="bilinear", align_corners=False
+    )
+    out[out_y_min:out_y_max, out_x_min:out_x_max] = upsampled[0, 0].numpy() > 0.5
+    return out
+
+
+def load_tracker():
+    """
+    Load the SAM 3 tracker (prompt encoder + mask decoder) used for click/box refinement.
+    The checkpoint's tracker shares the detector's ViT backbone, so the loaded detector
+    backbone is reused instead of keeping a second copy in memory.
+    """
+    global tracker_processor, tracker_model
+    if tracker_model is None:
+        print("Loading SAM 3 tracker for interactive refinement...")
+        tracker_processor = Sam3TrackerProcessor.from_pretrained(MODEL_ID, token=MY_TOKEN)
+        tracker_model = Sam3TrackerModel.from_pretrained(MODEL_ID, token=MY_TOKEN).to(DEVICE).eval()
+        if model is not None:
+            tracker_model.vision_encoder.backbone = model.vision_encoder.backbone
+        print("Tracker loaded.")
+
+
+def compute_image_embeddings(image):
+    """
+    Run the tracker vision encoder once for an image (the expensive part of /refine).
+    Returns the per-level feature maps, to be cached and reused for every click.
+    """
+    load_tracker()
+    pixel_values = tracker_processor(images=image, return_tensors="pt")["pixel_values"].to(DEVICE)
+    if SAM3_CHANNELS_LAST:
+        pixel_values = pixel_values.contiguous(memory_format=torch.channels_last)
+    with torch.inference_mode(), _autocast():
+        embeddings = tracker_model.get_image_embeddings(pixel_values)
+    return [e.float() for e in embeddings]
+
+
+def decode_prompts(embeddings, size, points=None, labels=None, box=None):
+    """
+    Prompt encoder + mask decoder only, against cached image embeddings.
+    `points` ([[x, y], ...] with `labels` 1 = positive, 0 = negative) and `box`
+    ([x0, y0, x1, y1]) are in pixels of the image the embeddings came from, `size` (W, H).
+    A single click is ambiguous, so three candidates are decoded and the best
+    predicted IoU wins; with more prompts a single mask is decoded.
+    Returns (mask [H, W] bool, predicted IoU).
+    """
+    load_tracker()
+    original_sizes = [[size[1], size[0]]]
+    prompt_inputs = tracker_processor(
+        input_points=[[points]] if points else None,
+        input_labels=[[labels]] if points else None,
+        input_boxes=[[box]] if box else None,
+        original_sizes=original_sizes,
+        return_tensors="pt"
+    ).to(DEVICE)
+    multimask = box is None and len(points or []) == 1
+
+    with torch.inference_mode():
+        outputs = tracker_model(
+            image_embeddings=embeddings,
+            input_points=prompt_inputs.get("input_points"),
+            input_labels=prompt_inputs.get("input_labels"),
+            input_boxes=prompt_inputs.get("input_boxes"),
+            multimask_output=multimask
+        )
+
+    masks = tracker_processor.post_process_masks(outputs.pred_masks.cpu(), original_sizes)[0][0]
+    scores = outputs.iou_scores[0, 0].float().cpu()
+    best = int(torch.argmax(scores))
+    return masks[best].numpy().astype(bool), float(scores[best])
+
+
+def load_video_tracker():
+    """Load the SAM 3 video tracker (memory attention + mask decoder), sharing the detector's backbone"""
+    global video_processor, video_model
+    if video_model is None:
+        print("Loading SAM 3 video tracker...")
+        video_processor = Sam3TrackerVideoProcessor.from_pretrained(MODEL_ID, token=MY_TOKEN)
+        video_model = Sam3TrackerVideoModel.from_pretrained(MODEL_ID, token=MY_TOKEN).to(DEVICE).eval()
+        if model is not None:
+            video_model.vision_encoder.backbone = model.vision_encoder.backbone
+        print("Video tracker loaded.")
+
+
+def start_video_session(masks):
+    """
+    Open a streaming tracking session whose objects are `masks` (boolean [H, W] arrays on
+    the first frame, e.g. from the text detector). Object ids are 1..len(masks); the first
+    frame itself is then passed to track_frame like every other frame.
+    """
+    load_video_tracker()
+    session = video_processor.init_video_session(inference_device=DEVICE)
+    video_processor.add_inputs_to_inference_session(
+        session, frame_idx=0, obj_ids=list(range(1, len(masks) + 1)),
+        input_masks=[torch.as_tensor(np.asarray(m, dtype=bool)) for m in masks]
+    )
+    return session
+
+
+def track_frame(session, frame):
+    """
+    Propagate the session's objects to the next frame using the tracker memory only
+    (no text detector). Frames must all have the same size. Old frames and outputs
+    that the memory no longer reads are dropped, so long clips run in bounded memory.
+    Returns (masks [N, H, W] bool, scores [N]) at the frame's resolution.
+    """
+    pixel_values = video_processor(images=frame, return_tensors="pt")["pixel_values"].to(DEVICE)
+    with torch.inference_mode():
+        outputs = video_model(inference_session=session, frame=pixel_values[0])
+
+    masks = video_processor.post_process_masks(
+        [outputs.pred_masks], original_sizes=[[frame.size[1], frame.size[0]]], binarize=True
+    )[0][:, 0]
+    scores = torch.sigmoid(outputs.object_score_logits.float()).reshape(-1)
+
+    # Memory attention reads at most this many past frames (conditioning frames are kept).
+    # Frame slots stay in the session since streamed frame indices are derived from their count.
+    window = max(video_model.num_maskmem, video_model.config.max_object_pointers_in_encoder)
+    frame_idx = outputs.frame_idx
+    if frame_idx > 0:
+        session.processed_frames[frame_idx - 1] = None
+    for obj_outputs in session.output_dict_per_obj.values():
+        obj_outputs["non_cond_frame_outputs"].pop(frame_idx - window - 1, None)
+    return masks.cpu().numpy(), scores.cpu().numpy()
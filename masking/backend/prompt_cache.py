@@ -0,0 +1,163 @@
+import collections
+import os
+import re
+import threading
+
+# Prompts encoded at startup (comma-separated)
+DEFAULT_VOCABULARY = (
+    "person,car,bottle,cup,chair,table,dog,cat,bag,phone,book,shirt,shoe,laptop,bicycle,"
+    "tree,window,door,plant,ball,glasses,hat"
+)
+# Number of encoded prompts kept (LRU); one entry is ~32 KB
+SAM3_PROMPT_CACHE_SIZE = int(os.getenv("SAM3_PROMPT_CACHE_SIZE", "1024"))
+# Encode prompts in normalized form (below), so variants share an entry. With 0, prompts are
+# only lowercased and whitespace-collapsed, as the tokenizer does anyway (exact outputs)
+SAM3_PROMPT_NORMALIZE = os.getenv("SAM3_PROMPT_NORMALIZE", "1") == "1"
+
+# Prompts that mean the same object; extend with SAM3_PROMPT_SYNONYMS="from:to,from:to"
+DEFAULT_SYNONYMS = {
+    "automobile": "car",
+    "cellphone": "phone",
+    "cell phone": "phone",
+    "mobile phone": "phone",
+    "smartphone": "phone",
+    "sofa": "couch",
+    "t-shirt": "shirt",
+    "tshirt": "shirt",
+    "tee shirt": "shirt",
+    "bike": "bicycle",
+    "tv": "television",
+    "eyeglasses": "glasses",
+    "spectacles": "glasses",
+}
+
+IRREGULAR_PLURALS = {
+    "people": "person", "men": "man", "women": "woman", "children": "child", "feet": "foot",
+    "teeth": "tooth", "mice": "mouse", "geese": "goose", "oxen": "ox", "knives": "knife",
+    "leaves": "leaf", "shelves": "shelf", "wolves": "wolf", "loaves": "loaf", "halves": "half",
+    "calves": "calf", "lives": "life", "wives": "wife", "scarves": "scarf",
+    "potatoes": "potato", "tomatoes": "tomato", "mangoes": "mango", "heroes": "hero",
+    "cookies": "cookie", "movies": "movie", "pies": "pie", "ties": "tie", "hoodies": "hoodie",
+    "brownies": "brownie", "selfies": "selfie", "buses": "bus", "lenses": "lens",
+}
+# Words that end in "s" but are not plurals (or have no singular form)
+UNINFLECTED = {
+    "glasses", "sunglasses", "pants", "jeans", "shorts", "trousers", "scissors", "headphones",
+    "binoculars", "sheep", "fish", "deer", "series", "species", "news", "lens", "gas", "bus",
+}
+
+_ARTICLE = re.compile(r"^(a|an|the|some)\s+")
+
+
+def _load_synonyms():
+    synonyms = dict(DEFAULT_SYNONYMS)
+    for pair in os.getenv("SAM3_PROMPT_SYNONYMS", "").split(","):
+        if ":" in pair:
+            source, target = pair.split(":", 1)
+            synonyms[" ".join(source.lower().split())] = " ".join(target.lower().split())
+    return synonyms
+
+
+SYNONYMS = _load_synonyms()
+
+
+def singularize(word):
+    """Best-effort English singular of one word (regular plurals plus a list of exceptions)"""
+    if word in UNINFLECTED:
+        return word
+    if word in IRREGULAR_PLURALS:
+        return IRREGULAR_PLURALS[word]
+    if len(word) <= 3 or not word.endswith("s") or word.endswith(("ss", "us", "is")):
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith(("sses", "xes", "ches", "shes")):
+        return word[:-2]
+    return word[:-1]
+
+
+def normalize_prompt(text):
+    """
+    Canonical form of an object prompt: lowercase, single spaces, no leading article,
+    last word singular, synonyms mapped ("Bottles" -> "bottle", "cell phones" -> "phone").
+    """
+    text = " ".join(text.lower().strip(" .,!?;:\"'").split())
+    text = _ARTICLE.sub("", text)
+    if not text:
+        return text
+    words = text.split(" ")
+    words[-1] = singularize(words[-1])
+    text = " ".join(words)
+    return SYNONYMS.get(text, text)
+
+
+def cache_key(text, normalize=SAM3_PROMPT_NORMALIZE):
+    """Prompt cache key, which is also the text that gets encoded"""
+    if normalize:
+        return normalize_prompt(text)
+    return " ".join(text.lower().split())
+
+
+SAM3_PROMPT_VOCABULARY = [
+    normalize_prompt(label) for label in os.getenv("SAM3_PROMPT_VOCABULARY", DEFAULT_VOCABULARY).split(",")
+    if label.strip()
+]
+
+
+class PromptCache:
+    """
+    LRU of prompt -> text encoder output, keyed (and encoded) by cache_key(). Shared by the
+    inference threads: every access holds the lock, encoding runs outside it.
+    """
+
+    def __init__(self, max_entries=SAM3_PROMPT_CACHE_SIZE, normalize=SAM3_PROMPT_NORMALIZE):
+        self.max_entries = max(1, max_entries)
+        self.normalize = normalize
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "warmed": 0}
+
+    def get(self, prompt, encode):
+        """Encoder output for `prompt`, calling `encode(key)` on a miss"""
+        key = cache_key(prompt, self.normalize)
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return value
+            self._stats["misses"] += 1
+
+        value = encode(key)
+        self._put(key, value)
+        return value
+
+    def warm(self, prompts, encode):
+        """Encode prompts ahead of time (startup); already cached ones are skipped"""
+        for prompt in prompts:
+            key = cache_key(prompt, self.normalize)
+            with self._lock:
+                if key in self._entries:
+                    continue
+            self._put(key, encode(key))
+            with self._lock:
+                self._stats["warmed"] += 1
+
+    def _put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def metrics(self):
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                "entries": len(self._entries),
+                "capacity": self.max_entries,
+                "hit_rate": round(self._stats["hits"] / lookups, 3) if lookups else None,
+                "normalized": self.normalize,
+                **self._stats,
+            }
@@ -0,0 +1,77 @@
+import collections
+import hashlib
+import os
+import threading
+
+# Number of images whose tracker embeddings are kept.
+# Each entry holds roughly 20 MB of float32 feature maps.
+SAM3_REFINE_CACHE_SIZE = int(os.getenv("SAM3_REFINE_CACHE_SIZE", "8"))
+# Number of images whose last selected box is kept (a few bytes each)
+SAM3_REFINE_SELECTIONS = int(os.getenv("SAM3_REFINE_SELECTIONS", "1024"))
+
+
+def image_id_for(contents):
+    """Stable id of an upload: the SHA-256 of its bytes"""
+    return hashlib.sha256(contents).hexdigest()
+
+
+class RefinementCache:
+    """
+    LRU of per-image refinement state, keyed by image id.
+    An entry holds the tracker embeddings (computed on the first /refine) together with
+    the inference size they belong to. The box of the last selected mask, recorded by
+    /mask and /recolor so clicks can refine it, lives in a separate, larger LRU: selections
+    never evict embeddings. Thread-safe: entries are filled from inference worker threads.
+    """
+
+    def __init__(self, max_entries=SAM3_REFINE_CACHE_SIZE, max_selections=SAM3_REFINE_SELECTIONS):
+        self.max_entries = max(1, max_entries)
+        self.max_selections = max(1, max_selections)
+        self._entries = collections.OrderedDict()
+        self._selections = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def _view(self, image_id, entry):
+        return {**entry, "box": self._selections.get(image_id)}
+
+    def lookup(self, image_id):
+        """
+        Copy of the entry for `image_id` if its embeddings are cached, else None, counting
+        the lookup as a hit or miss. Read in one go, so an eviction cannot split it.
+        """
+        with self._lock:
+            entry = self._entries.get(image_id)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["hits"] += 1
+            self._entries.move_to_end(image_id)
+            return self._view(image_id, entry)
+
+    def put_embeddings(self, image_id, embeddings, size, original_size):
+        """Cache the embeddings of an image; returns a copy of its entry, like lookup"""
+        with self._lock:
+            entry = self._entries[image_id] = {"embeddings": embeddings, "size": size, "original_size": original_size}
+            self._entries.move_to_end(image_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+            return self._view(image_id, entry)
+
+    def remember_selection(self, image_id, box):
+        """Record the box (original pixels) of the mask last returned for this image"""
+        with self._lock:
+            self._selections[image_id] = box
+            self._selections.move_to_end(image_id)
+            while len(self._selections) > self.max_selections:
+                self._selections.popitem(last=False)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "capacity": self.max_entries,
+                "selections": len(self._selections),
+                **self._stats,
+            }
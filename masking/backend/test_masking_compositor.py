@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from bench_compositor import legacy_recolor, make_masks
+from compositor import blend_lut, composite_layers
+
+
+@pytest.mark.parametrize("rgb, alpha", [
+    ((255, 0, 0), 0.6),
+    ((12, 200, 77), 0.35),
+    ((0, 0, 0), 1.0),
+    ((255, 255, 255), 0.0),
+])
+def test_lut_matches_the_per_pixel_formula(rgb, alpha):
+    levels = np.arange(256)
+    lut = blend_lut(rgb, alpha)
+    for channel in range(3):
+        expected = (levels * (1 - alpha) + rgb[channel] * alpha).astype(np.uint8)
+        np.testing.assert_array_equal(lut[channel], expected)
+
+
+def test_layers_match_the_legacy_recolor():
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, (120, 160, 3), dtype=np.uint8)
+    layers = [
+        (mask, tuple(int(c) for c in rng.integers(0, 256, 3)), float(alpha))
+        for mask, alpha in zip(make_masks(120, 160, 4, rng), rng.uniform(0.2, 0.9, 4))
+    ]
+    expected = image
+    for mask, rgb, alpha in layers:
+        expected = legacy_recolor(expected, mask, rgb, alpha)
+    np.testing.assert_array_equal(composite_layers(image.copy(), layers), expected)
+
+
+def test_empty_mask_leaves_the_image_alone():
+    image = np.full((10, 10, 3), 40, dtype=np.uint8)
+    composite_layers(image, [(np.zeros((10, 10), dtype=bool), (255, 0, 0), 0.6)])
+    assert (image == 40).all()
+
+
+def test_rejects_non_rgb_images():
+    with pytest.raises(ValueError):
+        composite_layers(np.zeros((10, 10), dtype=np.uint8), [])
+    with pytest.raises(ValueError):
+        composite_layers(np.zeros((10, 10, 3), dtype=np.float32), [])
@@ -0,0 +1,82 @@
+from types import SimpleNamespace
+
+import pytest
+import torch
+from PIL import Image
+
+pytest.importorskip("transformers")
+import model_utils  # noqa: E402
+from model_utils import count_batch  # noqa: E402
+
+LOW_RES = 32
+
+
+def logits(probabilities):
+    probabilities = torch.tensor(probabilities, dtype=torch.float32)
+    return torch.log(probabilities / (1 - probabilities))
+
+
+def square(x0, y0, side):
+    """Low-res mask logits: positive inside the square, negative elsewhere"""
+    mask = torch.full((LOW_RES, LOW_RES), -5.0)
+    mask[y0:y0 + side, x0:x0 + side] = 5.0
+    return mask
+
+
+def outputs(scores, masks, presence=None):
+    count = len(scores)
+    return SimpleNamespace(
+        pred_logits=logits([scores]),
+        presence_logits=None if presence is None else logits([[presence]]),
+        pred_boxes=torch.rand(1, count, 4),
+        pred_masks=torch.stack(masks)[None],
+    )
+
+
+class FakeInputs(dict):
+    def to(self, device):
+        return self
+
+
+@pytest.fixture
+def model_outputs(monkeypatch):
+    """Make count_batch see `model_outputs.value` as the SAM 3 forward pass result"""
+    holder = SimpleNamespace(value=None)
+    monkeypatch.setattr(model_utils, "processor", lambda **kwargs: FakeInputs(pixel_values=torch.zeros(1, 3, 8, 8)))
+    monkeypatch.setattr(model_utils, "prompt_inputs", lambda texts: {})
+    monkeypatch.setattr(model_utils, "run_model", lambda inputs: holder.value)
+    return holder
+
+
+def count(model_outputs, value):
+    model_outputs.value = value
+    return count_batch([(Image.new("RGB", (64, 64)), "bottle")])[0]
+
+
+def test_duplicates_small_and_weak_instances_are_dropped(model_outputs):
+    result = count(model_outputs, outputs(
+        [0.9, 0.8, 0.7, 0.1, 0.6],
+        [
+            square(0, 0, 10),    # kept
+            square(1, 1, 10),    # same object as the first (IoU > 0.3)
+            square(20, 20, 8),   # kept
+            square(0, 20, 8),    # score under the threshold
+            square(30, 0, 1),    # smaller than 0.5% of the image
+        ],
+    ))
+    assert result["count"] == 2
+    assert result["scores"].tolist() == pytest.approx([0.9, 0.7], abs=1e-4)
+    assert result["boxes"].shape == (2, 4)
+
+
+def test_presence_score_scales_instance_scores(model_outputs):
+    masks = [square(0, 0, 10), square(20, 20, 8)]
+    assert count(model_outputs, outputs([0.9, 0.9], masks))["count"] == 2
+    # 0.9 * 0.1 is under the 0.15 threshold: the prompt is judged absent
+    assert count(model_outputs, outputs([0.9, 0.9], masks, presence=0.1))["count"] == 0
+
+
+def test_nothing_detected(model_outputs):
+    result = count(model_outputs, outputs([0.05], [square(0, 0, 10)]))
+    assert result["count"] == 0
+    assert result["boxes"].shape == (0, 4)
@@ -0,0 +1,141 @@
+import base64
+import zlib
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from encoding import (
+    check_encode_options, crop_to_rle, encode_image, encode_masks, mask_bbox, mask_to_bitpack,
+    mask_to_rle, negotiate_image_format, negotiate_mask_format, rle_to_mask
+)
+
+
+def random_masks():
+    rng = np.random.default_rng(0)
+    masks = [
+        np.zeros((7, 5), dtype=bool),
+        np.ones((7, 5), dtype=bool),
+        rng.random((40, 33)) > 0.5,
+        rng.random((1, 9)) > 0.3,
+        rng.random((64, 1)) > 0.7,
+    ]
+    blob = np.zeros((120, 90), dtype=bool)
+    blob[30:80, 10:60] = True
+    blob[0, 0] = blob[-1, -1] = True
+    masks.append(blob)
+    return masks
+
+
+@pytest.mark.parametrize("mask", random_masks())
+def test_rle_round_trip(mask):
+    rle = mask_to_rle(mask)
+    assert rle["size"] == list(mask.shape)
+    np.testing.assert_array_equal(rle_to_mask(rle), mask)
+
+
+@pytest.mark.parametrize("mask", random_masks())
+def test_rle_matches_pycocotools(mask):
+    mask_utils = pytest.importorskip("pycocotools.mask")
+    expected = mask_utils.encode(np.asfortranarray(mask.astype(np.uint8)))
+    assert mask_to_rle(mask)["counts"] == expected["counts"].decode("ascii")
+
+
+@pytest.mark.parametrize("mask", [m for m in random_masks() if m.any()])
+def test_crop_rle_matches_full_rle(mask):
+    box = mask_bbox(mask)
+    x_min, y_min, x_max, y_max = box
+    crop = mask[y_min:y_max, x_min:x_max]
+    size = (mask.shape[1], mask.shape[0])
+    assert crop_to_rle(crop, box, size) == mask_to_rle(mask)
+
+
+def test_bitpack_round_trip():
+    mask = random_masks()[-1]
+    box = mask_bbox(mask)
+    packed = mask_to_bitpack(mask, box)
+    height, width = packed["shape"]
+    bits = np.unpackbits(np.frombuffer(base64.b64decode(packed["data"]), dtype=np.uint8))
+    crop = bits[:height * width].reshape(height, width).astype(bool)
+    np.testing.assert_array_equal(crop, mask[box[1]:box[3], box[0]:box[2]])
+
+
+def test_labelmap_paints_higher_scores_last():
+    masks = np.zeros((2, 4, 4), dtype=bool)
+    masks[0, :3, :3] = True
+    masks[1, 1:, 1:] = True
+    payload = encode_masks(masks, np.array([0.9, 0.5]), "labelmap")
+    labelmap = np.frombuffer(zlib.decompress(base64.b64decode(payload["data"])), dtype=payload["dtype"])
+    labelmap = labelmap.reshape(payload["height"], payload["width"])
+    assert labelmap[1, 1] == 1  # overlap goes to the 0.9 instance
+    assert labelmap[3, 3] == 2
+    assert labelmap[0, 3] == 0
+    assert [inst["area"] for inst in payload["instances"]] == [9, 9]
+
+
+def test_empty_mask_has_no_bbox():
+    assert mask_bbox(np.zeros((3, 3), dtype=bool)) is None
+    assert encode_masks(np.zeros((1, 3, 3), dtype=bool), [0.5], "bitpack")["instances"][0]["mask"] is None
+
+
+@pytest.mark.parametrize("requested, accept, expected", [
+    (None, None, "png"),
+    ("RLE", "image/png", "rle"),
+    (None, "text/html, application/vnd.coco-rle+json;q=0.9", "rle"),
+    (None, "application/vnd.labelmap+json", "labelmap"),
+    (None, "*/*", "png"),
+])
+def test_negotiate_mask_format(requested, accept, expected):
+    assert negotiate_mask_format(requested, accept) == expected
+
+
+@pytest.mark.parametrize("requested, accept, expected", [
+    (None, None, "png"),
+    ("jpg", None, "jpeg"),
+    ("WebP", "image/jpeg", "webp"),
+    (None, "image/avif, image/webp, image/jpeg", "webp"),
+    (None, "*/*", "png"),
+])
+def test_negotiate_image_format(requested, accept, expected):
+    assert negotiate_image_format(requested, accept) == expected
+
+
+def test_unknown_formats_are_rejected():
+    with pytest.raises(ValueError):
+        negotiate_mask_format("svg")
+    with pytest.raises(ValueError):
+        negotiate_image_format("gif")
+
+
+@pytest.mark.parametrize("fmt, media_type, pil_format", [
+    ("png", "image/png", "PNG"),
+    ("jpeg", "image/jpeg", "JPEG"),
+    ("webp", "image/webp", "WEBP"),
+])
+def test_encode_image(fmt, media_type, pil_format):
+    image = Image.new("RGBA", (64, 48), (200, 30, 30, 255))
+    buffer, encoded_type = encode_image(image, fmt)
+    assert encoded_type == media_type
+    decoded = Image.open(buffer)
+    assert decoded.format == pil_format and decoded.size == (64, 48)
+
+
+def test_encode_image_downscales_to_max_side():
+    image = Image.new("RGB", (400, 100))
+    buffer, _ = encode_image(image, "png", max_side=200)
+    assert Image.open(buffer).size == (200, 50)
+    assert image.size == (400, 100)
+
+
+@pytest.mark.parametrize("options", [
+    {"quality": 0}, {"quality": 101}, {"compress_level": -1}, {"compress_level": 10}, {"max_side": 0},
+])
+def test_out_of_range_encoder_options_are_rejected(options):
+    with pytest.raises(ValueError):
+        check_encode_options(**options)
+
+
+def test_encoder_option_bounds_are_accepted():
+    check_encode_options(quality=1, compress_level=0, max_side=1)
+    check_encode_options(quality=100, compress_level=9)
+    check_encode_options()
@@ -0,0 +1,187 @@
+import asyncio
+import threading
+
+import pytest
+
+import inference
+from inference import ClientDisconnectedError, InferenceExecutor, QueueFullError
+
+
+class FakeRequest:
+    def __init__(self):
+        self.disconnected = False
+
+    async def is_disconnected(self):
+        return self.disconnected
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def started(**kwargs):
+    executor = InferenceExecutor(**kwargs)
+    await executor.start()
+    return executor
+
+
+async def blocked(executor):
+    """Occupy the single worker until the returned event is set"""
+    release = threading.Event()
+    task = asyncio.create_task(executor.submit(release.wait))
+    while executor.metrics()["in_flight"] == 0:
+        await asyncio.sleep(0.01)
+    return release, task
+
+
+def test_results_and_errors_reach_the_caller():
+    async def main():
+        executor = await started(workers=2)
+        assert await executor.submit(pow, 2, 10) == 1024
+        with pytest.raises(ZeroDivisionError):
+            await executor.submit(lambda: 1 / 0)
+        metrics = executor.metrics()
+        await executor.stop()
+        return metrics
+
+    metrics = run(main())
+    assert metrics["completed"] == 1 and metrics["failed"] == 1
+
+
+def test_submit_before_start_fails():
+    with pytest.raises(RuntimeError):
+        run(InferenceExecutor().submit(pow, 2, 2))
+
+
+def test_full_queue_rejects():
+    async def main():
+        executor = await started(workers=1, queue_size=1)
+        release, running = await blocked(executor)
+        queued = asyncio.create_task(executor.submit(pow, 2, 2))
+        await asyncio.sleep(0)
+        with pytest.raises(QueueFullError):
+            await executor.submit(pow, 2, 3)
+        release.set()
+        await running
+        assert await queued == 4
+        rejected = executor.metrics()["rejected"]
+        await executor.stop()
+        return rejected
+
+    assert run(main()) == 1
+
+
+def test_disconnected_client_is_dropped_before_running(monkeypatch):
+    monkeypatch.setattr(inference, "DISCONNECT_POLL_SECONDS", 0.01)
+    calls = []
+
+    async def main():
+        executor = await started(workers=1)
+        release, running = await blocked(executor)
+        request = FakeRequest()
+        waiting = asyncio.create_task(executor.submit(calls.append, "late", request=request))
+        await asyncio.sleep(0.05)
+        request.disconnected = True
+        with pytest.raises(ClientDisconnectedError):
+            await waiting
+        release.set()
+        await running
+        await executor.submit(calls.append, "next")
+        metrics = executor.metrics()
+        await executor.stop()
+        return metrics
+
+    metrics = run(main())
+    assert calls == ["next"]
+    assert metrics["cancelled"] == 1 and metrics["queue_depth"] == 0
+
+
+def test_items_with_one_key_share_a_call():
+    calls = []
+
+    def double(items):
+        calls.append(list(items))
+        return [item * 2 for item in items]
+
+    async def main():
+        executor = await started(workers=1, batch_window_ms=50, max_batch=3)
+        release, running = await blocked(executor)
+        waiting = [asyncio.create_task(executor.submit_batched(double, i, "x2")) for i in range(4)]
+        await asyncio.sleep(0)
+        release.set()
+        await running
+        results = await asyncio.gather(*waiting)
+        metrics = executor.metrics()
+        await executor.stop()
+        return results, metrics
+
+    results, metrics = run(main())
+    assert results == [0, 2, 4, 6]
+    assert calls == [[0, 1, 2], [3]]
+    assert metrics["batches"] == 2 and metrics["avg_batch_size"] == 2.0
+
+
+def test_a_failed_batch_fails_every_item():
+    def broken(items):
+        raise RuntimeError("out of memory")
+
+    async def main():
+        executor = await started(workers=1, batch_window_ms=50)
+        release, running = await blocked(executor)
+        waiting = [asyncio.create_task(executor.submit_batched(broken, i, "k")) for i in range(2)]
+        await asyncio.sleep(0)
+        release.set()
+        await running
+        results = await asyncio.gather(*waiting, return_exceptions=True)
+        await executor.stop()
+        return results
+
+    assert all(isinstance(result, RuntimeError) for result in run(main()))
+
+
+def test_other_keys_are_batched_next_in_order():
+    calls = []
+
+    def echo(items):
+        calls.append(list(items))
+        return items
+
+    async def main():
+        executor = await started(workers=1, batch_window_ms=50, max_batch=4)
+        release, running = await blocked(executor)
+        keys = ["a", "b", "a", "b", "c"]
+        waiting = [
+            asyncio.create_task(executor.submit_batched(echo, (key, i), key)) for i, key in enumerate(keys)
+        ]
+        await asyncio.sleep(0)
+        release.set()
+        await running
+        results = await asyncio.gather(*waiting)
+        await executor.stop()
+        return results
+
+    assert run(main()) == [("a", 0), ("b", 1), ("a", 2), ("b", 3), ("c", 4)]
+    assert calls == [[("a", 0), ("a", 2)], [("b", 1), ("b", 3)], [("c", 4)]]
+
+
+def test_cancelled_caller_drops_its_queued_job():
+    calls = []
+
+    async def main():
+        executor = await started(workers=1)
+        release, running = await blocked(executor)
+        waiting = asyncio.create_task(executor.submit(calls.append, "timed out"))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        release.set()
+        await running
+        await executor.submit(calls.append, "next")
+        metrics = executor.metrics()
+        await executor.stop()
+        return metrics
+
+    metrics = run(main())
+    assert calls == ["next"]
+    assert metrics["cancelled"] == 1 and metrics["queue_depth"] == 0
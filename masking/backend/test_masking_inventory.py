@@ -0,0 +1,96 @@
+import asyncio
+
+import numpy as np
+import torch
+
+from inventory import InventoryStore, pack_results, unpack_results
+
+
+def sam_result():
+    masks = torch.zeros((2, 30, 40), dtype=torch.bool)
+    masks[0, 2:10, 3:12] = True
+    masks[1, 15:25, 20:35] = True
+    return {
+        "masks": masks,
+        "scores": torch.tensor([0.9, 0.4]),
+        "boxes": torch.tensor([[3.0, 2.0, 12.0, 10.0], [20.0, 15.0, 35.0, 25.0]]),
+    }
+
+
+def test_pack_and_unpack_round_trip():
+    result = sam_result()
+    packed = pack_results({**result, "fast_count": 1}, 2, (40, 30), (400, 300))
+    assert packed["count"] == 2 and packed["fast_count"] == 1
+    # Boxes are reported in original pixels
+    assert packed["instances"][0]["box"] == [30.0, 20.0, 120.0, 100.0]
+    unpacked = unpack_results(packed, (40, 30))
+    assert torch.equal(unpacked["masks"], result["masks"])
+    np.testing.assert_allclose(unpacked["scores"], [0.9, 0.4])
+
+
+def test_unpack_empty_result():
+    unpacked = unpack_results({"count": 0, "instances": []}, (40, 30))
+    assert unpacked["masks"].shape == (0, 30, 40)
+
+
+def test_lookup_waits_for_the_running_job():
+    async def main():
+        store = InventoryStore()
+        assert store.start("img", ["cup", "dog"])
+        assert not store.start("img", ["cup"])
+        waiting = asyncio.create_task(store.lookup("img", " Cup "))
+        await asyncio.sleep(0)
+        assert not waiting.done()
+        packed = pack_results(sam_result(), 2, (40, 30), (40, 30))
+        store.complete("img", {"cup": packed}, (40, 30), (40, 30))
+        found = await waiting
+        missing = await store.lookup("img", "dog"), await store.lookup("img", "car")
+        return store, found, missing
+
+    store, found, missing = asyncio.run(main())
+    assert found[0]["count"] == 2 and found[1] == (40, 30)
+    assert missing == (None, None)
+    assert store.summary("img")["objects"]["cup"]["count"] == 2
+    metrics = store.metrics()
+    assert metrics["hits"] == 1 and metrics["misses"] == 2 and metrics["ready"] == 1
+
+
+def test_lookup_stops_waiting_after_max_wait():
+    async def main():
+        store = InventoryStore(max_wait=0.01)
+        store.start("img", ["cup"])
+        return store, await store.lookup("img", "cup")
+
+    store, found = asyncio.run(main())
+    assert found is None
+    metrics = store.metrics()
+    assert metrics["wait_timeouts"] == 1 and metrics["misses"] == 1 and metrics["pending"] == 1
+
+
+def test_failed_job_is_a_miss_and_can_restart():
+    async def main():
+        store = InventoryStore()
+        store.start("img", ["cup"])
+        waiting = asyncio.create_task(store.lookup("img", "cup"))
+        await asyncio.sleep(0)
+        store.fail("img", RuntimeError("CUDA error"))
+        return store, await waiting
+
+    store, found = asyncio.run(main())
+    assert found is None
+    assert store.summary("img") == {
+        "image_id": "img", "status": "failed", "labels": ["cup"], "elapsed_ms": None, "error": "CUDA error"
+    }
+    assert store.start("img", ["cup"])
+
+
+def test_oldest_inventory_is_evicted():
+    async def main():
+        store = InventoryStore(max_entries=2)
+        for image_id in ("a", "b", "c"):
+            store.start(image_id, ["cup"])
+        return store
+
+    store = asyncio.run(main())
+    assert store.summary("a") is None and store.summary("c")["status"] == "pending"
+    assert store.metrics()["evictions"] == 1
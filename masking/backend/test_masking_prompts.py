@@ -0,0 +1,66 @@
+import pytest
+
+from prompt_cache import PromptCache, cache_key, normalize_prompt, singularize
+
+
+@pytest.mark.parametrize("prompt, expected", [
+    ("bottle", "bottle"),
+    ("Bottles", "bottle"),
+    ("  the   Bottle. ", "bottle"),
+    ("a cup", "cup"),
+    ("some glasses", "glasses"),
+    ("cell phones", "phone"),
+    ("Smartphone", "phone"),
+    ("t-shirts", "shirt"),
+    ("people", "person"),
+    ("red cars", "red car"),
+    ("boxes", "box"),
+    ("puppies", "puppy"),
+    ("bus", "bus"),
+    ("glass", "glass"),
+    ("", ""),
+])
+def test_normalize_prompt(prompt, expected):
+    assert normalize_prompt(prompt) == expected
+
+
+@pytest.mark.parametrize("word", ["jeans", "scissors", "sheep", "cactus", "analysis", "gas", "dress"])
+def test_singularize_leaves_non_plurals_alone(word):
+    assert singularize(word) == word
+
+
+def test_cache_key_without_normalization_only_folds_case_and_spacing():
+    assert cache_key("  Red   Bottles ", normalize=False) == "red bottles"
+    assert cache_key("  Red   Bottles ", normalize=True) == "red bottle"
+
+
+def test_variants_share_one_entry():
+    encoded = []
+
+    def encode(text):
+        encoded.append(text)
+        return object()
+
+    cache = PromptCache(max_entries=8)
+    first = cache.get("Bottles", encode)
+    assert cache.get("the bottle", encode) is first
+    assert encoded == ["bottle"]
+    assert cache.metrics()["hits"] == 1
+
+    exact = PromptCache(max_entries=8, normalize=False)
+    exact.get("Bottles", encode)
+    exact.get("bottle", encode)
+    assert encoded[1:] == ["bottles", "bottle"]
+
+
+def test_lru_eviction_and_warm():
+    cache = PromptCache(max_entries=2)
+    cache.warm(["cars", "dog"], lambda text: text)
+    assert cache.metrics()["warmed"] == 2
+    cache.get("cat", lambda text: text)
+    metrics = cache.metrics()
+    assert metrics["entries"] == 2 and metrics["evictions"] == 1
+    # "car" was the least recently used entry
+    misses = metrics["misses"]
+    cache.get("car", lambda text: text)
+    assert cache.metrics()["misses"] == misses + 1
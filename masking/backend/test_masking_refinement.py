@@ -0,0 +1,47 @@
+import pytest
+
+from refinement import RefinementCache, image_id_for
+
+
+def test_lookup_needs_embeddings():
+    cache = RefinementCache(max_entries=2)
+    cache.remember_selection("img", [1, 2, 3, 4])
+    assert cache.lookup("img") is None
+    entry = cache.put_embeddings("img", "features", (320, 240), (640, 480))
+    assert entry == {
+        "embeddings": "features", "size": (320, 240), "original_size": (640, 480), "box": [1, 2, 3, 4]
+    }
+    assert cache.lookup("img") == entry
+    metrics = cache.metrics()
+    assert metrics["hits"] == 1 and metrics["misses"] == 1
+
+
+def test_lookup_is_a_snapshot():
+    cache = RefinementCache(max_entries=1)
+    cache.put_embeddings("a", "features a", (320, 240), (640, 480))
+    entry = cache.lookup("a")
+    # Evicted right after the lookup: the caller still holds a complete entry
+    cache.put_embeddings("b", "features b", (320, 240), (640, 480))
+    assert cache.lookup("a") is None
+    assert entry["embeddings"] == "features a" and entry["original_size"] == (640, 480)
+
+
+def test_selections_do_not_evict_embeddings():
+    cache = RefinementCache(max_entries=1, max_selections=2)
+    cache.put_embeddings("a", "features a", (320, 240), (640, 480))
+    for image_id in ("b", "c", "a"):
+        cache.remember_selection(image_id, [0, 0, 10, 10])
+    assert cache.lookup("a")["box"] == [0, 0, 10, 10]
+    metrics = cache.metrics()
+    assert metrics["entries"] == 1 and metrics["selections"] == 2 and metrics["evictions"] == 0
+
+
+def test_expired_image_id_asks_for_a_re_upload():
+    pytest.importorskip("transformers")
+    from fastapi.testclient import TestClient
+
+    import app
+
+    response = TestClient(app.app).post("/refine", data={"image_id": image_id_for(b"gone"), "points": "[[1, 2]]"})
+    assert response.status_code == 404
+    assert "re-upload" in response.json()["detail"]
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+
+pytest.importorskip("transformers")
+import model_utils  # noqa: E402
+from model_utils import inference_side, resize_for_inference, upsample_mask  # noqa: E402
+
+
+def test_upsample_keeps_the_shape_and_stays_inside_the_box():
+    mask = np.zeros((50, 80), dtype=bool)
+    mask[10:30, 20:60] = True
+    out = upsample_mask(mask, (320, 200))
+    assert out.shape == (200, 320)
+    ys, xs = np.nonzero(out)
+    assert (xs.min(), xs.max() + 1, ys.min(), ys.max() + 1) == (80, 240, 40, 120)
+    # The area scales with the image, up to the smoothed corners
+    assert abs(out.sum() - 160 * 80) <= 8
+
+
+def test_upsample_accepts_tensors_and_same_size():
+    mask = torch.zeros(20, 30, dtype=torch.bool)
+    mask[5:10, 5:10] = True
+    same = upsample_mask(mask, (30, 20))
+    np.testing.assert_array_equal(same, mask.numpy())
+
+
+def test_upsample_empty_mask():
+    assert not upsample_mask(np.zeros((10, 10), dtype=bool), (40, 40)).any()
+
+
+@pytest.mark.parametrize("requested, expected", [
+    (None, 1536),
+    (0, 4096),
+    (-1, 4096),
+    (800, 800),
+    (10000, 4096),
+])
+def test_inference_side(monkeypatch, requested, expected):
+    monkeypatch.setattr(model_utils, "SAM3_MAX_INFERENCE_SIDE", 1536)
+    monkeypatch.setattr(model_utils, "SAM3_MAX_INFERENCE_SIDE_LIMIT", 4096)
+    assert inference_side(requested) == expected
+
+
+def test_resize_for_inference():
+    image = Image.new("RGB", (4000, 3000))
+    assert resize_for_inference(image, 1000).size == (1000, 750)
+    small = Image.new("RGB", (640, 480))
+    assert resize_for_inference(small, 1000) is small
+    assert resize_for_inference(image, 0) is image
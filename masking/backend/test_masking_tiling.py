@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from tiling import TileBudgetExceeded, TiledInstances, plan_tiling, tile_grid, tiled_union_mask
+
+
+@pytest.mark.parametrize("size, tile, overlap", [
+    ((300, 200), 200, 60),
+    ((5000, 3000), 1008, 160),
+    ((1009, 1008), 1008, 160),
+    ((640, 480), 1008, 160),
+])
+def test_tile_grid_covers_the_image(size, tile, overlap):
+    width, height = size
+    tiles = tile_grid(size, tile, overlap)
+    covered = np.zeros((height, width), dtype=bool)
+    for x0, y0, x1, y1 in tiles:
+        assert 0 <= x0 < x1 <= width and 0 <= y0 < y1 <= height
+        assert x1 - x0 <= tile and y1 - y0 <= tile
+        covered[y0:y1, x0:x1] = True
+    assert covered.all()
+
+    # Neighbouring tiles overlap by at least `overlap`, so a seam never cuts an object blind
+    xs = sorted({t[0] for t in tiles})
+    ends = sorted({t[2] for t in tiles})
+    for start, previous_end in zip(xs[1:], ends):
+        assert previous_end - start >= overlap
+
+
+def test_small_image_is_one_tile():
+    assert tile_grid((640, 480), 1008, 160) == [(0, 0, 640, 480)]
+
+
+def test_plan_tiling_rejects_images_over_budget():
+    with pytest.raises(TileBudgetExceeded):
+        plan_tiling((40000, 40000), max_batch=4, memory_mb=2048)
+    tiles_per_pass, left_mb = plan_tiling((4000, 3000), max_batch=4, memory_mb=2048)
+    assert 1 <= tiles_per_pass <= 4 and left_mb >= 0
+
+
+def tile_results(objects, tiles):
+    """What SAM 3 would return per tile: each object's mask cut to the tile, when visible"""
+    for tile in tiles:
+        x0, y0, x1, y1 = tile
+        masks = [obj[y0:y1, x0:x1] for obj in objects if obj[y0:y1, x0:x1].any()]
+        shape = (len(masks), y1 - y0, x1 - x0)
+        yield tile, {
+            "masks": np.array(masks, dtype=bool).reshape(shape),
+            "scores": np.full(len(masks), 0.9),
+        }
+
+
+def test_objects_cut_by_seams_are_merged():
+    size = (300, 200)
+    tiles = tile_grid(size, 200, 60)
+    assert len(tiles) > 1
+
+    spanning = np.zeros((200, 300), dtype=bool)
+    spanning[40:160, 60:260] = True   # crosses every vertical seam
+    corner = np.zeros((200, 300), dtype=bool)
+    corner[170:195, 5:40] = True      # inside the first tile only
+
+    instances = TiledInstances(size, memory_mb=64)
+    for tile, result in tile_results([spanning, corner], tiles):
+        instances.add_tile(tile, result)
+
+    assert instances.tiles == len(tiles)
+    assert len(instances.instances) == 2
+    assert instances.count() == 2
+    by_area = sorted(instances.ranked(), key=lambda inst: -inst["crop"].sum())
+    np.testing.assert_array_equal(tiled_union_mask(by_area[:1], size), spanning)
+    np.testing.assert_array_equal(tiled_union_mask(by_area[1:], size), corner)
+
+
+def test_instance_masks_respect_the_memory_budget():
+    size = (300, 200)
+    full = np.ones((200, 300), dtype=bool)
+    instances = TiledInstances(size, memory_mb=0)
+    with pytest.raises(TileBudgetExceeded):
+        for tile, result in tile_results([full], tile_grid(size, 200, 60)):
+            instances.add_tile(tile, result)
@@ -0,0 +1,227 @@
+import base64
+import math
+import os
+import zlib
+
+import numpy as np
+import torch
+
+from encoding import crop_to_rle, mask_to_bitpack
+
+# Tiled inference for very large images: tiles are segmented at native resolution
+SAM3_TILE_SIZE = int(os.getenv("SAM3_TILE_SIZE", "1008"))
+SAM3_TILE_OVERLAP = int(os.getenv("SAM3_TILE_OVERLAP", "160"))
+# Images from this many megapixels up are tiled unless the request says otherwise
+SAM3_TILE_MIN_MP = float(os.getenv("SAM3_TILE_MIN_MP", "20"))
+# Memory ceiling of one tiled request: decoded image, tile batches and kept instance masks
+SAM3_TILE_MEMORY_MB = int(os.getenv("SAM3_TILE_MEMORY_MB", "2048"))
+
+# Rough peak memory of one tile in a SAM 3 forward pass (float32 activations, CPU)
+TILE_PASS_MB = 400
+# Two instances from different tiles are one object if their masks agree this well
+# where both tiles see the image
+TILE_MERGE_IOU = 0.5
+
+
+class TileBudgetExceeded(Exception):
+    """Raised when a tiled request would not fit in SAM3_TILE_MEMORY_MB"""
+
+
+def should_tile(size, requested=None):
+    """Tile when asked to, or by default when the image is at least SAM3_TILE_MIN_MP megapixels"""
+    if requested is not None:
+        return requested
+    return size[0] * size[1] >= SAM3_TILE_MIN_MP * 1_000_000
+
+
+def _axis_starts(length, tile, overlap):
+    if length <= tile:
+        return [0]
+    count = math.ceil((length - overlap) / (tile - overlap))
+    return [round(i * (length - tile) / (count - 1)) for i in range(count)]
+
+
+def tile_grid(size, tile=SAM3_TILE_SIZE, overlap=SAM3_TILE_OVERLAP):
+    """Overlapping (x0, y0, x1, y1) tiles covering an image of `size` (W, H), row by row"""
+    width, height = size
+    overlap = min(overlap, tile // 2)
+    return [
+        (x, y, min(x + tile, width), min(y + tile, height))
+        for y in _axis_starts(height, tile, overlap)
+        for x in _axis_starts(width, tile, overlap)
+    ]
+
+
+def plan_tiling(size, max_batch, memory_mb=SAM3_TILE_MEMORY_MB):
+    """
+    Check a tiled request against the memory ceiling. Returns (tiles per pass, MB left
+    for instance masks). The decoded image and one full-size output plane are reserved first.
+    """
+    image_mb = size[0] * size[1] * 4 / 2 ** 20
+    available = memory_mb - image_mb
+    if available < TILE_PASS_MB:
+        raise TileBudgetExceeded(
+            f"A {size[0]}x{size[1]} image needs more than SAM3_TILE_MEMORY_MB ({memory_mb} MB) to tile"
+        )
+    tiles_per_pass = int(max(1, min(max_batch, available // TILE_PASS_MB)))
+    return tiles_per_pass, available - tiles_per_pass * TILE_PASS_MB
+
+
+def _intersect(a, b):
+    box = (max(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), min(a[3], b[3]))
+    return box if box[0] < box[2] and box[1] < box[3] else None
+
+
+def _union(a, b):
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+
+def _window(instance, box):
+    """The instance's mask inside `box` (full-image coordinates), empty outside its crop"""
+    window = np.zeros((box[3] - box[1], box[2] - box[0]), dtype=bool)
+    part = _intersect(instance["box"], box)
+    if part is not None:
+        x0, y0 = instance["box"][0], instance["box"][1]
+        window[part[1] - box[1]:part[3] - box[1], part[0] - box[0]:part[2] - box[0]] = \
+            instance["crop"][part[1] - y0:part[3] - y0, part[0] - x0:part[2] - x0]
+    return window
+
+
+class TiledInstances:
+    """
+    Instances found on the tiles of one image, kept as bbox crops in full-image coordinates.
+    Objects cut by a tile border show up on several tiles; they are merged (mask union)
+    when their masks agree inside the area both tiles cover.
+    """
+
+    def __init__(self, size, memory_mb):
+        self.size = size
+        self.memory_bytes = memory_mb * 2 ** 20
+        self.tiles = 0
+        self.instances = []
+        self._bytes = 0
+
+    def add_tile(self, tile, result):
+        """Add one tile's post-processed SAM 3 result (masks at the tile's size)"""
+        masks = result["masks"].cpu().numpy() if torch.is_tensor(result["masks"]) else result["masks"]
+        scores = result["scores"].float().cpu().numpy() if torch.is_tensor(result["scores"]) else result["scores"]
+        self.tiles += 1
+        for mask, score in zip(np.asarray(masks, dtype=bool), scores):
+            rows = np.flatnonzero(mask.any(axis=1))
+            if rows.size == 0:
+                continue
+            cols = np.flatnonzero(mask.any(axis=0))
+            crop = mask[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1].copy()
+            box = (tile[0] + int(cols[0]), tile[1] + int(rows[0]),
+                   tile[0] + int(cols[-1]) + 1, tile[1] + int(rows[-1]) + 1)
+            self._add({"box": box, "crop": crop, "score": float(score), "region": tile})
+
+    def _add(self, candidate):
+        for kept in self.instances:
+            if kept["region"] == candidate["region"] or _intersect(kept["box"], candidate["box"]) is None:
+                continue
+            shared = _intersect(kept["region"], candidate["region"])
+            window = shared and _intersect(shared, _union(kept["box"], candidate["box"]))
+            if window is None:
+                continue
+            a, b = _window(kept, window), _window(candidate, window)
+            union = np.count_nonzero(a | b)
+            if union and np.count_nonzero(a & b) / union > TILE_MERGE_IOU:
+                self._merge(kept, candidate)
+                return
+        self._reserve(candidate["crop"].size)
+        self.instances.append(candidate)
+
+    def _merge(self, kept, candidate):
+        box = _union(kept["box"], candidate["box"])
+        crop = _window(kept, box) | _window(candidate, box)
+        self._reserve(crop.size - kept["crop"].size)
+        kept.update(
+            box=box, crop=crop, score=max(kept["score"], candidate["score"]),
+            region=_union(kept["region"], candidate["region"])
+        )
+
+    def _reserve(self, nbytes):
+        self._bytes += nbytes
+        if self._bytes > self.memory_bytes:
+            raise TileBudgetExceeded(
+                "Instance masks exceed SAM3_TILE_MEMORY_MB; raise it or use a more specific prompt"
+            )
+
+    def ranked(self):
+        """Instances by descending score"""
+        return sorted(self.instances, key=lambda inst: -inst["score"])
+
+    def count(self, min_score=0.15, min_area_fraction=0.005, max_iou=0.3):
+        """
+        Number of distinct objects, with the /count filters (score, area, overlap)
+        applied at tile scale: the minimum area is relative to one tile, not the whole image.
+        """
+        tile_area = min(SAM3_TILE_SIZE, self.size[0]) * min(SAM3_TILE_SIZE, self.size[1])
+        counted = []
+        for inst in self.ranked():
+            area = np.count_nonzero(inst["crop"])
+            if inst["score"] < min_score or area < tile_area * min_area_fraction:
+                continue
+            duplicate = False
+            for other in counted:
+                overlap = _intersect(inst["box"], other["box"])
+                if overlap is None:
+                    continue
+                intersection = np.count_nonzero(_window(inst, overlap) & _window(other, overlap))
+                union = area + other["area"] - intersection
+                if union and intersection / union > max_iou:
+                    duplicate = True
+                    break
+            if not duplicate:
+                counted.append({**inst, "area": area})
+        return len(counted)
+
+
+def tiled_union_mask(instances, size):
+    """Full-resolution union of the instances, as a boolean [H, W] array"""
+    union = np.zeros((size[1], size[0]), dtype=bool)
+    for inst in instances:
+        x0, y0, x1, y1 = inst["box"]
+        union[y0:y1, x0:x1] |= inst["crop"]
+    return union
+
+
+def encode_tiled_masks(instances, size, fmt):
+    """
+    The JSON payload of encode_masks for tiled instances, built from their crops
+    (only the label map needs a full-size plane).
+    """
+    width, height = size
+    payload = {"format": fmt, "height": int(height), "width": int(width)}
+    entries = []
+    for idx, inst in enumerate(instances):
+        entry = {
+            "id": idx + 1,
+            "score": round(inst["score"], 4),
+            "bbox": list(inst["box"]),
+            "area": int(np.count_nonzero(inst["crop"])),
+        }
+        if fmt == "rle":
+            entry["rle"] = crop_to_rle(inst["crop"], inst["box"], size)
+        elif fmt == "bitpack":
+            entry["mask"] = mask_to_bitpack(inst["crop"], [0, 0, inst["crop"].shape[1], inst["crop"].shape[0]])
+        entries.append(entry)
+
+    if fmt == "bitpack":
+        payload["bitorder"] = "big"
+    elif fmt == "labelmap":
+        dtype = np.uint8 if len(instances) < 256 else np.uint16
+        labelmap = np.zeros((height, width), dtype=dtype)
+        # Lowest scores first so higher-scoring instances win on overlaps
+        for idx in sorted(range(len(instances)), key=lambda i: instances[i]["score"]):
+            x0, y0, x1, y1 = instances[idx]["box"]
+            labelmap[y0:y1, x0:x1][instances[idx]["crop"]] = idx + 1
+        payload["dtype"] = labelmap.dtype.name
+        payload["encoding"] = "zlib+base64"
+        payload["data"] = base64.b64encode(zlib.compress(labelmap.tobytes(), 1)).decode("ascii")
+    elif fmt != "rle":
+        raise ValueError(f"'{fmt}' is not a compact mask format")
+
+    payload["instances"] = entries
+    return payload
@@ -0,0 +1,89 @@
+import os
+import shutil
+import tempfile
+
+import cv2
+from PIL import Image
+
+# Limits for /video
+SAM3_VIDEO_MAX_FRAMES = int(os.getenv("SAM3_VIDEO_MAX_FRAMES", "300"))
+SAM3_VIDEO_MAX_OBJECTS = int(os.getenv("SAM3_VIDEO_MAX_OBJECTS", "8"))
+
+
+def save_clip(fileobj, filename=None):
+    """Copy an uploaded clip to a temporary file (the decoder needs a path). Returns the path."""
+    suffix = os.path.splitext(filename or "")[1] or ".mp4"
+    with tempfile.NamedTemporaryFile(prefix="sam3_clip_", suffix=suffix, delete=False) as f:
+        shutil.copyfileobj(fileobj, f, 1024 * 1024)
+        return f.name
+
+
+def clip_frames(path):
+    """Yield the frames of a video file as RGB PIL images"""
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError("Could not open the video clip")
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            yield Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    finally:
+        capture.release()
+
+
+def clip_fps(path):
+    """Frame rate of a video file, or None if unknown"""
+    capture = cv2.VideoCapture(path)
+    try:
+        fps = capture.get(cv2.CAP_PROP_FPS)
+        return round(fps, 3) if fps and fps > 0 else None
+    finally:
+        capture.release()
+
+
+def sequence_frames(readers, decode):
+    """Yield decoded frames of an ordered frame sequence (`readers` return each frame's bytes)"""
+    for read in readers:
+        yield decode(read())
+
+
+class FrameReader:
+    """
+    Pull frames from a source iterator with a stride and a frame limit.
+    Every frame is brought to the first frame's size (the tracker needs a constant size)
+    and paired with its copy capped to the inference resolution.
+    """
+
+    def __init__(self, frames, resize, max_side, stride=1, max_frames=SAM3_VIDEO_MAX_FRAMES):
+        self._frames = frames
+        self._resize = resize
+        self.max_side = max_side
+        self.stride = max(1, stride)
+        self.max_frames = max_frames
+        self.size = None
+        self.read_count = 0
+        self._source_index = 0
+
+    def read(self):
+        """Next (frame, inference_frame), or None at the end of the clip or the frame limit"""
+        if self.max_frames and self.read_count >= self.max_frames:
+            return None
+        for frame in self._frames:
+            index = self._source_index
+            self._source_index += 1
+            if index % self.stride:
+                continue
+            if self.size is None:
+                self.size = frame.size
+            elif frame.size != self.size:
+                frame = frame.resize(self.size, Image.Resampling.BILINEAR)
+            self.read_count += 1
+            return frame, self._resize(frame, self.max_side)
+        return None
+
+    def close(self):
+        close = getattr(self._frames, "close", None)
+        if close is not None:
+            close()
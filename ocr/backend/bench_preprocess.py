@@ -0,0 +1,146 @@
+"""
+Latency and character accuracy of OCR preprocessing chains (see preprocess.py) on a local
+sample set. Character accuracy is 1 - edit distance / expected length, on whitespace-
+normalized text in reading order. Expected text comes from a `<image>.txt` file next to each
+image, or from generated pages (--synthetic): large, tinted, skewed photos of text.
+
+    python bench_preprocess.py --images ./samples
+    python bench_preprocess.py --synthetic 4 --chains "none;resize;resize,grayscale,deskew;resize,deskew,binarize"
+"""
+import argparse
+import collections
+import glob
+import os
+import random
+import string
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from utils import OCRProcessor
+from preprocess import parse_chain
+
+IMAGE_PATTERNS = ("*.jpg", "*.jpeg", "*.png", "*.tif", "*.tiff")
+DEFAULT_CHAINS = "none;resize;resize,grayscale;resize,grayscale,deskew;resize,grayscale,deskew,binarize"
+
+
+def load_documents(directory):
+    paths = sorted(p for pattern in IMAGE_PATTERNS for p in glob.glob(os.path.join(directory, pattern)))
+    if not paths:
+        sys.exit(f"No images found in {directory}")
+    documents = []
+    for path in paths:
+        truth_path = os.path.splitext(path)[0] + ".txt"
+        if not os.path.exists(truth_path):
+            print(f"Skipping {os.path.basename(path)}: no {os.path.basename(truth_path)}")
+            continue
+        with open(truth_path, encoding="utf-8") as f:
+            text = f.read()
+        image = cv2.cvtColor(cv2.imread(path, cv2.IMREAD_COLOR), cv2.COLOR_BGR2RGB)
+        documents.append((os.path.basename(path), image, text))
+    return documents
+
+
+def synthetic_documents(count, size, seed=0):
+    """Lines of random words on a tinted, unevenly lit background, rotated by up to 6 degrees"""
+    rng = random.Random(seed)
+    width, height = size
+    documents = []
+    for n in range(count):
+        tint = np.array([rng.randint(170, 230) for _ in range(3)], dtype=np.float32)
+        shade = np.linspace(1.0, 0.7, width, dtype=np.float32)[None, :, None]
+        image = (np.ones((height, width, 3), dtype=np.float32) * tint * shade).astype(np.uint8)
+        lines = []
+        y = 160
+        while y < height - 120:
+            words = []
+            x = 120
+            while True:
+                word = "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 9)))
+                (w, _), _ = cv2.getTextSize(word + " ", cv2.FONT_HERSHEY_SIMPLEX, 2.0, 4)
+                if x + w > width - 120:
+                    break
+                words.append(word)
+                x += w
+            cv2.putText(image, " ".join(words), (120, y), cv2.FONT_HERSHEY_SIMPLEX, 2.0, (30, 30, 30), 4, cv2.LINE_AA)
+            lines.append(" ".join(words))
+            y += rng.randint(110, 150)
+        angle = rng.uniform(-6, 6)
+        matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+        image = cv2.warpAffine(image, matrix, (width, height), borderMode=cv2.BORDER_REPLICATE)
+        noise = np.random.default_rng(seed + n).normal(0, 8, image.shape)
+        image = np.clip(image + noise, 0, 255).astype(np.uint8)
+        documents.append((f"synthetic_{n}_{angle:+.1f}deg.png", image, "\n".join(lines)))
+    return documents
+
+
+def edit_distance(a, b):
+    """Levenshtein distance, one NumPy row per character of `a`"""
+    if not a or not b:
+        return max(len(a), len(b))
+    b_codes = np.array([ord(c) for c in b])
+    steps = np.arange(len(b) + 1)
+    row = steps.copy()
+    for i, char in enumerate(a, 1):
+        substitution = row[:-1] + (b_codes != ord(char))
+        deletion = row[1:] + 1
+        candidate = np.concatenate(([i], np.minimum(substitution, deletion)))
+        # Insertions: row[j] = min(candidate[j], row[j - 1] + 1), as a running minimum
+        row = np.minimum.accumulate(candidate - steps) + steps
+    return int(row[-1])
+
+
+def character_accuracy(expected, results):
+    expected = " ".join(expected.split())
+    found = " ".join(" ".join(item["text"] for item in results).split())
+    if not expected:
+        return 1.0 if not found else 0.0
+    return max(0.0, 1 - edit_distance(expected, found) / len(expected))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", help="Directory with images and <name>.txt ground truth")
+    parser.add_argument("--synthetic", type=int, default=0, help="Number of generated pages")
+    parser.add_argument("--size", default="4000x3000", help="Generated page size, WxH")
+    parser.add_argument("--chains", default=DEFAULT_CHAINS, help="Chains to compare, separated by ';'")
+    parser.add_argument("--languages", default="en")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per document and chain")
+    args = parser.parse_args()
+
+    try:
+        chains = [(chain.strip() or "none", parse_chain(chain)) for chain in args.chains.split(";")]
+    except ValueError as e:
+        sys.exit(str(e))
+    documents = load_documents(args.images) if args.images else []
+    if args.synthetic:
+        documents += synthetic_documents(args.synthetic, tuple(int(v) for v in args.size.lower().split("x")))
+    if not documents:
+        sys.exit("Nothing to benchmark: pass --images and/or --synthetic")
+
+    processor = OCRProcessor(args.languages.split(","))
+    width = max(len(name) for name, _ in chains) + 2
+    print(f"{'document':<28}{'chain':<{width}}{'ms':>10}{'boxes':>8}{'char acc':>10}")
+    totals = collections.defaultdict(lambda: [0.0, 0.0])
+    for name, image, text in documents:
+        for chain_name, steps in chains:
+            elapsed = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                results = processor.read_text(image, preprocess=steps)
+                elapsed.append(time.perf_counter() - start)
+            latency = min(elapsed) * 1000
+            score = character_accuracy(text, results)
+            totals[chain_name][0] += latency
+            totals[chain_name][1] += score
+            print(f"{name[:27]:<28}{chain_name:<{width}}{latency:>10.0f}{len(results):>8}{score:>10.3f}")
+
+    print()
+    for chain_name, (latency, score) in totals.items():
+        print(f"{chain_name:<{width}} mean {latency / len(documents):.0f} ms, mean char accuracy {score / len(documents):.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Latency and word recall of tiled OCR against a single full-image pass, on large documents.
+Recall is the share of expected words found. Expected words come from a `<image>.txt` file
+next to each image, or from the generated pages (--synthetic): large white sheets with small
+random words, the case where easyocr's internal downscaling loses text.
+
+    python bench_tiling.py --images ./bench_scans
+    python bench_tiling.py --synthetic 3 --size 6000x4000
+"""
+import argparse
+import collections
+import glob
+import os
+import random
+import string
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from utils import OCRProcessor
+from tiling import OCR_TILE_SIZE, OCR_TILE_OVERLAP, tile_grid
+
+IMAGE_PATTERNS = ("*.jpg", "*.jpeg", "*.png", "*.tif", "*.tiff")
+
+
+def load_documents(directory):
+    paths = sorted(p for pattern in IMAGE_PATTERNS for p in glob.glob(os.path.join(directory, pattern)))
+    if not paths:
+        sys.exit(f"No images found in {directory}")
+    documents = []
+    for path in paths:
+        truth_path = os.path.splitext(path)[0] + ".txt"
+        if not os.path.exists(truth_path):
+            print(f"Skipping {os.path.basename(path)}: no {os.path.basename(truth_path)}")
+            continue
+        with open(truth_path, encoding="utf-8") as f:
+            words = f.read().split()
+        image = cv2.cvtColor(cv2.imread(path, cv2.IMREAD_COLOR), cv2.COLOR_BGR2RGB)
+        documents.append((os.path.basename(path), image, words))
+    return documents
+
+
+def synthetic_documents(count, size, seed=0):
+    """Pages of small random words laid out in rows"""
+    rng = random.Random(seed)
+    width, height = size
+    documents = []
+    for n in range(count):
+        image = np.full((height, width, 3), 255, dtype=np.uint8)
+        words = []
+        y = 60
+        while y < height - 40:
+            x = 40
+            while True:
+                word = "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 9)))
+                (w, _), _ = cv2.getTextSize(word, cv2.FONT_HERSHEY_SIMPLEX, 0.8, 2)
+                if x + w > width - 40:
+                    break
+                cv2.putText(image, word, (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 0), 2, cv2.LINE_AA)
+                words.append(word)
+                x += w + rng.randint(25, 60)
+            y += rng.randint(45, 80)
+        documents.append((f"synthetic_{n}.png", image, words))
+    return documents
+
+
+def recall(expected, results):
+    """Share of expected words (with multiplicity) found in the OCR output, case-insensitive"""
+    found = collections.Counter(word.lower() for item in results for word in item["text"].split())
+    hits = 0
+    for word, count in collections.Counter(w.lower() for w in expected).items():
+        hits += min(count, found[word])
+    return hits / len(expected) if expected else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", help="Directory with scans and <name>.txt ground truth")
+    parser.add_argument("--synthetic", type=int, default=0, help="Number of generated pages")
+    parser.add_argument("--size", default="6000x4000", help="Generated page size, WxH")
+    parser.add_argument("--languages", default="en")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per document and mode")
+    args = parser.parse_args()
+
+    documents = load_documents(args.images) if args.images else []
+    if args.synthetic:
+        documents += synthetic_documents(args.synthetic, tuple(int(v) for v in args.size.lower().split("x")))
+    if not documents:
+        sys.exit("Nothing to benchmark: pass --images and/or --synthetic")
+
+    processor = OCRProcessor(args.languages.split(","))
+    print(f"Tiles {OCR_TILE_SIZE}px, overlap {OCR_TILE_OVERLAP}px")
+    print(f"{'document':<24}{'size':>12}{'tiles':>7}{'mode':>8}{'ms':>10}{'boxes':>8}{'recall':>9}")
+    totals = collections.defaultdict(lambda: [0.0, 0.0])
+    for name, image, words in documents:
+        tiles = len(tile_grid(image.shape))
+        for mode, tiled in (("full", False), ("tiled", True)):
+            elapsed = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                results = processor.read_text(image, tiled)
+                elapsed.append(time.perf_counter() - start)
+            latency = min(elapsed) * 1000
+            score = recall(words, results)
+            totals[mode][0] += latency
+            totals[mode][1] += score
+            size = f"{image.shape[1]}x{image.shape[0]}"
+            print(f"{name[:23]:<24}{size:>12}{tiles:>7}{mode:>8}{latency:>10.0f}{len(results):>8}{score:>9.3f}")
+
+    print()
+    for mode, (latency, score) in totals.items():
+        print(f"{mode:<8} mean {latency / len(documents):.0f} ms, mean recall {score / len(documents):.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+# Multi-page documents: PDF pages are rasterized at this DPI unless the request asks otherwise
+OCR_DOC_DPI = int(os.getenv("OCR_DOC_DPI", "200"))
+OCR_DOC_MAX_DPI = int(os.getenv("OCR_DOC_MAX_DPI", "400"))
+OCR_DOC_MAX_PAGES = int(os.getenv("OCR_DOC_MAX_PAGES", "500"))
+# Pages larger than this (megapixels) at the requested DPI are rendered smaller
+OCR_DOC_MAX_PAGE_MP = float(os.getenv("OCR_DOC_MAX_PAGE_MP", "40"))
+
+PDF_POINTS_PER_INCH = 72
+
+
+def save_document(fileobj, filename=None):
+    """Copy an uploaded document to a temporary file (pages are rendered from it). Returns the path."""
+    suffix = os.path.splitext(filename or "")[1] or ".bin"
+    with tempfile.NamedTemporaryFile(prefix="ocr_doc_", suffix=suffix, delete=False) as f:
+        shutil.copyfileobj(fileobj, f, 1024 * 1024)
+        return f.name
+
+
+def document_kind(path):
+    """'pdf' or 'image' (TIFF and other formats PIL can open, one frame per page)"""
+    with open(path, "rb") as f:
+        if f.read(5) == b"%PDF-":
+            return "pdf"
+    try:
+        with Image.open(path) as image:
+            image.verify()
+    except Exception:
+        raise ValueError("File must be a PDF, a TIFF or an image")
+    return "image"
+
+
+def page_count(path, kind):
+    if kind == "pdf":
+        import pypdfium2
+        pdf = pypdfium2.PdfDocument(path)
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
+    with Image.open(path) as image:
+        return getattr(image, "n_frames", 1)
+
+
+def render_page(path, kind, index, dpi=OCR_DOC_DPI):
+    """
+    Rasterize one page (0-based) as an RGB uint8 array. Only this page is decoded,
+    so memory does not grow with the page count.
+    """
+    if kind == "pdf":
+        import pypdfium2
+        pdf = pypdfium2.PdfDocument(path)
+        try:
+            page = pdf[index]
+            width, height = page.get_size()
+            scale = dpi / PDF_POINTS_PER_INCH
+            pixels = width * height * scale * scale
+            if pixels > OCR_DOC_MAX_PAGE_MP * 1_000_000:
+                scale *= (OCR_DOC_MAX_PAGE_MP * 1_000_000 / pixels) ** 0.5
+            bitmap = page.render(scale=scale)
+            image = bitmap.to_pil().convert("RGB")
+            bitmap.close()
+            page.close()
+        finally:
+            pdf.close()
+    else:
+        with Image.open(path) as source:
+            source.seek(index)
+            image = source.convert("RGB")
+            pixels = image.width * image.height
+            if pixels > OCR_DOC_MAX_PAGE_MP * 1_000_000:
+                factor = (OCR_DOC_MAX_PAGE_MP * 1_000_000 / pixels) ** 0.5
+                image = image.resize((int(image.width * factor), int(image.height * factor)), Image.Resampling.LANCZOS)
+    return np.asarray(image)
@@ -0,0 +1,163 @@
+import numpy as np
+
+# Layout thresholds are multiples of the median text box height, so they follow the DPI
+# Box centers closer than this are on the same line
+LINE_TOLERANCE = 0.5
+# A vertical gap this large between two lines starts a new paragraph
+PARAGRAPH_GAP = 0.9
+# So does a first line indented by at least this much
+PARAGRAPH_INDENT = 2.0
+# Columns are separated by empty vertical strips at least this wide
+COLUMN_GAP = 1.5
+# Share of the boxes allowed to cross a column gap (headings, rules, page-wide titles)
+SPANNING_SHARE = 0.02
+# A column needs at least this many boxes of its own, otherwise its gap is ignored
+MIN_COLUMN_BOXES = 3
+
+
+def box_arrays(bboxes):
+    """(N, 4) float array of axis-aligned [x0, y0, x1, y1] boxes from quads (N, 4, 2)"""
+    quads = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4, 2)
+    return np.concatenate([quads.min(axis=1), quads.max(axis=1)], axis=1)
+
+
+def _gutters(boxes, unit):
+    """Centers (x) of the column gaps: interior strips that (almost) no box covers"""
+    left, right = boxes[:, 0].min(), boxes[:, 2].max()
+    step = unit / 2
+    bins = int((right - left) / step) + 1
+    start = ((boxes[:, 0] - left) / step).astype(np.int64)
+    end = np.minimum(np.ceil((boxes[:, 2] - left) / step).astype(np.int64), bins)
+    delta = np.zeros(bins + 1, dtype=np.int64)
+    np.add.at(delta, start, 1)
+    np.add.at(delta, end, -1)
+    empty = np.cumsum(delta)[:bins] <= max(1, int(SPANNING_SHARE * len(boxes)))
+
+    edges = np.diff(np.concatenate(([0], empty.astype(np.int8), [0])))
+    runs = zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1))
+    return [
+        left + (s + e) / 2 * step
+        for s, e in runs
+        if s > 0 and e < bins and (e - s) * step >= COLUMN_GAP * unit
+    ]
+
+
+def assign_columns(boxes, unit):
+    """
+    Column index of every box (-1 for boxes crossing a column gap, such as headings) and
+    the gap centers. Gaps that would leave a column with fewer than MIN_COLUMN_BOXES boxes
+    (a page number in the margin, a short last line) are dropped.
+    """
+    gutters = _gutters(boxes, unit) if len(boxes) >= 2 * MIN_COLUMN_BOXES else []
+    while True:
+        first = np.searchsorted(gutters, boxes[:, 0])
+        last = np.searchsorted(gutters, boxes[:, 2])
+        column = np.where(first == last, first, -1)
+        if not gutters:
+            return column, gutters
+        sizes = np.bincount(column[column >= 0], minlength=len(gutters) + 1)
+        small = int(np.argmin(sizes))
+        if sizes[small] >= MIN_COLUMN_BOXES:
+            return column, gutters
+        # Merge the smallest column into a neighbour
+        gutters = gutters[:small] + gutters[small + 1:] if small < len(gutters) else gutters[:-1]
+
+
+def analyze_layout(bboxes):
+    """
+    Reading order and structure of text boxes (quads, as returned by easyocr).
+    Boxes are assigned to columns, grouped into lines (centers within LINE_TOLERANCE median
+    heights) and lines into paragraphs (by vertical gap and indent). Boxes that cross
+    columns split the page into bands read top to bottom; inside a band, columns are read
+    left to right. Vectorized: a few milliseconds for thousands of boxes.
+
+    Returns {"order": indices in reading order, "column", "block", "line": per-box ids,
+    "median_height": float}. Block (paragraph) and line ids follow the reading order.
+    """
+    count = len(bboxes)
+    if count == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return {"order": empty, "column": empty, "block": empty, "line": empty, "median_height": 0.0}
+
+    boxes = box_arrays(bboxes)
+    unit = max(float(np.median(boxes[:, 3] - boxes[:, 1])), 1.0)
+    cy = (boxes[:, 1] + boxes[:, 3]) / 2
+    column, gutters = assign_columns(boxes, unit)
+
+    # Bands: boxes between two spanning boxes get an even band, each spanning box the odd band after them
+    spanning_cy = np.sort(cy[column < 0])
+    band = 2 * np.searchsorted(spanning_cy, cy)
+    band[column < 0] += 1
+    segment = band * (len(gutters) + 2) + column + 1
+
+    # Lines: sorted by segment then height, a new line wherever the center jumps
+    by_height = np.lexsort((cy, segment))
+    new_line = np.ones(count, dtype=bool)
+    new_line[1:] = (np.diff(segment[by_height]) != 0) | (np.diff(cy[by_height]) > LINE_TOLERANCE * unit)
+    line = np.empty(count, dtype=np.int64)
+    line[by_height] = np.cumsum(new_line) - 1
+
+    # Reading order: line by line, left to right inside a line
+    order = np.lexsort((boxes[:, 0], line))
+    starts = np.flatnonzero(np.concatenate(([True], np.diff(line[order]) != 0)))
+    line_x0 = np.minimum.reduceat(boxes[order, 0], starts)
+    line_y0 = np.minimum.reduceat(boxes[order, 1], starts)
+    line_y1 = np.maximum.reduceat(boxes[order, 3], starts)
+    line_segment = segment[order][starts]
+
+    # Paragraphs: consecutive lines of a segment, split on large gaps and indented first lines
+    new_block = np.ones(len(starts), dtype=bool)
+    new_block[1:] = (
+        (np.diff(line_segment) != 0)
+        | (line_y0[1:] - line_y1[:-1] > PARAGRAPH_GAP * unit)
+        | (line_x0[1:] - line_x0[:-1] > PARAGRAPH_INDENT * unit)
+    )
+    block_of_line = np.cumsum(new_block) - 1
+
+    return {
+        "order": order,
+        "column": column,
+        "block": block_of_line[line],
+        "line": line,
+        "median_height": unit,
+    }
+
+
+def build_blocks(items):
+    """
+    Structured blocks (paragraphs) from OCR items carrying "block"/"line"/"column" ids, in
+    reading order: [{"id", "column", "region", "bbox", "text", "lines": [{"bbox", "text", "items"}]}].
+    "items" are indices into `items`; detection-only items give blocks without text.
+    """
+    blocks = []
+    current = None
+    for index, item in enumerate(items):
+        key = (item.get("region"), item["block"])
+        if current is None or current["_key"] != key:
+            current = {"_key": key, "id": len(blocks), "column": item["column"], "region": item.get("region"), "lines": []}
+            blocks.append(current)
+        if not current["lines"] or current["lines"][-1]["_line"] != item["line"]:
+            current["lines"].append({"_line": item["line"], "items": []})
+        current["lines"][-1]["items"].append(index)
+
+    for block in blocks:
+        for line in block["lines"]:
+            line["bbox"] = _union([items[i]["bbox"] for i in line["items"]])
+            if "text" in items[line["items"][0]]:
+                line["text"] = " ".join(items[i]["text"] for i in line["items"])
+            del line["_line"]
+        block["bbox"] = _union([line["bbox"] for line in block["lines"]])
+        if "text" in block["lines"][0]:
+            block["text"] = "\n".join(line["text"] for line in block["lines"])
+        if block["region"] is None:
+            del block["region"]
+        del block["_key"]
+    return blocks
+
+
+def _union(boxes):
+    """[x0, y0, x1, y1] around quads or boxes"""
+    points = np.concatenate([np.asarray(b, dtype=np.float64).reshape(-1, 2) for b in boxes])
+    x0, y0 = points.min(axis=0)
+    x1, y1 = points.max(axis=0)
+    return [float(x0), float(y0), float(x1), float(y1)]
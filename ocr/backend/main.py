@@ -1,6 +1,19 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from utils import OCRProcessor
+from fastapi.responses import StreamingResponse
+from worker_pool import OCRWorkerPool, QueueFullError, ClientDisconnectedError
+from layout import build_blocks
+from blobs import BlobNotFoundError, read_blob
+from preprocess import parse_chain
+from result_cache import ResultCache, cache_key, content_hash, file_hash
+from documents import save_document, document_kind, page_count, OCR_DOC_DPI, OCR_DOC_MAX_DPI, OCR_DOC_MAX_PAGES
+from typing import Optional
+import asyncio
+import collections
+import json
+import os
+import time
 import uvicorn
 
 app = FastAPI(title="OCR Backend Service")
@@ -14,13 +27,28 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize OCR Processor
-try:
-    ocr_processor = OCRProcessor()
-except Exception as e:
-    print(f"Error initializing OCR: {e}")
-    # We might want to handle this differently in production
-    ocr_processor = None
+# OCR runs in worker processes, each with its own reader (see worker_pool.py)
+ocr_pool = OCRWorkerPool()
+# Results by image content, language set and mode (see result_cache.py)
+result_cache = ResultCache()
+
+# Times a document page waits for room in a full OCR queue before the stream fails
+DOCUMENT_QUEUE_RETRIES = 60
+# Regions accepted by one /ocr request
+MAX_REGIONS = 64
+
+@app.on_event("startup")
+async def startup_event():
+    try:
+        await ocr_pool.start()
+    except Exception as e:
+        print(f"Error initializing OCR: {e}")
+        await ocr_pool.stop()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await ocr_pool.stop()
+    result_cache.close()
 
 @app.get("/")
 def read_root():
@@ -28,28 +56,268 @@ def read_root():
 
 @app.get("/health")
 def health_check():
-    return {"status": "healthy", "service": "ocr"}
+    return {"status": "healthy", "service": "ocr", "queue_depth": ocr_pool.depth()}
+
+@app.get("/metrics")
+def metrics():
+    return {"ocr_pool": ocr_pool.metrics(), "result_cache": result_cache.metrics()}
+
+
+async def run_ocr(request, method, *args, **kwargs):
+    """Run an OCRProcessor method on the worker pool, mapping pool errors to HTTP errors"""
+    try:
+        return await ocr_pool.submit(method, *args, request=request, **kwargs)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except ClientDisconnectedError as e:
+        raise HTTPException(status_code=499, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def read_upload(file, blob_id):
+    """Image bytes from the `file` upload or, by reference, from the shared blob store"""
+    if blob_id:
+        try:
+            return await run_in_threadpool(read_blob, blob_id)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except BlobNotFoundError as e:
+            raise HTTPException(status_code=410, detail=str(e))
+    if file is None:
+        raise HTTPException(status_code=400, detail="Provide the image 'file' or a 'blob_id'")
+    return await file.read()
+
+
+def parse_languages(languages):
+    """Comma-separated language codes from a form field, or None for the service default"""
+    if not languages:
+        return None
+    parsed = [lang.strip() for lang in languages.split(",") if lang.strip()]
+    return parsed or None
+
+
+def parse_preprocess(preprocess):
+    """Preprocessing steps from a form field ("resize,grayscale,deskew,binarize" or "none"), or None for the default"""
+    if preprocess is None or not preprocess.strip():
+        return None
+    try:
+        return parse_chain(preprocess)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def parse_regions(regions):
+    """Validate the JSON region list of /ocr: [[x0, y0, x1, y1], ...] in image pixels"""
+    if not regions:
+        return None
+    try:
+        regions = json.loads(regions)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="'regions' must be JSON")
+    if (not isinstance(regions, list) or len(regions) > MAX_REGIONS
+            or not all(isinstance(r, list) and len(r) == 4 for r in regions)):
+        raise HTTPException(
+            status_code=400, detail=f"'regions' must be a list of up to {MAX_REGIONS} [x0, y0, x1, y1] boxes"
+        )
+    try:
+        regions = [[float(v) for v in r] for r in regions]
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="'regions' coordinates must be numbers")
+    if any(r[2] <= r[0] or r[3] <= r[1] for r in regions):
+        raise HTTPException(status_code=400, detail="Each region needs x1 > x0 and y1 > y0")
+    return regions or None
 
 
 @app.post("/ocr")
-async def perform_ocr(file: UploadFile = File(...)):
-    if not ocr_processor:
+async def perform_ocr(
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    blob_id: Optional[str] = Form(None),
+    tiled: Optional[bool] = Form(None),
+    adaptive: Optional[bool] = Form(None),
+    languages: Optional[str] = Form(None),
+    regions: Optional[str] = Form(None),
+    detect_only: bool = Form(False),
+    layout: bool = Form(False),
+    preprocess: Optional[str] = Form(None),
+):
+    """
+    Read the text of an image (uploaded, or a `blob_id` from the shared blob store), in
+    reading order. `regions` limits OCR to a JSON list of [x0, y0, x1, y1] boxes (each
+    result then has a "region" index); `detect_only=true`
+    returns text boxes without recognizing them, which is much cheaper. Results carry
+    their column, block (paragraph) and line ids; `layout=true` adds the blocks themselves.
+    `preprocess` picks the preprocessing chain (e.g. "resize,grayscale,deskew,binarize").
+    Results are cached by image content and options ("cached": true on a repeat).
+    """
+    if not ocr_pool.started:
         raise HTTPException(status_code=500, detail="OCR Processor not initialized")
     
-    if not file.content_type or not file.content_type.startswith("image/"):
+    if file is not None and not blob_id and (not file.content_type or not file.content_type.startswith("image/")):
         raise HTTPException(status_code=400, detail="File must be an image")
     
+    options = {
+        "tiled": tiled,
+        "adaptive": adaptive,
+        "languages": parse_languages(languages),
+        "regions": parse_regions(regions),
+        "detect_only": detect_only,
+        "preprocess": parse_preprocess(preprocess),
+    }
+
     try:
-        contents = await file.read()
-        results = ocr_processor.process_image(contents)
-        return {
-            "filename": file.filename,
+        # A blob id already is the SHA-256 of the image, so a cached result needs no read
+        contents = None if blob_id else await read_upload(file, blob_id)
+        digest = blob_id or await run_in_threadpool(content_hash, contents)
+        key = cache_key(digest, kind="image", **options)
+        results = await run_in_threadpool(result_cache.get, key)
+        cached = results is not None
+        if not cached:
+            if contents is None:
+                contents = await read_upload(file, blob_id)
+            results = await run_ocr(request, "process_image", contents, **options)
+            await run_in_threadpool(result_cache.put, key, results)
+        response = {
+            "filename": file.filename if file is not None else None,
             "results": results,
-            "count": len(results)
+            "count": len(results),
+            "cached": cached,
         }
+        if layout:
+            response["blocks"] = await run_in_threadpool(build_blocks, results)
+        return response
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def submit_waiting(request, method, *args, **kwargs):
+    """Queue an OCR job for a long-running stream, waiting for room when the queue is full"""
+    for _ in range(DOCUMENT_QUEUE_RETRIES):
+        try:
+            return await ocr_pool.submit(method, *args, request=request, **kwargs)
+        except QueueFullError:
+            await asyncio.sleep(1)
+    raise QueueFullError("OCR queue stayed full")
+
+
+def remove_document(path):
+    try:
+        os.remove(path)
+    except OSError as e:
+        print(f"Could not remove {path}: {e}")
+
+
+@app.post("/ocr/document")
+async def perform_document_ocr(
+    request: Request,
+    file: UploadFile = File(...),
+    dpi: Optional[int] = Form(None),
+    tiled: Optional[bool] = Form(None),
+    adaptive: Optional[bool] = Form(None),
+    languages: Optional[str] = Form(None),
+    detect_only: bool = Form(False),
+    layout: bool = Form(False),
+    preprocess: Optional[str] = Form(None),
+):
+    """
+    OCR a multi-page PDF or TIFF (a single image works too). Pages are rasterized one at a
+    time inside the workers at `dpi` and OCRed in parallel across the pool. Results stream
+    back as NDJSON in page order: a "start" line, one "page" line per page (same reading
+    order as /ocr) and an "end" line. At most one page per worker is in memory at a time.
+    """
+    if not ocr_pool.started:
+        raise HTTPException(status_code=500, detail="OCR Processor not initialized")
+    dpi = dpi or OCR_DOC_DPI
+    options = {
+        "tiled": tiled,
+        "adaptive": adaptive,
+        "languages": parse_languages(languages),
+        "detect_only": detect_only,
+        "preprocess": parse_preprocess(preprocess),
+    }
+    if not 36 <= dpi <= OCR_DOC_MAX_DPI:
+        raise HTTPException(status_code=400, detail=f"'dpi' must be between 36 and {OCR_DOC_MAX_DPI}")
+
+    path = await run_in_threadpool(save_document, file.file, file.filename)
+    try:
+        kind = await run_in_threadpool(document_kind, path)
+        pages = await run_in_threadpool(page_count, path, kind)
+        digest = await run_in_threadpool(file_hash, path)
+    except Exception as e:
+        await run_in_threadpool(remove_document, path)
+        raise HTTPException(status_code=400, detail=f"Could not read the document: {e}")
+    if pages > OCR_DOC_MAX_PAGES:
+        await run_in_threadpool(remove_document, path)
+        raise HTTPException(status_code=413, detail=f"Documents are limited to {OCR_DOC_MAX_PAGES} pages")
+
+    print(f"OCR of {file.filename}: {pages} page(s) at {dpi} DPI")
+
+    async def read_page(index):
+        """A page from the result cache, or OCRed by the pool and then cached"""
+        key = cache_key(digest, kind="page", page=index, dpi=dpi, **options)
+        page = await run_in_threadpool(result_cache.get, key)
+        if page is not None:
+            return page, True
+        page = await submit_waiting(request, "process_page", path, kind, index, dpi, **options)
+        await run_in_threadpool(result_cache.put, key, page)
+        return page, False
+
+    async def stream():
+        start = time.perf_counter()
+        # Pages in flight, oldest first; one per worker plus one so no worker idles
+        # while the oldest result is being sent
+        window = collections.deque()
+        next_page = 0
+        total = 0
+        try:
+            yield (json.dumps({"type": "start", "filename": file.filename, "pages": pages, "dpi": dpi}) + "\n").encode("utf-8")
+            while next_page < pages or window:
+                while next_page < pages and len(window) <= ocr_pool.workers:
+                    window.append(asyncio.ensure_future(read_page(next_page)))
+                    next_page += 1
+                page_number = next_page - len(window) + 1
+                try:
+                    page, cached = await window.popleft()
+                except (ClientDisconnectedError, QueueFullError):
+                    raise
+                except Exception as e:
+                    yield (json.dumps({"type": "page", "page": page_number, "status": "error", "error": str(e)}) + "\n").encode("utf-8")
+                    continue
+                total += len(page["results"])
+                if layout:
+                    page["blocks"] = await run_in_threadpool(build_blocks, page["results"])
+                yield (json.dumps({
+                    "type": "page",
+                    "page": page_number,
+                    "status": "ok",
+                    **page,
+                    "count": len(page["results"]),
+                    "cached": cached,
+                }) + "\n").encode("utf-8")
+
+            elapsed = time.perf_counter() - start
+            yield (json.dumps({
+                "type": "end",
+                "pages": pages,
+                "count": total,
+                "elapsed_ms": round(elapsed * 1000, 1),
+            }) + "\n").encode("utf-8")
+        except ClientDisconnectedError:
+            return
+        except Exception as e:
+            print(f"Error: document OCR stopped: {e}")
+            yield (json.dumps({"type": "error", "detail": str(e)}) + "\n").encode("utf-8")
+        finally:
+            for task in window:
+                task.cancel()
+            await asyncio.gather(*window, return_exceptions=True)
+            await run_in_threadpool(remove_document, path)
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8004)
 
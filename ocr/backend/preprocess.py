@@ -0,0 +1,139 @@
+import os
+
+import cv2
+import numpy as np
+
+# Preprocessing chain applied before OCR unless the request picks one (comma-separated steps,
+# applied in order; empty = none)
+OCR_PREPROCESS = os.getenv("OCR_PREPROCESS", "")
+# "resize": images with a longer side are scaled down to it
+OCR_PREPROCESS_MAX_SIDE = int(os.getenv("OCR_PREPROCESS_MAX_SIDE", "2560"))
+# "deskew": rotations searched, in degrees either way
+OCR_DESKEW_MAX_ANGLE = float(os.getenv("OCR_DESKEW_MAX_ANGLE", "10"))
+# "binarize": neighbourhood (px, odd) and offset of the adaptive threshold
+OCR_BINARIZE_BLOCK = int(os.getenv("OCR_BINARIZE_BLOCK", "31"))
+OCR_BINARIZE_OFFSET = int(os.getenv("OCR_BINARIZE_OFFSET", "15"))
+
+# Skew is estimated on a copy this size, from at most this many ink pixels
+DESKEW_SIDE = 1024
+DESKEW_SAMPLES = 50000
+# Smaller estimated skews are left alone, as are those that barely sharpen the line profile
+# (a few words, photos without lines of text)
+DESKEW_MIN_ANGLE = 0.2
+DESKEW_MIN_GAIN = 0.1
+
+
+def parse_chain(chain):
+    """Step names from "resize,grayscale,..." ("none" for no preprocessing); ValueError on unknown steps"""
+    steps = [step.strip().lower() for step in (chain or "").split(",") if step.strip()]
+    if steps == ["none"]:
+        return []
+    unknown = [step for step in steps if step not in STEPS]
+    if unknown:
+        raise ValueError(f"Unknown preprocessing step(s) {unknown}; use {', '.join(STEPS)} or none")
+    return steps
+
+
+def _gray(img):
+    return img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+
+
+def resize(img):
+    """Scale down to OCR_PREPROCESS_MAX_SIDE; returns the image and the matrix back to the input"""
+    height, width = img.shape[:2]
+    scale = OCR_PREPROCESS_MAX_SIDE / max(height, width)
+    if scale >= 1:
+        return img, None
+    small = cv2.resize(img, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+    return small, np.array([[1 / scale, 0, 0], [0, 1 / scale, 0]])
+
+
+def grayscale(img):
+    return _gray(img), None
+
+
+def estimate_skew(gray):
+    """
+    Text line angle in degrees (positive when lines go down to the right). Ink pixels are
+    projected on rows for every candidate angle at once; the angle whose projection has the
+    sharpest peaks (lines falling into the fewest rows) wins. Coarse 0.5° search, then 0.05°.
+    0 when no angle clearly beats leaving the image as it is.
+    """
+    scale = min(1.0, DESKEW_SIDE / max(gray.shape))
+    if scale < 1:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    _, ink = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    ys, xs = np.nonzero(ink)
+    if len(xs) < 100:
+        return 0.0
+    if len(xs) > DESKEW_SAMPLES:
+        pick = np.random.default_rng(0).choice(len(xs), DESKEW_SAMPLES, replace=False)
+        xs, ys = xs[pick], ys[pick]
+    xs = xs.astype(np.float64) - gray.shape[1] / 2
+    ys = ys.astype(np.float64)
+
+    def best(angles):
+        radians = np.radians(angles)[:, None]
+        rows = np.round(ys * np.cos(radians) - xs * np.sin(radians)).astype(np.int64)
+        rows -= rows.min()
+        span = int(rows.max()) + 1
+        counts = np.bincount((rows + np.arange(len(angles))[:, None] * span).ravel(), minlength=len(angles) * span)
+        scores = (counts.reshape(len(angles), span).astype(np.float64) ** 2).sum(axis=1)
+        index = int(np.argmax(scores))
+        return float(angles[index]), scores[index]
+
+    coarse, _ = best(np.arange(-OCR_DESKEW_MAX_ANGLE, OCR_DESKEW_MAX_ANGLE + 0.25, 0.5))
+    angle, score = best(np.arange(coarse - 0.5, coarse + 0.5001, 0.05))
+    _, level = best(np.zeros(1))
+    return angle if score >= (1 + DESKEW_MIN_GAIN) * level else 0.0
+
+
+def deskew(img):
+    """Rotate text lines back to horizontal, on a canvas large enough to keep the corners"""
+    angle = estimate_skew(_gray(img))
+    if abs(angle) < DESKEW_MIN_ANGLE:
+        return img, None
+    height, width = img.shape[:2]
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    cos, sin = abs(matrix[0, 0]), abs(matrix[0, 1])
+    out_width, out_height = int(height * sin + width * cos + 0.5), int(height * cos + width * sin + 0.5)
+    matrix[0, 2] += (out_width - width) / 2
+    matrix[1, 2] += (out_height - height) / 2
+    border = 255 if img.ndim == 2 else (255, 255, 255)
+    rotated = cv2.warpAffine(
+        img, matrix, (out_width, out_height), flags=cv2.INTER_LINEAR,
+        borderMode=cv2.BORDER_CONSTANT, borderValue=border,
+    )
+    return rotated, cv2.invertAffineTransform(matrix)
+
+
+def binarize(img):
+    """Adaptive (local) threshold: black text on white, robust to shadows and uneven lighting"""
+    block = max(3, OCR_BINARIZE_BLOCK | 1)
+    return cv2.adaptiveThreshold(
+        _gray(img), 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, block, OCR_BINARIZE_OFFSET
+    ), None
+
+
+STEPS = {"resize": resize, "grayscale": grayscale, "deskew": deskew, "binarize": binarize}
+DEFAULT_CHAIN = parse_chain(OCR_PREPROCESS)
+
+
+def apply_chain(img, steps):
+    """
+    Run the chain on an RGB image. Returns the processed image (grayscale after "grayscale"
+    or "binarize"; easyocr reads both) and the 2x3 matrix mapping its pixels back to the
+    input, or None when the geometry did not change.
+    """
+    to_input = np.eye(3)
+    for step in steps:
+        img, back = STEPS[step](img)
+        if back is not None:
+            to_input = to_input @ np.vstack([back, [0, 0, 1]])
+    return img, (None if np.allclose(to_input, np.eye(3)) else to_input[:2])
+
+
+def map_points(points, matrix):
+    """Apply a 2x3 matrix from apply_chain() to [[x, y], ...]"""
+    points = np.asarray(points, dtype=np.float64)
+    return (points @ matrix[:, :2].T + matrix[:, 2]).tolist()
@@ -0,0 +1,99 @@
+import collections
+import os
+import time
+
+import easyocr
+import torch
+
+# Readers (one per language set) kept in each worker, least recently used evicted first
+OCR_READER_MEMORY_MB = int(os.getenv("OCR_READER_MEMORY_MB", "1024"))
+# Readers unused for this long are dropped (0 keeps them until the memory budget needs room)
+OCR_READER_IDLE_SECONDS = int(os.getenv("OCR_READER_IDLE_SECONDS", "900"))
+
+
+def language_key(languages):
+    """Canonical language set: lowercase, without duplicates, sorted"""
+    return tuple(sorted({lang.strip().lower() for lang in languages if lang.strip()}))
+
+
+def _module_bytes(module):
+    state = module.state_dict() if module is not None else {}
+    return sum(t.numel() * t.element_size() for t in state.values() if torch.is_tensor(t))
+
+
+class ReaderCache:
+    """
+    Lazily loaded easyocr readers keyed by language set, for one worker process.
+    The text detector (CRAFT) does not depend on the language, so it is loaded once and
+    shared: every later reader only loads its recognizer. Readers are evicted least
+    recently used first when their recognizers exceed `memory_mb`, and after
+    `idle_seconds` without use. The most recently used reader is always kept.
+    """
+
+    def __init__(self, memory_mb=OCR_READER_MEMORY_MB, idle_seconds=OCR_READER_IDLE_SECONDS):
+        self.memory_bytes = memory_mb * 2 ** 20
+        self.idle_seconds = idle_seconds
+        self._readers = collections.OrderedDict()
+        self._detector = None
+        self._stats = {"hits": 0, "loads": 0, "evictions": 0, "idle_evictions": 0}
+
+    def get(self, languages):
+        key = language_key(languages)
+        if not key:
+            raise ValueError("At least one language is required")
+        self._evict_idle()
+        entry = self._readers.get(key)
+        if entry is not None:
+            self._readers.move_to_end(key)
+            entry["last_used"] = time.monotonic()
+            self._stats["hits"] += 1
+            return entry["reader"]
+
+        reader = self._load(key)
+        self._readers[key] = {"reader": reader, "bytes": _module_bytes(reader.recognizer), "last_used": time.monotonic()}
+        self._stats["loads"] += 1
+        self._evict_over_budget()
+        return reader
+
+    def _load(self, key):
+        start = time.perf_counter()
+        try:
+            if self._detector is None:
+                reader = easyocr.Reader(list(key))
+                self._detector = {
+                    "detector": reader.detector,
+                    "detect_network": reader.detect_network,
+                    "get_textbox": reader.get_textbox,
+                    "get_detector": reader.get_detector,
+                }
+            else:
+                reader = easyocr.Reader(list(key), detector=False)
+                for name, value in self._detector.items():
+                    setattr(reader, name, value)
+        except ValueError as e:
+            raise ValueError(f"Unsupported language set {list(key)}: {' '.join(str(a) for a in e.args)}")
+        print(f"Loaded OCR reader for {list(key)} in {time.perf_counter() - start:.1f}s")
+        return reader
+
+    def _evict_idle(self):
+        if self.idle_seconds <= 0:
+            return
+        now = time.monotonic()
+        idle = [k for k, e in list(self._readers.items())[:-1] if now - e["last_used"] > self.idle_seconds]
+        for key in idle:
+            del self._readers[key]
+            self._stats["idle_evictions"] += 1
+
+    def _evict_over_budget(self):
+        while len(self._readers) > 1 and sum(e["bytes"] for e in self._readers.values()) > self.memory_bytes:
+            key, _ = self._readers.popitem(last=False)
+            self._stats["evictions"] += 1
+            print(f"Evicted OCR reader for {list(key)} (memory budget)")
+
+    def metrics(self):
+        return {
+            "loaded": [list(key) for key in self._readers],
+            "memory_mb": round(sum(e["bytes"] for e in self._readers.values()) / 2 ** 20, 1),
+            "capacity_mb": round(self.memory_bytes / 2 ** 20, 1),
+            **self._stats,
+        }
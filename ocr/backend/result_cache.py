@@ -0,0 +1,190 @@
+import collections
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# OCR results kept in memory (LRU), as JSON; about 1 KB per line of text
+OCR_CACHE_MEMORY_MB = int(os.getenv("OCR_CACHE_MEMORY_MB", "64"))
+# SQLite file that keeps results across restarts (empty disables the disk tier)
+OCR_CACHE_DB = os.getenv("OCR_CACHE_DB", "")
+# Results kept in the SQLite file, least recently used removed first
+OCR_CACHE_DB_MAX_ENTRIES = int(os.getenv("OCR_CACHE_DB_MAX_ENTRIES", "100000"))
+
+# Settings that change OCR output: a result cached under other values is not reused
+RESULT_SETTINGS = (
+    "OCR_LANGUAGES", "OCR_ADAPTIVE", "OCR_FAST_SIDE", "OCR_REREAD_CONFIDENCE",
+    "OCR_TILE_SIZE", "OCR_TILE_OVERLAP", "OCR_TILE_MIN_SIDE", "OCR_PREPROCESS", "OCR_PREPROCESS_MAX_SIDE",
+    "OCR_DESKEW_MAX_ANGLE", "OCR_BINARIZE_BLOCK", "OCR_BINARIZE_OFFSET",
+)
+# Bump when the shape of the results changes
+RESULT_FORMAT = 1
+
+# The disk tier is trimmed every this many stores
+PRUNE_EVERY = 100
+HASH_CHUNK = 1 << 20
+
+
+def content_hash(data):
+    """SHA-256 of uploaded bytes"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_hash(path):
+    """SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _settings():
+    return {name: os.getenv(name) for name in RESULT_SETTINGS}
+
+
+def cache_key(digest, **options):
+    """
+    Key of one OCR result: content hash, request options (language set, mode, regions,
+    page...) and the service settings that affect the output
+    """
+    if options.get("languages"):
+        options["languages"] = sorted({lang.lower() for lang in options["languages"]})
+    payload = json.dumps(
+        {"format": RESULT_FORMAT, "content": digest, "options": options, "settings": _settings()},
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Two-tier cache of OCR results: an in-memory LRU bounded by `memory_mb`, and an optional
+    SQLite file (`db_path`) that survives restarts. Values are stored as JSON, so every hit
+    returns a fresh copy. Thread-safe; SQLite calls block, so run them off the event loop.
+    """
+
+    def __init__(self, memory_mb=OCR_CACHE_MEMORY_MB, db_path=OCR_CACHE_DB, db_max_entries=OCR_CACHE_DB_MAX_ENTRIES):
+        self.memory_bytes = memory_mb * 2 ** 20
+        self.db_path = db_path or None
+        self.db_max_entries = max(1, db_max_entries)
+        self._entries = collections.OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._db = None
+        self._stores = 0
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "disk_errors": 0}
+        if self.db_path:
+            self._open()
+
+    def _open(self):
+        try:
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute('''
+                CREATE TABLE IF NOT EXISTS ocr_results (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            ''')
+            self._db.execute("CREATE INDEX IF NOT EXISTS ocr_results_last_used ON ocr_results (last_used)")
+            self._db.commit()
+            print(f"OCR result cache on disk: {self.db_path}")
+        except sqlite3.Error as e:
+            print(f"Error opening OCR result cache {self.db_path}: {e}")
+            self._db = None
+
+    def get(self, key):
+        """Cached result for `key`, or None"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return json.loads(value)
+            if self._db is not None:
+                try:
+                    row = self._db.execute("SELECT value FROM ocr_results WHERE key = ?", (key,)).fetchone()
+                    if row is not None:
+                        self._db.execute("UPDATE ocr_results SET last_used = ? WHERE key = ?", (time.time(), key))
+                        self._db.commit()
+                        self._remember(key, row[0])
+                        self._stats["disk_hits"] += 1
+                        return json.loads(row[0])
+                except sqlite3.Error as e:
+                    self._disk_error(e)
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, key, result):
+        value = json.dumps(result)
+        with self._lock:
+            self._remember(key, value)
+            self._stats["stores"] += 1
+            if self._db is None:
+                return
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO ocr_results (key, value, last_used) VALUES (?, ?, ?)",
+                    (key, value, time.time()),
+                )
+                self._stores += 1
+                if self._stores % PRUNE_EVERY == 0:
+                    self._prune()
+                self._db.commit()
+            except sqlite3.Error as e:
+                self._disk_error(e)
+
+    def _remember(self, key, value):
+        if len(value) > self.memory_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._size -= len(previous)
+        self._entries[key] = value
+        self._size += len(value)
+        while self._size > self.memory_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+            self._stats["evictions"] += 1
+
+    def _prune(self):
+        self._db.execute('''
+            DELETE FROM ocr_results WHERE key IN (
+                SELECT key FROM ocr_results ORDER BY last_used DESC LIMIT -1 OFFSET ?
+            )
+        ''', (self.db_max_entries,))
+
+    def _disk_error(self, error):
+        self._stats["disk_errors"] += 1
+        print(f"Error: OCR result cache on disk: {error}")
+
+    def metrics(self):
+        with self._lock:
+            hits = self._stats["memory_hits"] + self._stats["disk_hits"]
+            lookups = hits + self._stats["misses"]
+            disk_entries = None
+            if self._db is not None:
+                try:
+                    disk_entries = self._db.execute("SELECT COUNT(*) FROM ocr_results").fetchone()[0]
+                except sqlite3.Error as e:
+                    self._disk_error(e)
+            return {
+                "entries": len(self._entries),
+                "memory_mb": round(self._size / 2 ** 20, 1),
+                "capacity_mb": round(self.memory_bytes / 2 ** 20, 1),
+                "disk": self.db_path,
+                "disk_entries": disk_entries,
+                "hit_rate": round(hits / lookups, 3) if lookups else None,
+                **self._stats,
+            }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
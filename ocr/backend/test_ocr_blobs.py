@@ -0,0 +1,36 @@
+import hashlib
+from pathlib import Path
+
+import pytest
+
+import blobs
+from blobs import BlobNotFoundError, read_blob
+
+
+def test_read_blob(tmp_path, monkeypatch):
+    monkeypatch.setattr(blobs, "BLOB_STORE_DIR", str(tmp_path))
+    blob_id = hashlib.sha256(b"scan").hexdigest()
+    (tmp_path / blob_id[:2]).mkdir()
+    (tmp_path / blob_id[:2] / blob_id).write_bytes(b"scan")
+    assert read_blob(blob_id) == b"scan"
+    with pytest.raises(BlobNotFoundError):
+        read_blob(hashlib.sha256(b"evicted").hexdigest())
+
+
+@pytest.mark.parametrize("blob_id", [None, "", "../../etc/passwd", "ABC" * 21 + "D", "0" * 63])
+def test_malformed_ids_are_rejected(blob_id):
+    with pytest.raises(ValueError):
+        read_blob(blob_id)
+
+
+def test_disabled_store(monkeypatch):
+    monkeypatch.setattr(blobs, "BLOB_STORE_DIR", "")
+    with pytest.raises(BlobNotFoundError):
+        read_blob("0" * 64)
+
+
+def test_service_copies_match_the_canonical_one():
+    canonical = Path(blobs.__file__).resolve()
+    root = canonical.parents[2]
+    for service in ("masking", "captionning"):
+        assert (root / service / "backend" / "blobs.py").read_bytes() == canonical.read_bytes(), service
@@ -0,0 +1,84 @@
+import numpy as np
+
+from layout import analyze_layout, build_blocks
+
+HEIGHT = 20
+
+
+def quad(x0, y0, x1, y1):
+    return [[x0, y0], [x1, y0], [x1, y1], [x0, y1]]
+
+
+def two_column_page():
+    """A page-wide title over two columns of 3-word lines; each column has two paragraphs"""
+    words = [("Title of the page", quad(50, 10, 950, 10 + HEIGHT))]
+    for column, x in (("L", 50), ("R", 550)):
+        y = 60
+        for line in range(4):
+            if line == 2:
+                y += 40  # paragraph break
+            for word in range(3):
+                # A little jitter on the baseline, as in real scans
+                dy = (line + word) % 3 - 1
+                words.append((f"{column}{line}{word}", quad(x + word * 130, y + dy, x + word * 130 + 110, y + dy + HEIGHT)))
+            y += HEIGHT + 10
+    return words
+
+
+def test_columns_lines_and_reading_order():
+    words = two_column_page()
+    rng = np.random.default_rng(0)
+    shuffled = [words[i] for i in rng.permutation(len(words))]
+    layout = analyze_layout([box for _, box in shuffled])
+    texts = [shuffled[i][0] for i in layout["order"]]
+
+    expected = ["Title of the page"]
+    for column in "LR":
+        expected += [f"{column}{line}{word}" for line in range(4) for word in range(3)]
+    assert texts == expected
+
+    column_of = {text: int(layout["column"][i]) for i, (text, _) in enumerate(shuffled)}
+    assert column_of["Title of the page"] == -1
+    assert {column_of[f"L{l}{w}"] for l in range(4) for w in range(3)} == {0}
+    assert {column_of[f"R{l}{w}"] for l in range(4) for w in range(3)} == {1}
+
+    line_of = {text: int(layout["line"][i]) for i, (text, _) in enumerate(shuffled)}
+    for column in "LR":
+        for line in range(4):
+            assert len({line_of[f"{column}{line}{w}"] for w in range(3)}) == 1
+    # Same height, different columns: different lines
+    assert line_of["L00"] != line_of["R00"]
+    assert layout["median_height"] == HEIGHT
+
+
+def test_paragraphs_split_on_large_gaps():
+    words = two_column_page()
+    layout = analyze_layout([box for _, box in words])
+    block_of = {text: int(layout["block"][i]) for i, (text, _) in enumerate(words)}
+    for column in "LR":
+        assert block_of[f"{column}00"] == block_of[f"{column}10"]
+        assert block_of[f"{column}10"] != block_of[f"{column}20"]
+        assert block_of[f"{column}20"] == block_of[f"{column}30"]
+    assert len(set(block_of.values())) == 5
+
+
+def test_build_blocks_in_reading_order():
+    words = two_column_page()
+    layout = analyze_layout([box for _, box in words])
+    items = [
+        {"text": words[i][0], "bbox": words[i][1], "column": int(layout["column"][i]),
+         "block": int(layout["block"][i]), "line": int(layout["line"][i])}
+        for i in layout["order"]
+    ]
+    blocks = build_blocks(items)
+    assert [block["text"] for block in blocks[:2]] == ["Title of the page", "L00 L01 L02\nL10 L11 L12"]
+    assert blocks[1]["bbox"] == [50.0, 59.0, 420.0, 111.0]
+    assert [block["column"] for block in blocks] == [-1, 0, 0, 1, 1]
+
+
+def test_single_column_and_empty_input():
+    boxes = [quad(10, 10 + 30 * i, 200, 30 + 30 * i) for i in range(5)]
+    layout = analyze_layout(boxes)
+    assert layout["order"].tolist() == [0, 1, 2, 3, 4]
+    assert set(layout["column"].tolist()) == {0}
+    assert len(analyze_layout([])["order"]) == 0
@@ -0,0 +1,85 @@
+import cv2
+import numpy as np
+import pytest
+
+import preprocess
+from preprocess import apply_chain, estimate_skew, map_points, parse_chain
+
+
+@pytest.mark.parametrize("chain, expected", [
+    ("", []),
+    (None, []),
+    ("none", []),
+    (" NONE ", []),
+    ("resize", ["resize"]),
+    ("Resize, grayscale ,deskew,binarize", ["resize", "grayscale", "deskew", "binarize"]),
+    ("deskew,,resize,", ["deskew", "resize"]),
+])
+def test_parse_chain(chain, expected):
+    assert parse_chain(chain) == expected
+
+
+@pytest.mark.parametrize("chain", ["sharpen", "resize,sharpen", "none,resize"])
+def test_parse_chain_rejects_unknown_steps(chain):
+    with pytest.raises(ValueError):
+        parse_chain(chain)
+
+
+def text_page(angle=0.0, size=(1200, 900)):
+    """Dark text lines on a light page, rotated by `angle` degrees"""
+    width, height = size
+    page = np.full((height, width, 3), 235, dtype=np.uint8)
+    for y in range(120, height - 80, 70):
+        cv2.putText(page, "the quick brown fox jumps over the lazy dog", (60, y),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1.2, (20, 20, 20), 3, cv2.LINE_AA)
+    if angle:
+        matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+        page = cv2.warpAffine(page, matrix, (width, height), borderMode=cv2.BORDER_REPLICATE)
+    return page
+
+
+@pytest.mark.parametrize("angle", [-4.0, 2.5, 6.0])
+def test_estimate_skew(angle):
+    gray = cv2.cvtColor(text_page(angle), cv2.COLOR_RGB2GRAY)
+    # A page rotated counter-clockwise by `angle` has lines going up to the right
+    assert estimate_skew(gray) == pytest.approx(-angle, abs=0.3)
+
+
+def test_straight_and_blank_pages_are_left_alone():
+    image = text_page()
+    assert apply_chain(image, ["deskew"])[1] is None
+    blank = np.full((400, 600, 3), 255, dtype=np.uint8)
+    assert apply_chain(blank, ["deskew"])[1] is None
+
+
+def test_grayscale_and_binarize_keep_the_geometry():
+    image = text_page()
+    gray, to_input = apply_chain(image, ["grayscale"])
+    assert gray.shape == image.shape[:2] and to_input is None
+    binary, to_input = apply_chain(image, ["binarize"])
+    assert set(np.unique(binary).tolist()) <= {0, 255} and to_input is None
+
+
+def test_resize_maps_points_back(monkeypatch):
+    monkeypatch.setattr(preprocess, "OCR_PREPROCESS_MAX_SIDE", 600)
+    image = text_page(size=(1200, 900))
+    small, to_input = apply_chain(image, ["resize"])
+    assert small.shape[:2] == (450, 600)
+    np.testing.assert_allclose(
+        map_points([[0, 0], [300, 225], [600, 450]], to_input), [[0, 0], [600, 450], [1200, 900]]
+    )
+
+
+def test_deskew_maps_points_back():
+    angle = 5.0
+    width, height = 1200, 900
+    image = text_page(angle, (width, height))
+    straight, to_input = apply_chain(image, ["deskew"])
+    assert to_input is not None
+    # The straightened canvas is larger, centered on the input's center
+    assert straight.shape[0] > height and straight.shape[1] > width
+    center = [[straight.shape[1] / 2, straight.shape[0] / 2]]
+    np.testing.assert_allclose(map_points(center, to_input), [[width / 2, height / 2]], atol=1.0)
+    # Mapping back applies the rotation that skewed the page
+    skew = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    np.testing.assert_allclose(to_input[:, :2], skew[:, :2], atol=0.01)
@@ -0,0 +1,79 @@
+import pytest
+import torch
+
+pytest.importorskip("easyocr")
+import readers  # noqa: E402
+from readers import ReaderCache, language_key  # noqa: E402
+
+
+class FakeReader:
+    """easyocr.Reader with a 1 MB recognizer; records whether it loaded its own detector"""
+    loads = []
+
+    def __init__(self, languages, detector=True):
+        if "xx" in languages:
+            raise ValueError("({'xx'}, 'is not supported')")
+        self.recognizer = torch.nn.Linear(512, 512)
+        self.detector = object() if detector else None
+        self.detect_network = "craft"
+        self.get_textbox = self.get_detector = None
+        FakeReader.loads.append((tuple(languages), detector))
+
+
+@pytest.fixture(autouse=True)
+def fake_reader(monkeypatch):
+    FakeReader.loads = []
+    monkeypatch.setattr(readers.easyocr, "Reader", FakeReader)
+
+
+def test_language_key():
+    assert language_key(["FR", " en", "fr", ""]) == ("en", "fr")
+
+
+def test_detector_is_loaded_once_and_shared():
+    cache = ReaderCache(memory_mb=64, idle_seconds=0)
+    english = cache.get(["en"])
+    french = cache.get(["fr", "en"])
+    assert cache.get(["en", "fr"]) is french
+    assert french.detector is english.detector
+    assert FakeReader.loads == [(("en",), True), (("en", "fr"), False)]
+    metrics = cache.metrics()
+    assert metrics["loads"] == 2 and metrics["hits"] == 1
+
+
+def test_least_recently_used_reader_is_evicted():
+    # Each fake recognizer is about 1 MB: two fit, a third evicts the oldest
+    cache = ReaderCache(memory_mb=2.5, idle_seconds=0)
+    cache.get(["en"])
+    cache.get(["fr"])
+    cache.get(["en"])
+    cache.get(["de"])
+    metrics = cache.metrics()
+    assert metrics["loaded"] == [["en"], ["de"]] and metrics["evictions"] == 1
+
+
+def test_most_recent_reader_is_kept_over_budget():
+    cache = ReaderCache(memory_mb=0, idle_seconds=0)
+    cache.get(["en"])
+    cache.get(["fr"])
+    assert cache.metrics()["loaded"] == [["fr"]]
+
+
+def test_idle_readers_are_dropped(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(readers.time, "monotonic", lambda: now[0])
+    cache = ReaderCache(memory_mb=64, idle_seconds=60)
+    cache.get(["en"])
+    cache.get(["fr"])
+    now[0] += 120
+    cache.get(["de"])
+    metrics = cache.metrics()
+    assert metrics["loaded"] == [["fr"], ["de"]] and metrics["idle_evictions"] == 1
+
+
+def test_bad_language_sets_are_rejected():
+    cache = ReaderCache()
+    with pytest.raises(ValueError):
+        cache.get([" "])
+    with pytest.raises(ValueError, match="Unsupported language set"):
+        cache.get(["xx"])
@@ -0,0 +1,75 @@
+import result_cache
+from result_cache import ResultCache, cache_key, content_hash, file_hash
+
+RESULT = {"text": "total 12.50", "lines": [{"text": "total 12.50", "confidence": 0.93}]}
+
+
+def test_key_follows_content_and_options():
+    digest = content_hash(b"scan")
+    key = cache_key(digest, languages=["fr", "EN"], mode="full")
+    assert key == cache_key(digest, languages=["en", "fr", "en"], mode="full")
+    assert key != cache_key(content_hash(b"other scan"), languages=["en", "fr"], mode="full")
+    assert key != cache_key(digest, languages=["en"], mode="full")
+    assert key != cache_key(digest, languages=["en", "fr"], mode="detect")
+
+
+def test_key_follows_output_settings(monkeypatch):
+    digest = content_hash(b"scan")
+    before = cache_key(digest, mode="full")
+    monkeypatch.setenv("OCR_TILE_SIZE", "800")
+    assert cache_key(digest, mode="full") != before
+
+
+def test_file_hash_matches_content_hash(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_cache, "HASH_CHUNK", 7)
+    path = tmp_path / "page.bin"
+    path.write_bytes(b"x" * 100)
+    assert file_hash(path) == content_hash(b"x" * 100)
+
+
+def test_memory_hit_and_miss():
+    cache = ResultCache(memory_mb=1, db_path="")
+    key = cache_key(content_hash(b"scan"), mode="full")
+    assert cache.get(key) is None
+    cache.put(key, RESULT)
+    hit = cache.get(key)
+    assert hit == RESULT
+    # Every hit is a copy: callers may change it freely
+    hit["text"] = ""
+    assert cache.get(key) == RESULT
+    metrics = cache.metrics()
+    assert metrics["misses"] == 1 and metrics["memory_hits"] == 2 and metrics["disk_entries"] is None
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = ResultCache(memory_mb=1, db_path="")
+    cache.memory_bytes = 3 * len('{"n": 0}')
+    for n in range(3):
+        cache.put(f"k{n}", {"n": n})
+    cache.get("k0")
+    cache.put("k3", {"n": 3})
+    assert cache.get("k1") is None and cache.get("k0") == {"n": 0}
+    assert cache.metrics()["evictions"] == 1
+
+
+def test_disk_tier_survives_a_restart(tmp_path):
+    db = str(tmp_path / "ocr.sqlite")
+    cache = ResultCache(memory_mb=1, db_path=db)
+    cache.put("key", RESULT)
+    cache.close()
+
+    reopened = ResultCache(memory_mb=1, db_path=db)
+    assert reopened.get("key") == RESULT
+    assert reopened.get("key") == RESULT
+    metrics = reopened.metrics()
+    assert metrics["disk_hits"] == 1 and metrics["memory_hits"] == 1 and metrics["disk_entries"] == 1
+    reopened.close()
+
+
+def test_disk_tier_is_trimmed(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_cache, "PRUNE_EVERY", 5)
+    cache = ResultCache(memory_mb=1, db_path=str(tmp_path / "ocr.sqlite"), db_max_entries=3)
+    for n in range(5):
+        cache.put(f"k{n}", {"n": n})
+    assert cache.metrics()["disk_entries"] == 3
+    cache.close()
@@ -0,0 +1,45 @@
+import pytest
+
+from tiling import merge_tile_results, tile_grid
+
+
+def quad(x0, y0, x1, y1):
+    return [[x0, y0], [x1, y0], [x1, y1], [x0, y1]]
+
+
+def test_text_read_by_two_tiles_is_kept_once():
+    shape = (100, 300)
+    left, right = tile_grid(shape, 200, 100)
+    merged = merge_tile_results([
+        # "total" lies inside the overlap (x 100-200): both tiles read it
+        (left, [(quad(120, 10, 170, 30), "total", 0.8)]),
+        (right, [(quad(20, 10, 70, 30), "tota1", 0.6), (quad(150, 70, 190, 90), "end", 0.9)]),
+    ], shape)
+    assert sorted(text for _, text, _ in merged) == ["end", "total"]
+    # Coordinates come back in the full image
+    end = next(q for q, text, _ in merged if text == "end")
+    assert end[0] == [250, 70]
+
+
+def test_line_cut_by_a_seam_is_joined():
+    shape = (100, 300)
+    left, right = tile_grid(shape, 200, 100)
+    assert (left, right) == ((0, 0, 200, 100), (100, 0, 300, 100))
+    # The line spans x 50-260: the left tile sees it up to its right edge, the right tile from its left edge
+    merged = merge_tile_results([
+        (left, [(quad(50, 40, 199, 60), "the quick bro", 0.9)]),
+        (right, [(quad(0, 41, 160, 61), "ick brown fox", 0.7)]),
+    ], shape)
+    assert len(merged) == 1
+    box, text, confidence = merged[0]
+    assert text == "the quick brown fox"
+    assert box[0] == [50, 40] and box[2] == [260, 61]
+    assert confidence == pytest.approx(0.7)
+
+
+def test_untiled_image_is_unchanged():
+    shape = (100, 150)
+    (only,) = tile_grid(shape, 200, 100)
+    results = [(quad(5, 5, 40, 20), "a", 0.5), (quad(60, 5, 140, 20), "b", 0.9)]
+    merged = merge_tile_results([(only, results)], shape)
+    assert sorted(text for _, text, _ in merged) == ["a", "b"]
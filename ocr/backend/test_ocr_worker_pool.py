@@ -0,0 +1,149 @@
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from types import SimpleNamespace
+
+import pytest
+
+import worker_pool
+from worker_pool import OCRWorkerPool, QueueFullError
+
+
+class FakeProcessor:
+    """Stands in for OCRProcessor; runs in the pool's worker threads"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.release.set()
+        self.calls = []
+        self.readers = SimpleNamespace(metrics=lambda: {"loaded": [["en"]]})
+
+    def read(self, name):
+        self.release.wait()
+        self.calls.append(name)
+        return name.upper()
+
+    def fail(self):
+        raise ValueError("unreadable image")
+
+
+class FakePool(ThreadPoolExecutor):
+    """One worker thread; a "crash" job breaks it like a reader process dying"""
+
+    def __init__(self):
+        super().__init__(max_workers=1)
+
+    def submit(self, fn, *args, **kwargs):
+        if args and args[0] == "crash":
+            future = Future()
+            future.set_exception(BrokenProcessPool("worker died"))
+            return future
+        return super().submit(fn, *args, **kwargs)
+
+
+@pytest.fixture
+def processor(monkeypatch):
+    """Run workers as threads sharing one fake processor instead of reader processes"""
+    fake = FakeProcessor()
+    monkeypatch.setattr(worker_pool, "_processor", fake)
+    monkeypatch.setattr(worker_pool._Worker, "spawn", lambda self: setattr(self, "pool", FakePool()))
+    return fake
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def started(**kwargs):
+    pool = OCRWorkerPool(threads=1, languages=["en"], **kwargs)
+    await pool.start()
+    return pool
+
+
+def test_results_and_errors_reach_the_caller(processor):
+    async def main():
+        pool = await started(workers=2)
+        results = await asyncio.gather(*(pool.submit("read", name) for name in ("a", "b", "c")))
+        with pytest.raises(ValueError):
+            await pool.submit("fail")
+        metrics = pool.metrics()
+        await pool.stop()
+        return results, metrics
+
+    results, metrics = run(main())
+    assert results == ["A", "B", "C"]
+    assert metrics["completed"] == 3 and metrics["failed"] == 1
+    assert sum(w["jobs"] for w in metrics["per_worker"]) == 4
+
+
+def test_jobs_start_in_order_and_a_full_queue_rejects(processor):
+    async def main():
+        pool = await started(workers=1, queue_size=2)
+        processor.release.clear()
+        waiting = [asyncio.create_task(pool.submit("read", "a"))]
+        while pool.metrics()["in_flight"] == 0:
+            await asyncio.sleep(0.01)
+        waiting += [asyncio.create_task(pool.submit("read", name)) for name in ("b", "c")]
+        await asyncio.sleep(0)
+        assert pool.depth() == 2
+        with pytest.raises(QueueFullError):
+            await pool.submit("read", "d")
+        processor.release.set()
+        results = await asyncio.gather(*waiting)
+        metrics = pool.metrics()
+        await pool.stop()
+        return results, metrics
+
+    results, metrics = run(main())
+    assert results == ["A", "B", "C"] and processor.calls == ["a", "b", "c"]
+    assert metrics["rejected"] == 1
+
+
+def test_crashed_worker_is_replaced(processor):
+    async def main():
+        pool = await started(workers=1)
+        with pytest.raises(RuntimeError, match="crashed"):
+            await pool.submit("crash")
+        result = await pool.submit("read", "after")
+        metrics = pool.metrics()
+        await pool.stop()
+        return result, metrics
+
+    result, metrics = run(main())
+    assert result == "AFTER"
+    worker = metrics["per_worker"][0]
+    assert worker["restarts"] == 1 and worker["readers"] == {"loaded": [["en"]]}
+    assert metrics["failed"] == 1
+
+
+def test_submit_before_start_fails():
+    with pytest.raises(RuntimeError):
+        run(OCRWorkerPool(workers=1).submit("read", "a"))
+
+
+def test_failed_restart_is_retried(processor, monkeypatch):
+    monkeypatch.setattr(worker_pool, "RESPAWN_BACKOFF_SECONDS", 0.01)
+    ready = worker_pool._ready
+    attempts = []
+
+    def flaky_ready():
+        attempts.append(len(attempts))
+        if len(attempts) == 2:
+            raise RuntimeError("reader failed to load")
+        return ready()
+
+    monkeypatch.setattr(worker_pool, "_ready", flaky_ready)
+
+    async def main():
+        pool = await started(workers=1)
+        with pytest.raises(RuntimeError, match="crashed"):
+            await pool.submit("crash")
+        result = await pool.submit("read", "after")
+        metrics = pool.metrics()
+        await pool.stop()
+        return result, metrics
+
+    result, metrics = run(main())
+    assert result == "AFTER" and len(attempts) == 3
+    assert metrics["per_worker"][0]["restarts"] == 1
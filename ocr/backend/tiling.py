@@ -0,0 +1,134 @@
+import math
+import os
+
+# Tiled OCR for large scans: tiles are read at native resolution instead of letting
+# easyocr shrink the whole image to its detection canvas
+OCR_TILE_SIZE = int(os.getenv("OCR_TILE_SIZE", "1600"))
+OCR_TILE_OVERLAP = int(os.getenv("OCR_TILE_OVERLAP", "200"))
+# Images whose longest side exceeds this are tiled unless the request says otherwise
+# (easyocr's default detection canvas is 2560 px)
+OCR_TILE_MIN_SIDE = int(os.getenv("OCR_TILE_MIN_SIDE", "2560"))
+# Tiles read at the same time inside one worker
+OCR_TILE_THREADS = int(os.getenv("OCR_TILE_THREADS", "2"))
+
+# A box this close (px) to a tile edge that is not an image edge may be cut by it
+CUT_MARGIN = 3
+# Two boxes from different tiles are the same text when the smaller one is this much inside the other
+DUPLICATE_CONTAINMENT = 0.6
+# Two cut pieces are on the same line when their vertical spans overlap this much
+SAME_LINE_OVERLAP = 0.6
+
+
+def should_tile(shape, requested=None):
+    """Tile when asked to, or by default when the image is larger than easyocr's detection canvas"""
+    if requested is not None:
+        return requested
+    return max(shape[0], shape[1]) > OCR_TILE_MIN_SIDE
+
+
+def _axis_starts(length, tile, overlap):
+    if length <= tile:
+        return [0]
+    count = math.ceil((length - overlap) / (tile - overlap))
+    return [round(i * (length - tile) / (count - 1)) for i in range(count)]
+
+
+def tile_grid(shape, tile=OCR_TILE_SIZE, overlap=OCR_TILE_OVERLAP):
+    """Overlapping (x0, y0, x1, y1) tiles covering an image of `shape` (H, W, ...), row by row"""
+    height, width = shape[0], shape[1]
+    overlap = min(overlap, tile // 2)
+    return [
+        (x, y, min(x + tile, width), min(y + tile, height))
+        for y in _axis_starts(height, tile, overlap)
+        for x in _axis_starts(width, tile, overlap)
+    ]
+
+
+def _piece(tile, shape, bbox, text, confidence):
+    """A tile result in full-image coordinates, with the tile edges that may have cut it"""
+    quad = [[float(pt[0]) + tile[0], float(pt[1]) + tile[1]] for pt in bbox]
+    xs, ys = [pt[0] for pt in quad], [pt[1] for pt in quad]
+    box = (min(xs), min(ys), max(xs), max(ys))
+    height, width = shape[0], shape[1]
+    return {
+        "quad": quad,
+        "box": box,
+        "text": text,
+        "confidence": float(confidence),
+        "tile": tile,
+        "cut_left": tile[0] > 0 and box[0] - tile[0] < CUT_MARGIN,
+        "cut_right": tile[2] < width and tile[2] - box[2] < CUT_MARGIN,
+        "cut_top": tile[1] > 0 and box[1] - tile[1] < CUT_MARGIN,
+        "cut_bottom": tile[3] < height and tile[3] - box[3] < CUT_MARGIN,
+    }
+
+
+def _area(box):
+    return max(0.0, box[2] - box[0]) * max(0.0, box[3] - box[1])
+
+
+def _intersection(a, b):
+    return _area((max(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), min(a[3], b[3])))
+
+
+def _cuts(piece):
+    return piece["cut_left"] + piece["cut_right"] + piece["cut_top"] + piece["cut_bottom"]
+
+
+def _join_text(left, right):
+    """Join two readings of a line cut by a seam, dropping the part both tiles read"""
+    for size in range(min(len(left), len(right)), 1, -1):
+        if left.endswith(right[:size]):
+            return left + right[size:]
+    return f"{left} {right}"
+
+
+def _same_line(a, b):
+    overlap = min(a["box"][3], b["box"][3]) - max(a["box"][1], b["box"][1])
+    return overlap > SAME_LINE_OVERLAP * min(a["box"][3] - a["box"][1], b["box"][3] - b["box"][1])
+
+
+def merge_tile_results(tile_results, shape):
+    """
+    Combine per-tile readtext results ([(tile, [(bbox, text, confidence), ...]), ...]) into one
+    readtext-style list in full-image coordinates. Text read twice in a tile overlap is kept
+    once (the reading not touching a tile edge wins, then the more confident one), and a line
+    cut by a vertical seam is joined back from its two pieces.
+    """
+    pieces = [
+        _piece(tile, shape, bbox, text, confidence)
+        for tile, results in tile_results
+        for bbox, text, confidence in results
+    ]
+    pieces.sort(key=lambda p: (_cuts(p), -p["confidence"]))
+
+    kept = []
+    for piece in pieces:
+        for other in kept:
+            if other["tile"] == piece["tile"]:
+                continue
+            inter = _intersection(piece["box"], other["box"])
+            if inter == 0:
+                continue
+            left, right = sorted((piece, other), key=lambda p: p["box"][0])
+            if (left["cut_right"] and right["cut_left"] and left["box"][2] < right["box"][2]
+                    and _same_line(left, right)):
+                # One line cut by a vertical seam: each tile read a piece of it
+                box = (left["box"][0], min(left["box"][1], right["box"][1]),
+                       right["box"][2], max(left["box"][3], right["box"][3]))
+                other.update(
+                    quad=[[box[0], box[1]], [box[2], box[1]], [box[2], box[3]], [box[0], box[3]]],
+                    box=box,
+                    text=_join_text(left["text"], right["text"]),
+                    confidence=min(left["confidence"], right["confidence"]),
+                    cut_left=left["cut_left"],
+                    cut_right=right["cut_right"],
+                )
+                break
+            if inter / min(_area(piece["box"]), _area(other["box"])) > DUPLICATE_CONTAINMENT:
+                # Same text read by both tiles: the better reading was kept first
+                break
+        else:
+            kept.append(piece)
+
+    return [(p["quad"], p["text"], p["confidence"]) for p in kept]
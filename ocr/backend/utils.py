@@ -1,72 +1,158 @@
-import easyocr
 import cv2
 import numpy as np
-from PIL import Image
-import io
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from documents import render_page
+from readers import ReaderCache
+from layout import analyze_layout
+from preprocess import DEFAULT_CHAIN, apply_chain, map_points
+from tiling import should_tile, tile_grid, merge_tile_results, OCR_TILE_THREADS
+
+# Adaptive (two-pass) OCR: read a downscaled copy, then re-read weak boxes at full resolution
+OCR_ADAPTIVE = os.getenv("OCR_ADAPTIVE", "0") == "1"
+OCR_FAST_SIDE = int(os.getenv("OCR_FAST_SIDE", "1280"))
+OCR_REREAD_CONFIDENCE = float(os.getenv("OCR_REREAD_CONFIDENCE", "0.5"))
 
 class OCRProcessor:
     def __init__(self, languages=['en', 'fr']):
-        # Initialize the reader only once
-        self.reader = easyocr.Reader(languages)
+        # Readers are loaded per language set on first use; the default set is loaded now
+        self.languages = languages
+        self.readers = ReaderCache()
+        self.readers.get(languages)
+        # Tiles of one large image are read in parallel (torch releases the GIL)
+        self.tile_pool = ThreadPoolExecutor(max_workers=max(1, OCR_TILE_THREADS), thread_name_prefix="ocr-tile")
 
-    def process_image(self, image_bytes):
+    def process_image(self, image_bytes, **options):
         # Convert bytes to numpy array (OpenCV format)
         nparr = np.frombuffer(image_bytes, np.uint8)
         img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
         img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        return self.read_text(img_rgb, **options)
+
+    def process_page(self, path, kind, index, dpi, **options):
+        """OCR one page of a multi-page document (see documents.py); the page is rendered here"""
+        page = render_page(path, kind, index, dpi)
+        return {
+            "width": int(page.shape[1]),
+            "height": int(page.shape[0]),
+            "results": self.read_text(page, **options),
+        }
+
+    def read_tiles(self, img_rgb, reader):
+        """
+        readtext on overlapping native-resolution tiles, in parallel, with duplicates
+        across tile seams merged (see tiling.py). Same output format as readtext.
+        """
+        tiles = tile_grid(img_rgb.shape)
+        readings = self.tile_pool.map(
+            lambda tile: reader.readtext(np.ascontiguousarray(img_rgb[tile[1]:tile[3], tile[0]:tile[2]])),
+            tiles
+        )
+        return merge_tile_results(list(zip(tiles, readings)), img_rgb.shape)
+
+    def read_two_pass(self, img_rgb, reader):
+        """
+        readtext on a copy downscaled to OCR_FAST_SIDE, then recognition only (no detection)
+        at full resolution for the boxes read with less than OCR_REREAD_CONFIDENCE.
+        Boxes are returned in full-resolution coordinates, like readtext.
+        """
+        height, width = img_rgb.shape[:2]
+        scale = OCR_FAST_SIDE / max(height, width)
+        if scale >= 1:
+            return reader.readtext(img_rgb)
+
+        small = cv2.resize(img_rgb, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+        results = [
+            ([[float(x) / scale, float(y) / scale] for x, y in bbox], text, float(confidence))
+            for bbox, text, confidence in reader.readtext(small)
+        ]
+
+        weak = [i for i, (_, _, confidence) in enumerate(results) if confidence < OCR_REREAD_CONFIDENCE]
+        if not weak:
+            return results
+        pad = math.ceil(1 / scale)
+        boxes = []
+        for i in weak:
+            xs, ys = [pt[0] for pt in results[i][0]], [pt[1] for pt in results[i][0]]
+            boxes.append([
+                max(0, int(min(xs)) - pad), min(width, math.ceil(max(xs)) + pad),
+                max(0, int(min(ys)) - pad), min(height, math.ceil(max(ys)) + pad),
+            ])
+        # recognize may reorder its output, so each reading is matched back by its box center
+        for bbox, text, confidence in reader.recognize(img_rgb, horizontal_list=boxes, free_list=[]):
+            cx = sum(pt[0] for pt in bbox) / 4
+            cy = sum(pt[1] for pt in bbox) / 4
+            for i, box in zip(weak, boxes):
+                if box[0] <= cx <= box[1] and box[2] <= cy <= box[3]:
+                    if confidence > results[i][2]:
+                        results[i] = (results[i][0], text, float(confidence))
+                    break
+        return results
 
-        # Read text
-        results = self.reader.readtext(img_rgb)
-        
-        
-        # Format results
-        raw_data = []
-        for bbox, text, confidence in results:
-            # Calculate centroid for sorting
-            # y_center = average of all y coordinates
-            y_center = sum([pt[1] for pt in bbox]) / 4
-            x_min = min([pt[0] for pt in bbox])
-            
-            raw_data.append({
-                "text": text,
-                "confidence": float(confidence),
+    def detect_text(self, img_rgb, reader):
+        """Text boxes only, without running the recognizer (readtext-style tuples with no text)"""
+        horizontal, free = reader.detect(img_rgb)
+        boxes = [[[x0, y0], [x1, y0], [x1, y1], [x0, y1]] for x0, x1, y0, y1 in horizontal[0]]
+        return [(box, None, None) for box in boxes + free[0]]
+
+    def read_regions(self, img_rgb, regions, **options):
+        """
+        read_text inside each [x0, y0, x1, y1] region only. Boxes are in image coordinates and
+        each result carries the index of its region; results follow the order of the regions.
+        """
+        height, width = img_rgb.shape[:2]
+        items = []
+        for index, (x0, y0, x1, y1) in enumerate(regions):
+            x0, y0 = max(0, int(x0)), max(0, int(y0))
+            x1, y1 = min(width, math.ceil(x1)), min(height, math.ceil(y1))
+            if x1 - x0 < 2 or y1 - y0 < 2:
+                continue
+            for item in self.read_text(np.ascontiguousarray(img_rgb[y0:y1, x0:x1]), **options):
+                item["bbox"] = [[x + x0, y + y0] for x, y in item["bbox"]]
+                item["region"] = index
+                items.append(item)
+        return items
+
+    def read_text(self, img_rgb, tiled=None, adaptive=None, languages=None, regions=None, detect_only=False,
+                  preprocess=None):
+        if regions:
+            return self.read_regions(
+                img_rgb, regions, tiled=tiled, adaptive=adaptive, languages=languages, detect_only=detect_only,
+                preprocess=preprocess,
+            )
+        # Preprocessing chain (see preprocess.py); boxes are mapped back to the input image below
+        img_rgb, to_input = apply_chain(img_rgb, DEFAULT_CHAIN if preprocess is None else preprocess)
+
+        # The detector is shared by all readers, so detection alone never loads a new language set
+        reader = self.readers.get(self.languages if detect_only else (languages or self.languages))
+
+        # Read text (large scans tile by tile, so small text is not lost to downscaling)
+        if detect_only:
+            results = self.detect_text(img_rgb, reader)
+        elif should_tile(img_rgb.shape, tiled):
+            results = self.read_tiles(img_rgb, reader)
+        elif OCR_ADAPTIVE if adaptive is None else adaptive:
+            results = self.read_two_pass(img_rgb, reader)
+        else:
+            results = reader.readtext(img_rgb)
+
+        # Reading order and structure: columns, lines and paragraphs (see layout.py)
+        layout = analyze_layout([bbox for bbox, _, _ in results])
+        sorted_data = []
+        for index in layout["order"]:
+            bbox, text, confidence = results[index]
+            if to_input is not None:
+                bbox = map_points(bbox, to_input)
+            item = {
                 "bbox": [list(map(float, pt)) for pt in bbox],
-                "_y": y_center,
-                "_x": x_min
-            })
-            
-        # Spatial Sort: Top-to-Bottom, Left-to-Right
-        # 1. Sort by Y first
-        raw_data.sort(key=lambda x: x["_y"])
-        
-        # 2. Group into lines (if Y difference is small, they are on same line)
-        lines = []
-        current_line = []
-        last_y = -1000
-        line_height_threshold = 20  # Pixel threshold for distinct lines
-        
-        for item in raw_data:
-            if not current_line:
-                current_line.append(item)
-                last_y = item["_y"]
-            else:
-                if abs(item["_y"] - last_y) < line_height_threshold:
-                    current_line.append(item)
-                else:
-                    # New line
-                    lines.append(sorted(current_line, key=lambda x: x["_x"]))
-                    current_line = [item]
-                    last_y = item["_y"]
-        
-        if current_line:
-            lines.append(sorted(current_line, key=lambda x: x["_x"]))
-            
-        # Flatten back to list
-        sorted_data = [item for line in lines for item in line]
-        
-        # Remove internal sorting keys before returning
-        for item in sorted_data:
-            del item["_y"]
-            del item["_x"]
-            
+                "column": int(layout["column"][index]) if layout["column"][index] >= 0 else None,
+                "block": int(layout["block"][index]),
+                "line": int(layout["line"][index]),
+            }
+            if not detect_only:
+                item = {"text": text, "confidence": float(confidence), **item}
+            sorted_data.append(item)
+
         return sorted_data
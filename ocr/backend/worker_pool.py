@@ -0,0 +1,281 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Worker configuration: each worker is a process with its own easyocr reader
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "2"))
+# Torch/OpenCV threads per worker (0 = CPUs divided evenly between workers)
+OCR_WORKER_THREADS = int(os.getenv("OCR_WORKER_THREADS", "0"))
+OCR_QUEUE_SIZE = int(os.getenv("OCR_QUEUE_SIZE", "32"))
+OCR_LANGUAGES = [lang.strip() for lang in os.getenv("OCR_LANGUAGES", "en,fr").split(",") if lang.strip()]
+
+# How often a waiting request checks whether its client went away
+DISCONNECT_POLL_SECONDS = 0.25
+# Backoff between attempts to replace a dead worker (doubles up to the maximum)
+RESPAWN_BACKOFF_SECONDS = 1.0
+RESPAWN_MAX_BACKOFF_SECONDS = 30.0
+
+# The OCRProcessor of this worker process (set by _init_worker)
+_processor = None
+
+
+class QueueFullError(Exception):
+    """Raised when the OCR queue is at capacity"""
+
+
+class ClientDisconnectedError(Exception):
+    """Raised when the caller disconnected while its job was waiting"""
+
+
+class _JobError(Exception):
+    """A job failure carrying the worker's reader cache metrics"""
+
+    def __init__(self, error, readers):
+        super().__init__(error, readers)
+        self.error = error
+        self.readers = readers
+
+
+def _init_worker(languages, threads):
+    """Process initializer: pin thread counts before torch spins up its pools, then load the reader"""
+    global _processor
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+
+    import cv2
+    import torch
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+    cv2.setNumThreads(threads)
+
+    from utils import OCRProcessor
+    _processor = OCRProcessor(languages)
+
+
+def _ready():
+    return os.getpid(), _processor.readers.metrics()
+
+
+def _call(method, args, kwargs):
+    """Run one job; the worker's reader cache metrics travel back with the result"""
+    try:
+        return getattr(_processor, method)(*args, **kwargs), _processor.readers.metrics()
+    except Exception as e:
+        raise _JobError(e, _processor.readers.metrics())
+
+
+class _Worker:
+    """One reader process and its counters"""
+
+    def __init__(self, index, languages, threads):
+        self.index = index
+        self.languages = languages
+        self.threads = threads
+        self.pool = None
+        self.pid = None
+        self.readers = None
+        self.busy = False
+        self.jobs = 0
+        self.failed = 0
+        self.restarts = 0
+        self.busy_seconds = 0.0
+        self.started_at = time.monotonic()
+
+    def spawn(self):
+        self.pool = ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.languages, self.threads),
+        )
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def metrics(self, now):
+        uptime = now - self.started_at
+        return {
+            "worker": self.index,
+            "pid": self.pid,
+            "busy": self.busy,
+            "jobs": self.jobs,
+            "failed": self.failed,
+            "restarts": self.restarts,
+            "utilization": round(self.busy_seconds / uptime, 3) if uptime > 0 else 0.0,
+            "avg_run_ms": round(self.busy_seconds / self.jobs * 1000, 1) if self.jobs else 0.0,
+            "readers": self.readers,
+        }
+
+
+class _Job:
+    __slots__ = ("method", "args", "kwargs", "future", "enqueued_at")
+
+    def __init__(self, method, args, kwargs, future):
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class OCRWorkerPool:
+    """
+    Runs OCRProcessor calls in worker processes (one easyocr reader each, with a pinned
+    number of torch/OpenCV threads) behind a bounded FIFO queue.
+    Jobs start in submission order; the event loop only awaits results, so /health stays
+    responsive while every worker is busy. A full queue is rejected instead of growing,
+    and jobs whose client disconnects before they start are dropped.
+    """
+
+    def __init__(self, workers=OCR_WORKERS, threads=OCR_WORKER_THREADS, queue_size=OCR_QUEUE_SIZE,
+                 languages=OCR_LANGUAGES):
+        self.workers = max(1, workers)
+        self.threads = threads if threads > 0 else max(1, (os.cpu_count() or 1) // self.workers)
+        self.queue_size = max(1, queue_size)
+        self.languages = languages
+        self._queue = None
+        self._workers = []
+        self._tasks = []
+        self._stats = {"completed": 0, "failed": 0, "cancelled": 0, "rejected": 0}
+        self._wait_total = 0.0
+
+    async def start(self):
+        """Start the worker processes and wait until every reader is loaded"""
+        loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._workers = [_Worker(i, self.languages, self.threads) for i in range(self.workers)]
+        for worker in self._workers:
+            worker.spawn()
+        ready = await asyncio.gather(*(loop.run_in_executor(w.pool, _ready) for w in self._workers))
+        for worker, (pid, readers) in zip(self._workers, ready):
+            worker.pid, worker.readers = pid, readers
+            worker.started_at = time.monotonic()
+        self._tasks = [asyncio.create_task(self._run(worker)) for worker in self._workers]
+        print(f"OCR pool started: {self.workers} worker(s) x {self.threads} thread(s), "
+              f"queue size {self.queue_size}, languages {self.languages}")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for worker in self._workers:
+            worker.shutdown()
+
+    @property
+    def started(self):
+        return bool(self._tasks)
+
+    def depth(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def submit(self, method, *args, request=None, **kwargs):
+        """
+        Queue `OCRProcessor.<method>(*args, **kwargs)` and wait for its result.
+        Arguments and results are pickled between processes. If `request` is given,
+        the job is cancelled when the client disconnects.
+        """
+        if self._queue is None:
+            raise RuntimeError("OCR pool not started")
+        if self.depth() >= self.queue_size:
+            self._stats["rejected"] += 1
+            raise QueueFullError(f"OCR queue is full ({self.queue_size} pending)")
+
+        job = _Job(method, args, kwargs, asyncio.get_running_loop().create_future())
+        self._queue.put_nowait(job)
+        try:
+            return await self._wait(job.future, request)
+        except asyncio.CancelledError:
+            # The caller gave up (e.g. a stream was closed): skip the job if it has not started
+            job.future.cancel()
+            raise
+
+    async def _wait(self, future, request):
+        if request is None:
+            return await future
+        while True:
+            done, _ = await asyncio.wait({future}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return future.result()
+            if await request.is_disconnected():
+                # Queued jobs are skipped; a running one finishes and is discarded
+                future.cancel()
+                self._stats["cancelled"] += 1
+                raise ClientDisconnectedError("Client disconnected before OCR finished")
+
+    async def _respawn(self, worker):
+        """Replace a dead worker process, retrying with backoff until its reader loads"""
+        loop = asyncio.get_running_loop()
+        backoff = RESPAWN_BACKOFF_SECONDS
+        while True:
+            try:
+                worker.shutdown()
+                worker.spawn()
+                worker.pid, worker.readers = await loop.run_in_executor(worker.pool, _ready)
+                worker.restarts += 1
+                return
+            except Exception as e:
+                print(f"OCR worker {worker.index} failed to restart ({e!r}), retrying in {backoff:g}s")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, RESPAWN_MAX_BACKOFF_SECONDS)
+
+    async def _run(self, worker):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._queue.get()
+            if job.future.cancelled():
+                continue
+
+            started = time.monotonic()
+            self._wait_total += started - job.enqueued_at
+            worker.busy = True
+            crashed = False
+            try:
+                result, worker.readers = await loop.run_in_executor(
+                    worker.pool, _call, job.method, job.args, job.kwargs
+                )
+            except BrokenProcessPool:
+                # The process died (out of memory, crash in native code): fail the job, then replace it
+                crashed = True
+                worker.failed += 1
+                self._stats["failed"] += 1
+                if not job.future.done():
+                    job.future.set_exception(RuntimeError("OCR worker crashed while processing the image"))
+            except Exception as e:
+                if isinstance(e, _JobError):
+                    e, worker.readers = e.error, e.readers
+                worker.failed += 1
+                self._stats["failed"] += 1
+                if not job.future.done():
+                    job.future.set_exception(e)
+            else:
+                self._stats["completed"] += 1
+                if not job.future.done():
+                    job.future.set_result(result)
+            finally:
+                worker.busy = False
+                worker.jobs += 1
+                worker.busy_seconds += time.monotonic() - started
+
+            if crashed:
+                print(f"OCR worker {worker.index} died, restarting it")
+                await self._respawn(worker)
+
+    def metrics(self):
+        """Queue depth, per-worker utilization and counters for /metrics"""
+        now = time.monotonic()
+        finished = self._stats["completed"] + self._stats["failed"]
+        return {
+            "workers": self.workers,
+            "threads_per_worker": self.threads,
+            "queue_depth": self.depth(),
+            "queue_capacity": self.queue_size,
+            "in_flight": sum(w.busy for w in self._workers),
+            **self._stats,
+            "avg_wait_ms": round(self._wait_total / finished * 1000, 1) if finished else 0.0,
+            "per_worker": [w.metrics(now) for w in self._workers],
+        }
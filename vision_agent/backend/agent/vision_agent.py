@@ -6,11 +6,11 @@ class VisionAgent:
         self.policy = DecisionPolicy()
         self.executor = executor
 
-    def run(self, image_tensor):
+    async def run(self, image_tensor):
         probs = self.perception.infer(image_tensor)
         action, confidence, reason = self.policy.decide(probs)
 
-        tool_output = self.executor.execute(action, image_tensor)
+        tool_output = await self.executor.execute(action, image_tensor)
 
         return {
             "probs": probs,
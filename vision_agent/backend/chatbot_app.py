@@ -1,5 +1,6 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
@@ -16,6 +17,7 @@ from intent_parser import IntentParser, Intent
 from gemini_handler import GeminiHandler
 
 from services.tool_executor import ToolExecutor
+from services.blob_store import BlobStore
 from intent_parser import IntentParser, Intent
 from gemini_handler import GeminiHandler
 from database import UserManager, ChatHistoryManager
@@ -43,7 +45,8 @@ async def lifespan(app: FastAPI):
         print("Gemini not configured - fallback disabled")
     
     yield
-    # Shutdown logic (if any) can go here
+    # Shutdown: close the pooled connections to the tool services
+    await executor.aclose()
 
 app = FastAPI(title="Vision AI Agent Chatbot", lifespan=lifespan)
 
@@ -63,10 +66,14 @@ session_manager = SessionManager()
 perception = None
 policy = DecisionPolicy()
 executor = ToolExecutor()
+# Uploads are written once here and passed to the tools by reference (see blob_store.py)
+blob_store = BlobStore()
 intent_parser = IntentParser()
 gemini_handler = GeminiHandler()
 
 MODEL_PATH = "best_multitask_model.pth"
+# Index common objects in the masking service as soon as a photo is uploaded
+INVENTORY_ON_UPLOAD = os.getenv("INVENTORY_ON_UPLOAD", "1").strip().lower() in ("1", "true", "yes")
 
 @app.get("/")
 async def root():
@@ -148,6 +155,7 @@ async def share_session(session_id: str):
 
 @app.post("/chat/upload")
 async def upload_image(
+    background_tasks: BackgroundTasks,
     session_id: str = Form(...),
     file: UploadFile = File(...)
 ):
@@ -161,11 +169,22 @@ async def upload_image(
     
     # Read image
     image_bytes = await file.read()
-    session_manager.set_image(session_id, image_bytes, file.filename)
+    blob_id = None
+    if blob_store.enabled:
+        try:
+            blob_id = await run_in_threadpool(blob_store.put, image_bytes)
+        except OSError as e:
+            print(f"Could not store the upload in the blob store: {e}")
+    session_manager.set_image(session_id, image_bytes, file.filename, blob_id)
     
     # Classify image
     probs = perception.infer(image_bytes)
     action, confidence, reason = policy.decide(probs)
+
+    # Photos usually lead to count/mask/recolor questions: start the object inventory
+    # after the response is sent so those answers are ready when the user asks
+    if INVENTORY_ON_UPLOAD and action == AgentAction.CAPTION_IMAGE:
+        background_tasks.add_task(executor.inventory, image_bytes, blob_id=blob_id)
     
     # Format probabilities
     prob_text = ", ".join([f"{k.replace('is_', '')}: {v*100:.1f}%" for k, v in probs.items()])
@@ -314,7 +333,7 @@ async def handle_count_request(session, intent: Intent):
             }
 
     # Execute count
-    result = executor.count(session.current_image, obj)
+    result = await executor.count(session.current_image, obj, blob_id=session.current_image_blob)
     
     if "error" in result:
         msg = f"❌ {result['error']}"
@@ -358,7 +377,7 @@ async def handle_caption_request(session, intent: Intent):
         }
     
     # Execute caption
-    result = executor.caption(session.current_image)
+    result = await executor.caption(session.current_image, blob_id=session.current_image_blob)
     
     if "error" in result:
         msg = f"❌ Sorry, something went wrong: {result['error']}"
@@ -379,7 +398,7 @@ async def handle_caption_request(session, intent: Intent):
 
 async def handle_ocr_request(session, intent: Intent):
     """Handle OCR request"""
-    result = executor.ocr(session.current_image)
+    result = await executor.ocr(session.current_image, blob_id=session.current_image_blob)
     
     if "error" in result:
         msg = f"❌ {result['error']}"
@@ -523,7 +542,7 @@ async def handle_pending_action(session, message: str):
 
 async def execute_recolor(session, obj: str, color: str):
     """Execute recolor action"""
-    result = executor.recolor(session.current_image, obj, color)
+    result = await executor.recolor(session.current_image, obj, color, blob_id=session.current_image_blob)
     
     if "error" in result:
         # Check if object not found
@@ -566,7 +585,7 @@ async def execute_recolor(session, obj: str, color: str):
 
 async def execute_mask(session, obj: str):
     """Execute mask action"""
-    result = executor.mask(session.current_image, obj)
+    result = await executor.mask(session.current_image, obj, blob_id=session.current_image_blob)
     
     if "error" in result:
         # Check if object not found
@@ -1,3 +1,5 @@
+import asyncio
+
 from agent.perception import PerceptionModule
 from agent.vision_agent import VisionAgent
 from utils.preprocess import load_and_preprocess
@@ -14,6 +16,12 @@ image_tensor = load_and_preprocess(IMAGE_PATH)
 executor = ToolExecutor()
 agent = VisionAgent(perception, executor)
 
-result = agent.run(image_tensor)
+async def main():
+    try:
+        return await agent.run(image_tensor)
+    finally:
+        await executor.aclose()
+
+result = asyncio.run(main())
 print(result)
 
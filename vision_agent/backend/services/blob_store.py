@@ -0,0 +1,77 @@
+import hashlib
+import os
+import tempfile
+import threading
+
+# Shared image store: the chatbot writes each upload once, keyed by its SHA-256, and tools
+# read it by reference. Services must see the same directory (empty disables the store).
+BLOB_STORE_DIR = os.getenv("BLOB_STORE_DIR", os.path.join(tempfile.gettempdir(), "vision_blobs"))
+# Oldest (least recently written) blobs are deleted above this size
+BLOB_STORE_MAX_MB = int(os.getenv("BLOB_STORE_MAX_MB", "4096"))
+
+
+class BlobStore:
+    """
+    Content-addressed files: <dir>/<first 2 hex digits>/<sha256>. Writes are atomic (temp
+    file + rename), so readers never see a partial blob; storing the same bytes again only
+    refreshes the blob's age.
+    """
+
+    def __init__(self, directory=BLOB_STORE_DIR, max_mb=BLOB_STORE_MAX_MB):
+        self.directory = directory or None
+        self.max_bytes = max_mb * 2 ** 20
+        self._lock = threading.Lock()
+        self._size = None
+
+    @property
+    def enabled(self):
+        return self.directory is not None
+
+    def path(self, blob_id):
+        return os.path.join(self.directory, blob_id[:2], blob_id)
+
+    def put(self, data):
+        """Store `data` (if new) and return its blob id"""
+        blob_id = hashlib.sha256(data).hexdigest()
+        path = self.path(blob_id)
+        if os.path.exists(path):
+            os.utime(path)
+            return blob_id
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+        with self._lock:
+            if self._size is not None:
+                self._size += len(data)
+        self._prune()
+        return blob_id
+
+    def _blobs(self):
+        for shard in os.scandir(self.directory):
+            if shard.is_dir():
+                for entry in os.scandir(shard.path):
+                    if not entry.name.startswith("."):
+                        yield entry
+
+    def _prune(self):
+        with self._lock:
+            if self._size is None:
+                self._size = sum(entry.stat().st_size for entry in self._blobs())
+            if self._size <= self.max_bytes:
+                return
+            entries = sorted(((e.stat().st_mtime, e.stat().st_size, e.path) for e in self._blobs()))
+            self._size = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if self._size <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    self._size -= size
+                except OSError as e:
+                    print(f"Could not remove blob {path}: {e}")
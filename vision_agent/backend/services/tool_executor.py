@@ -1,22 +1,130 @@
 from agent.actions import AgentAction
+import asyncio
 import httpx
 import io
+import os
 from PIL import Image
 
+# Recolored images are only displayed in the chat, so ask for a small, fast encoding
+CHAT_IMAGE_FORMAT = "jpeg"
+CHAT_PREVIEW_MAX_SIDE = 1600
+
+# One connection pool shared by every tool call
+TOOL_MAX_CONNECTIONS = int(os.getenv("TOOL_MAX_CONNECTIONS", "64"))
+TOOL_MAX_KEEPALIVE = int(os.getenv("TOOL_MAX_KEEPALIVE", "16"))
+TOOL_CONNECT_TIMEOUT = float(os.getenv("TOOL_CONNECT_TIMEOUT", "5"))
+# Retries after a connection failure or a 502/503/504 (a busy service), with exponential backoff
+TOOL_RETRIES = int(os.getenv("TOOL_RETRIES", "2"))
+TOOL_RETRY_BACKOFF = float(os.getenv("TOOL_RETRY_BACKOFF", "0.5"))
+# Longest Retry-After honoured before retrying
+MAX_RETRY_AFTER = 5.0
+
+RETRY_STATUSES = (502, 503, 504)
+
+# Per tool: service, endpoint, timeout (s, TOOL_TIMEOUT_<TOOL> overrides it) and calls in flight
+TOOLS = {
+    "caption": ("captioning", "/caption", 30.0, 8),
+    "ocr": ("ocr", "/ocr", 30.0, 8),
+    "recolor": ("masking", "/recolor", 60.0, 4),
+    "mask": ("masking", "/mask", 60.0, 4),
+    "count": ("masking", "/count", 60.0, 4),
+    "inventory": ("masking", "/inventory", 10.0, 4),
+}
+
+
+class ToolError(Exception):
+    """Raised when a tool call fails for good (after retries)"""
+
+
 class ToolExecutor:
+    """
+    Async client of the captioning, OCR and masking services. All calls share one pooled
+    httpx.AsyncClient, so a slow masking call never blocks the event loop, and connections
+    are reused across requests. Call `aclose()` on shutdown. Tools take the image itself
+    and, when it is in the shared blob store, its `blob_id`, sent instead of the bytes.
+    """
+
     def __init__(self):
         self.service_urls = {
             "captioning": "http://localhost:8001",
             "ocr": "http://localhost:8004",
             "masking": "http://localhost:8002"
         }
-    
-    def execute(self, action: AgentAction, image_input):
+        self.timeouts = {
+            name: float(os.getenv(f"TOOL_TIMEOUT_{name.upper()}", timeout))
+            for name, (_, _, timeout, _) in TOOLS.items()
+        }
+        self._client = None
+        self._slots = None
+
+    def _get_client(self):
+        # Created on first use, inside the running event loop
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=TOOL_MAX_CONNECTIONS, max_keepalive_connections=TOOL_MAX_KEEPALIVE),
+                timeout=httpx.Timeout(30.0, connect=TOOL_CONNECT_TIMEOUT),
+            )
+            self._slots = {name: asyncio.Semaphore(limit) for name, (_, _, _, limit) in TOOLS.items()}
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _post(self, tool, image_input, data=None, blob_id=None):
+        """
+        POST an image to a tool's endpoint. With a `blob_id` (see blob_store.py) only the
+        reference is sent; the image is uploaded if the service cannot find the blob (410).
+        """
+        if blob_id:
+            response = await self._send(tool, None, {**(data or {}), "blob_id": blob_id})
+            if response.status_code != 410:
+                return response
+            print(f"Blob {blob_id[:12]} unavailable to {tool}, uploading the image instead")
+        return await self._send(tool, self._image_to_bytes(image_input), data)
+
+    async def _send(self, tool, image_bytes, data=None):
+        """One tool request, retrying connection failures and busy services"""
+        service, path, _, _ = TOOLS[tool]
+        url = f"{self.service_urls[service]}{path}"
+        timeout = httpx.Timeout(self.timeouts[tool], connect=TOOL_CONNECT_TIMEOUT)
+        client = self._get_client()
+        slot = self._slots[tool]
+        try:
+            await asyncio.wait_for(slot.acquire(), timeout=self.timeouts[tool])
+        except asyncio.TimeoutError:
+            raise ToolError(f"too many {tool} calls in progress")
+        try:
+            for attempt in range(TOOL_RETRIES + 1):
+                delay = TOOL_RETRY_BACKOFF * 2 ** attempt
+                try:
+                    files = {"file": ("image.png", image_bytes, "image/png")} if image_bytes is not None else None
+                    response = await client.post(url, files=files, data=data, timeout=timeout)
+                except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+                    if attempt == TOOL_RETRIES:
+                        raise ToolError(str(e) or type(e).__name__)
+                except httpx.TimeoutException:
+                    # The service got the request and may still be working on it: not retried
+                    raise ToolError(f"no answer within {self.timeouts[tool]:g}s")
+                else:
+                    if response.status_code not in RETRY_STATUSES or attempt == TOOL_RETRIES:
+                        return response
+                    try:
+                        delay = min(float(response.headers.get("retry-after", delay)), MAX_RETRY_AFTER)
+                    except ValueError:
+                        pass
+                print(f"{tool} call failed, retrying in {delay:.1f}s ({attempt + 1}/{TOOL_RETRIES})")
+                await asyncio.sleep(delay)
+        finally:
+            slot.release()
+
+    async def execute(self, action: AgentAction, image_input):
         if action == AgentAction.CAPTION_IMAGE:
-            return self.caption(image_input)
+            return await self.caption(image_input)
 
         if action == AgentAction.RUN_OCR:
-            return self.ocr(image_input)
+            return await self.ocr(image_input)
 
         if action == AgentAction.ANALYZE_SCHEMA:
             return self.schema(image_input)
@@ -25,7 +133,7 @@ class ToolExecutor:
             return self.art(image_input)
 
         return {"error": "No suitable action"}
-    
+
     def _image_to_bytes(self, image_input):
         """Convert image input to bytes for HTTP upload"""
         if isinstance(image_input, bytes):
@@ -37,103 +145,90 @@ class ToolExecutor:
         else:
             raise ValueError(f"Unsupported image type: {type(image_input)}")
 
-    def caption(self, image_input):
+    async def caption(self, image_input, blob_id=None):
         """Call captioning microservice"""
         try:
-            image_bytes = self._image_to_bytes(image_input)
-            
-            with httpx.Client(timeout=30.0) as client:
-                files = {"file": ("image.png", image_bytes, "image/png")}
-                response = client.post(f"{self.service_urls['captioning']}/caption", files=files)
-                
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    return {"error": f"Captioning service error: {response.status_code}"}
+            response = await self._post("caption", image_input, blob_id=blob_id)
+
+            if response.status_code == 200:
+                return response.json()
+            else:
+                return {"error": f"Captioning service error: {response.status_code}"}
         except Exception as e:
             return {"error": f"Failed to call captioning service: {str(e)}"}
 
-    def ocr(self, image_input):
+    async def ocr(self, image_input, blob_id=None):
         """Call OCR microservice"""
         try:
-            image_bytes = self._image_to_bytes(image_input)
-            
-            with httpx.Client(timeout=30.0) as client:
-                files = {"file": ("image.png", image_bytes, "image/png")}
-                response = client.post(f"{self.service_urls['ocr']}/ocr", files=files)
-                
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    return {"error": f"OCR service error: {response.status_code}"}
+            response = await self._post("ocr", image_input, blob_id=blob_id)
+
+            if response.status_code == 200:
+                return response.json()
+            else:
+                return {"error": f"OCR service error: {response.status_code}"}
         except Exception as e:
             return {"error": f"Failed to call OCR service: {str(e)}"}
-    
-    def recolor(self, image_input, target_obj: str, new_color: str):
+
+    async def recolor(self, image_input, target_obj: str, new_color: str, blob_id=None):
         """Call masking service to recolor an object"""
         try:
-            image_bytes = self._image_to_bytes(image_input)
-            
-            with httpx.Client(timeout=60.0) as client:
-                files = {"file": ("image.png", image_bytes, "image/png")}
-                data = {"target_obj": target_obj, "new_color": new_color}
-                response = client.post(
-                    f"{self.service_urls['masking']}/recolor",
-                    files=files,
-                    data=data
-                )
-                
-                if response.status_code == 200:
-                    # Return image bytes
-                    return {"image": response.content, "content_type": response.headers.get("content-type")}
-                elif response.status_code == 404:
-                    return {"error": f"Object '{target_obj}' not found in the image"}
-                else:
-                    return {"error": f"Masking service error: {response.status_code}"}
+            data = {
+                "target_obj": target_obj,
+                "new_color": new_color,
+                "output_format": CHAT_IMAGE_FORMAT,
+                "preview_max_side": CHAT_PREVIEW_MAX_SIDE
+            }
+            response = await self._post("recolor", image_input, data=data, blob_id=blob_id)
+
+            if response.status_code == 200:
+                # Return image bytes
+                return {"image": response.content, "content_type": response.headers.get("content-type")}
+            elif response.status_code == 404:
+                return {"error": f"Object '{target_obj}' not found in the image"}
+            else:
+                return {"error": f"Masking service error: {response.status_code}"}
         except Exception as e:
             return {"error": f"Failed to call masking service: {str(e)}"}
-            
-    def mask(self, image_input, target_obj: str):
+
+    async def mask(self, image_input, target_obj: str, blob_id=None):
         """Call masking service to generate a mask for an object"""
         try:
-            image_bytes = self._image_to_bytes(image_input)
-            
-            with httpx.Client(timeout=60.0) as client:
-                files = {"file": ("image.png", image_bytes, "image/png")}
-                data = {"target_obj": target_obj}
-                response = client.post(
-                    f"{self.service_urls['masking']}/mask",
-                    files=files,
-                    data=data
-                )
-                
-                if response.status_code == 200:
-                    return {"image": response.content, "content_type": response.headers.get("content-type")}
-                elif response.status_code == 404:
-                    return {"error": f"Object '{target_obj}' not found"}
-                else:
-                    return {"error": f"Masking service error: {response.status_code}"}
+            response = await self._post("mask", image_input, data={"target_obj": target_obj}, blob_id=blob_id)
+
+            if response.status_code == 200:
+                return {"image": response.content, "content_type": response.headers.get("content-type")}
+            elif response.status_code == 404:
+                return {"error": f"Object '{target_obj}' not found"}
+            else:
+                return {"error": f"Masking service error: {response.status_code}"}
         except Exception as e:
             return {"error": f"Failed to call masking service: {str(e)}"}
 
-    def count(self, image_input, target_obj: str):
+    async def count(self, image_input, target_obj: str, blob_id=None):
         """Call masking service to count objects"""
         try:
-            image_bytes = self._image_to_bytes(image_input)
-            
-            with httpx.Client(timeout=60.0) as client:
-                files = {"file": ("image.png", image_bytes, "image/png")}
-                data = {"target_obj": target_obj}
-                response = client.post(
-                    f"{self.service_urls['masking']}/count",
-                    files=files,
-                    data=data
-                )
-                
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    return {"error": f"Masking service error: {response.status_code}"}
+            response = await self._post("count", image_input, data={"target_obj": target_obj}, blob_id=blob_id)
+
+            if response.status_code == 200:
+                return response.json()
+            else:
+                return {"error": f"Masking service error: {response.status_code}"}
+        except Exception as e:
+            return {"error": f"Failed to call masking service: {str(e)}"}
+
+    async def inventory(self, image_input, blob_id=None):
+        """
+        Ask the masking service to index common objects in the background, so later
+        count/mask/recolor requests on this image are answered without a cold SAM 3 run.
+        Returns as soon as the job is queued.
+        """
+        try:
+            response = await self._post("inventory", image_input, blob_id=blob_id)
+
+            if response.status_code in (200, 202):
+                return response.json()
+            else:
+                return {"error": f"Masking service error: {response.status_code}"}
         except Exception as e:
             return {"error": f"Failed to call masking service: {str(e)}"}
 
@@ -150,4 +245,3 @@ class ToolExecutor:
             "message": "Art description is coming soon! This feature is under development.",
             "status": "not_implemented"
         }
-
@@ -16,6 +16,8 @@ class ConversationSession:
     messages: List[Message] = field(default_factory=list)
     current_image: Optional[bytes] = None
     current_image_name: Optional[str] = None
+    # Id of current_image in the shared blob store, when it was stored there
+    current_image_blob: Optional[str] = None
     classification_results: Optional[Dict] = None
     recommended_action: Optional[str] = None
     available_actions: List[str] = field(default_factory=list)
@@ -62,12 +64,13 @@ class SessionManager:
         if session:
             session.messages.append(Message(role=role, content=content))
     
-    def set_image(self, session_id: str, image_bytes: bytes, filename: str):
+    def set_image(self, session_id: str, image_bytes: bytes, filename: str, blob_id: Optional[str] = None):
         """Store uploaded image in session"""
         session = self.get_session(session_id)
         if session:
             session.current_image = image_bytes
             session.current_image_name = filename
+            session.current_image_blob = blob_id
     
     def set_classification(self, session_id: str, results: Dict, recommended_action: str, available_actions: List[str]):
         """Store classification results"""
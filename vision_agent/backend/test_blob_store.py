@@ -0,0 +1,33 @@
+import hashlib
+import os
+
+from services.blob_store import BlobStore
+
+
+def test_put_is_content_addressed(tmp_path):
+    store = BlobStore(str(tmp_path), max_mb=1)
+    blob_id = store.put(b"image bytes")
+    assert blob_id == hashlib.sha256(b"image bytes").hexdigest()
+    with open(store.path(blob_id), "rb") as f:
+        assert f.read() == b"image bytes"
+    assert store.put(b"image bytes") == blob_id
+    assert [name for _, _, files in os.walk(tmp_path) for name in files] == [blob_id]
+
+
+def test_oldest_blobs_are_pruned(tmp_path):
+    store = BlobStore(str(tmp_path), max_mb=0)
+    store.max_bytes = 3500
+    ids = []
+    for n in range(3):
+        ids.append(store.put(bytes([n]) * 1000))
+        # Distinct ages, oldest first, without waiting for the clock
+        os.utime(store.path(ids[-1]), (n, n))
+    # Storing the first blob again makes it the newest
+    store.put(bytes([0]) * 1000)
+    newest = store.put(bytes([3]) * 1000)
+    remaining = {name for _, _, files in os.walk(tmp_path) for name in files}
+    assert remaining == {ids[0], ids[2], newest}
+
+
+def test_disabled_store():
+    assert not BlobStore("").enabled
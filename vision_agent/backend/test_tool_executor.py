@@ -0,0 +1,91 @@
+import asyncio
+
+import httpx
+import pytest
+
+from services import tool_executor
+from services.tool_executor import ToolExecutor
+
+
+@pytest.fixture
+def delays(monkeypatch):
+    """Backoff sleeps, recorded instead of waited"""
+    recorded = []
+
+    async def sleep(delay):
+        recorded.append(delay)
+
+    monkeypatch.setattr(tool_executor.asyncio, "sleep", sleep)
+    monkeypatch.setattr(tool_executor, "TOOL_RETRIES", 2)
+    monkeypatch.setattr(tool_executor, "TOOL_RETRY_BACKOFF", 0.5)
+    return recorded
+
+
+def call(handler, method, *args):
+    """Run one ToolExecutor call against `handler` instead of the real services"""
+    async def main():
+        executor = ToolExecutor()
+        executor._get_client()
+        await executor._client.aclose()
+        executor._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        try:
+            return await getattr(executor, method)(*args)
+        finally:
+            await executor.aclose()
+
+    return asyncio.run(main())
+
+
+def replies(*responses):
+    """Handler answering with `responses` in turn, recording the requests"""
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        response = responses[len(requests) - 1]
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    return handler, requests
+
+
+def test_busy_service_is_retried_with_backoff(delays):
+    handler, requests = replies(
+        httpx.Response(503), httpx.Response(502), httpx.Response(200, json={"caption": "a dog"})
+    )
+    assert call(handler, "caption", b"png") == {"caption": "a dog"}
+    assert len(requests) == 3 and delays == [0.5, 1.0]
+    assert requests[0].url == "http://localhost:8001/caption"
+
+
+def test_retry_after_is_honoured_up_to_a_limit(delays):
+    handler, _ = replies(
+        httpx.Response(503, headers={"Retry-After": "2"}),
+        httpx.Response(503, headers={"Retry-After": "120"}),
+        httpx.Response(200, json={"text": ""}),
+    )
+    call(handler, "ocr", b"png")
+    assert delays == [2.0, tool_executor.MAX_RETRY_AFTER]
+
+
+def test_connection_failures_are_retried(delays):
+    handler, requests = replies(httpx.ConnectError("refused"), httpx.Response(200, json={"caption": "a cat"}))
+    assert call(handler, "caption", b"png") == {"caption": "a cat"}
+    assert len(requests) == 2 and delays == [0.5]
+
+
+def test_gives_up_after_the_last_retry(delays):
+    handler, requests = replies(*[httpx.Response(503)] * 3)
+    assert call(handler, "caption", b"png") == {"error": "Captioning service error: 503"}
+    handler, _ = replies(*[httpx.ConnectError("refused")] * 3)
+    assert "refused" in call(handler, "ocr", b"png")["error"]
+    assert len(requests) == 3
+
+
+def test_client_errors_and_read_timeouts_are_not_retried(delays):
+    handler, requests = replies(httpx.Response(404))
+    assert call(handler, "recolor", b"png", "cup", "red") == {"error": "Object 'cup' not found in the image"}
+    handler, timed_out = replies(httpx.ReadTimeout("slow"))
+    assert "no answer within" in call(handler, "caption", b"png")["error"]
+    assert len(requests) == len(timed_out) == 1 and delays == []